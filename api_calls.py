@@ -0,0 +1,136 @@
+# api_calls.py
+# --------------------------------------------------------
+# اجرای همزمان فراخوانی‌های مستقل Bot API داخل هندلرها
+# - به‌جای await پشت سر هم (edit بعد send بعد answer) همه با هم فرستاده می‌شوند
+#   → تأخیر هندلر ≈ کندترین فراخوانی، نه مجموع همه
+# - خطای هر فراخوانی جدا لاگ می‌شود و بقیه را خراب نمی‌کند
+#   (MessageNotModified و ... که بی‌خطرند فقط در سطح debug)
+# - فقط برای فراخوانی‌هایی که به نتیجه/ترتیب هم وابسته نیستند
+# استفاده:
+#   edited, _ = await gather_calls(
+#       callback.message.edit_reply_markup(reply_markup=None),
+#       callback.answer(),
+#       label="reject_challenge",
+#   )
+#   # نتیجهٔ فراخوانی ناموفق خود exception است (None نمی‌شود)
+# --------------------------------------------------------
+
+import asyncio
+import logging
+
+from aiogram.utils.exceptions import MessageNotModified, MessageToDeleteNotFound, InvalidQueryID
+
+LOG_TAG = "ApiCalls"
+
+# خطاهایی که فقط یعنی «کاری لازم نبود»
+HARMLESS_ERRORS = (MessageNotModified, MessageToDeleteNotFound, InvalidQueryID)
+
+
+async def gather_calls(*calls, label="api"):
+    """همهٔ coroutineها را همزمان اجرا کن؛ لیست نتایج به همان ترتیب (exception برای ناموفق‌ها)"""
+    calls = [c for c in calls if c is not None]
+    if not calls:
+        return []
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for r in results:
+        if isinstance(r, HARMLESS_ERRORS):
+            logging.debug("%s: %s: %s", LOG_TAG, label, r)
+        elif isinstance(r, Exception):
+            logging.warning("%s: %s: فراخوانی ناموفق: %r", LOG_TAG, label, r)
+    return results
+
+
+def ok(result):
+    """نتیجهٔ gather_calls موفق بوده؟"""
+    return not isinstance(result, BaseException)
+
+
+# --------------------------------------------------------
+# Bot API محلی برای بنچمارک‌ها (aiohttp)
+# - هر متد با latency ثانیه تأخیر جواب می‌دهد
+# - getUpdates آپدیت‌های updates را یک بار برمی‌گرداند، بعد لیست خالی (long-poll کوتاه)
+# استفاده:
+#   runner, server = await start_stub_api(port=8765, updates=[{"update_id": 1, "message": {...}}], calls=log)
+#   bot = Bot(token, server=server)
+#   ...; await runner.cleanup()
+# --------------------------------------------------------
+STUB_PORT = 8765
+STUB_LATENCY = 0.15
+STUB_MESSAGE = {"message_id": 1, "date": 0, "chat": {"id": -100, "type": "supergroup"}, "text": "x"}
+STUB_USER = {"id": 123456789, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+
+
+async def start_stub_api(port=STUB_PORT, latency=STUB_LATENCY, updates=(), calls=None):
+    """خروجی: (runner, TelegramAPIServer)؛ calls (اختیاری): لیستی که (متد, پارامترها) هر درخواست به آن اضافه می‌شود"""
+    from aiohttp import web
+    from aiogram.bot.api import TelegramAPIServer
+
+    pending = list(updates)
+
+    async def handle(request):
+        await asyncio.sleep(latency)
+        method = request.match_info["method"].lower()
+        if calls is not None:
+            calls.append((method, dict(await request.post())))
+        if method == "getupdates":
+            result, pending[:] = list(pending), []
+            if not result:
+                await asyncio.sleep(0.5)
+        elif method == "getme":
+            result = STUB_USER
+        elif method == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in ("answercallbackquery", "deletemessage", "deletewebhook", "deletemessages"):
+            result = True
+        else:
+            result = STUB_MESSAGE
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+
+
+# --------------------------------------------------------
+# بنچمارک: Bot API محلی با ۱۵۰ms تأخیر + Bot واقعی aiogram
+#   python api_calls.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import time
+    from aiogram import Bot
+
+    async def main():
+        runner, server = await start_stub_api()
+        bot = Bot("123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA", server=server)
+
+        # مثل رد چالش: حذف دکمه‌ها + اعلام در گروه + جواب callback
+        async def serial():
+            await bot.edit_message_reply_markup(-100, 1, reply_markup=None)
+            await bot.send_message(-100, "🚫 رد شد")
+            await bot.answer_callback_query("1")
+
+        async def concurrent():
+            await gather_calls(
+                bot.edit_message_reply_markup(-100, 1, reply_markup=None),
+                bot.send_message(-100, "🚫 رد شد"),
+                bot.answer_callback_query("1"),
+                label="bench",
+            )
+
+        for label, fn in (("serial", serial), ("gather_calls", concurrent)):
+            await fn()   # گرم کردن اتصال
+            runs = []
+            for _ in range(10):
+                t = time.perf_counter()
+                await fn()
+                runs.append(time.perf_counter() - t)
+            runs.sort()
+            print(f"{label:13s} median={runs[5] * 1000:6.1f}ms max={runs[-1] * 1000:6.1f}ms")
+
+        await (await bot.get_session()).close()
+        await runner.cleanup()
+
+    asyncio.run(main())
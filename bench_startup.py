@@ -0,0 +1,143 @@
+# bench_startup.py
+# --------------------------------------------------------
+# بنچمارک راه‌اندازی: زمان از شروع پروسه تا پردازش اولین آپدیت
+# - Bot API محلی از api_calls.start_stub_api (هر فراخوانی ۱۵۰ms تأخیر)
+# - هر اجرا یک پروسهٔ تازه است تا زمان ایمپورت هم حساب شود؛ پوشهٔ کاری موقت
+#   (فقط کپی scenarios.json) تا فایل‌های ربات دست نخورند
+# - before: مسیر قبلی شبیه‌سازی می‌شود — ایمپورت commands/jdatetime و خواندن
+#   سناریوها/تنظیمات هنگام ایمپورت، awaitهای پشت سر هم در on_startup،
+#   executor با skip_updates=True و reset_webhook پیش‌فرض
+# - after: on_startup فعلی (gather + خواندن فایل در thread) و executor با reset_webhook=False
+# - هر حالت دو بار اندازه گرفته می‌شود: Bot API با ۱۵۰ms و با ۰ تأخیر؛ اختلاف تقسیم بر ۱۵۰ms
+#   = تعداد رفت‌وبرگشت‌های پشت سر همی که هنوز در مسیر راه‌اندازی مانده
+# - نتیجه با هدف TARGET_MS (زیر ۳۰۰ms تا اولین آپدیت) مقایسه و صریحاً گزارش می‌شود؛
+#   با ۰ تأخیر یعنی سهم خود پروسه (ایمپورت + راه‌اندازی)، با ۱۵۰ms یعنی شبکهٔ واقعی
+# - after هنوز ۳ رفت‌وبرگشت پشت سر هم دارد: getMe (_welcome در Executor، قبل از on_startup)،
+#   deleteWebhook (داخل gather در on_startup) و getUpdates که خود آپدیت را می‌آورد؛ هیچ‌کدام
+#   بدون کنار گذاشتن Executor حذف نمی‌شوند، پس زیر ۳۰۰ms فقط وقتی است که تأخیر Bot API از
+#   (۳۰۰ - زمان با ۰ تأخیر) / ۳ کمتر باشد — خروجی همین بودجه را هم چاپ می‌کند
+# استفاده:
+#   python bench_startup.py            # ۵ اجرا برای هر حالت، میانه
+#   python bench_startup.py 10
+# --------------------------------------------------------
+
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+import statistics
+
+from api_calls import start_stub_api, STUB_PORT, STUB_LATENCY
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOKEN = "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+TARGET_MS = 300
+UPDATE = {
+    "update_id": 1,
+    "message": {"message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"},
+                "from": {"id": 42, "is_bot": False, "first_name": "x"}, "text": "/start"},
+}
+
+# کد پروسهٔ فرزند؛ زمان از اولین خط (قبل از import main) تا اولین آپدیت
+CHILD = r"""
+import time
+started = time.perf_counter()
+import sys, asyncio
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.executor import Executor
+
+MODE, PORT = sys.argv[1], int(sys.argv[2])
+if MODE == "before":
+    import commands, jdatetime   # ایمپورت‌های قبلی سطح ماژول
+import main
+main.bot.server = TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")
+if MODE == "before":
+    main.scenarios.load()        # قبلاً هنگام ساخت ScenarioRegistry/MafiaAddons
+    main.addons.load()
+
+async def old_startup(dp):
+    await main.bot.delete_webhook(drop_pending_updates=True)
+    await main.deleter.start()
+    await main.night_engine.start()
+    await main.resume_game()
+
+first = asyncio.Event()
+
+class FirstUpdate(BaseMiddleware):
+    async def on_pre_process_update(self, update, data):
+        first.set()
+
+async def run():
+    main.dp.middleware.setup(FirstUpdate())
+    # همان ترتیب executor.start_polling (getMe → skip_updates → on_startup → polling)
+    if MODE == "before":
+        ex = Executor(main.dp, skip_updates=True)
+        ex.on_startup(old_startup, webhook=False)
+        reset_webhook = None
+    else:
+        ex = Executor(main.dp)
+        ex.on_startup(main.on_startup, webhook=False)
+        reset_webhook = False
+    await ex._startup_polling()
+    polling = asyncio.create_task(main.dp.start_polling(reset_webhook=reset_webhook, timeout=1))
+    await first.wait()
+    print(f"{(time.perf_counter() - started) * 1000:.1f}")
+    main.dp.stop_polling()
+    polling.cancel()
+    await main.deleter.stop()
+    await main.night_engine.stop()
+    await (await main.bot.get_session()).close()
+
+asyncio.run(run())
+"""
+
+
+async def measure(mode, workdir, latency, port=STUB_PORT):
+    runner, _ = await start_stub_api(port=port, latency=latency, updates=[UPDATE])
+    try:
+        env = dict(os.environ, API_TOKEN=TOKEN, PYTHONPATH=HERE)
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", CHILD, mode, str(port),
+            cwd=workdir, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await asyncio.wait_for(proc.communicate(), 60)
+        lines = out.decode().split()
+        return float(lines[-1]) if lines else None
+    finally:
+        await runner.cleanup()
+
+
+async def main(runs):
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        shutil.copy(os.path.join(HERE, "scenarios.json"), workdir)
+        latencies = (STUB_LATENCY, 0)
+        results = {(mode, lat): [] for mode in ("before", "after") for lat in latencies}
+        for _ in range(runs):
+            for mode, lat in results:     # یک در میان تا گرم شدن cache سیستم‌عامل به یک حالت نچسبد
+                ms = await measure(mode, workdir, lat)
+                if ms is not None:
+                    results[(mode, lat)].append(ms)
+        medians = {}
+        for (mode, lat), values in results.items():
+            if values:
+                medians[(mode, lat)] = med = statistics.median(values)
+                verdict = "OK" if med < TARGET_MS else f"MISSED by {med - TARGET_MS:.0f}ms"
+                print(f"{mode:6s} api={lat * 1000:3.0f}ms first update after median={med:7.1f}ms "
+                      f"min={min(values):7.1f}ms ({len(values)} runs)  target <{TARGET_MS}ms: {verdict}")
+            else:
+                print(f"{mode:6s} api={lat * 1000:3.0f}ms failed")
+        for mode in ("before", "after"):
+            if (mode, STUB_LATENCY) in medians and (mode, 0) in medians:
+                trips = (medians[(mode, STUB_LATENCY)] - medians[(mode, 0)]) / (STUB_LATENCY * 1000)
+                budget = (TARGET_MS - medians[(mode, 0)]) / max(round(trips), 1)
+                print(f"{mode:6s} serial Bot API round trips before first update: ~{trips:.1f}; "
+                      f"<{TARGET_MS}ms needs Bot API latency under {max(budget, 0):.0f}ms per call")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
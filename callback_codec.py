@@ -0,0 +1,152 @@
+# callback_codec.py
+# --------------------------------------------------------
+# رمزگذاری فشرده و نسخه‌دار callback_data
+# به جای رشته‌هایی مثل accept_before_{uid}_{uid} که به سقف ۶۴ بایت تلگرام نزدیکند،
+# داده به صورت باینری (struct) بسته‌بندی و base64url می‌شود:
+#
+#   "~" + b64( ver | action | game_id | nonce | args... )
+#
+# - action: کد عددی (Action)
+# - game_id: آیدی گروه بازی
+# - nonce: عدد ۱۶ بیتی که با هر بازی جدید عوض می‌شود → دکمه‌های بازی قبلی رد می‌شوند
+# - args: شماره صندلی‌ها (B) یا در صورت نیاز آیدی (q)
+# --------------------------------------------------------
+
+import struct
+import base64
+import logging
+from enum import IntEnum
+
+LOG_TAG = "CallbackCodec"
+
+PREFIX = "~"
+CODEC_VERSION = 1
+MAX_CALLBACK_DATA = 64
+
+_HEADER = struct.Struct(">BBqH")   # ver, action, game_id, nonce
+
+
+class Action(IntEnum):
+    ACCEPT_BEFORE = 1
+    ACCEPT_AFTER = 2
+    REJECT = 3
+    CHOOSE_SUB = 4
+    DO_REPLACE = 5
+    VOTE = 6
+    VOTE_CLOSE = 7
+    NIGHT_TARGET = 8
+
+
+class StaleCallback(ValueError):
+    """دکمه متعلق به بازی/نسخهٔ دیگری است"""
+
+
+class CallbackCodec:
+    """
+    رجیستری action → (فرمت آرگومان‌ها, هندلر) برای dispatch با یک lookup.
+
+    استفاده:
+      codec = CallbackCodec()
+
+      @codec.route(Action.REJECT, "BB")
+      async def reject(callback, challenger_seat, target_seat): ...
+
+      data = codec.encode(Action.REJECT, group_chat_id, nonce, 3, 7)
+      await codec.dispatch(callback, group_chat_id, nonce)
+    """
+
+    def __init__(self):
+        self._routes = {}   # action code -> (struct.Struct, handler)
+
+    def route(self, action, fmt=""):
+        def decorator(handler):
+            self._routes[int(action)] = (struct.Struct(">" + fmt), handler)
+            return handler
+        return decorator
+
+    # -------------------------
+    # encode / decode
+    # -------------------------
+    def encode(self, action, game_id, nonce, *args):
+        args_struct, _ = self._routes[int(action)]
+        raw = _HEADER.pack(CODEC_VERSION, int(action), game_id, nonce & 0xFFFF) + args_struct.pack(*args)
+        data = PREFIX + base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+        if len(data) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data too long ({len(data)} bytes)")
+        return data
+
+    def decode(self, data):
+        """برمی‌گرداند: (action, game_id, nonce, args)"""
+        if not data or not data.startswith(PREFIX):
+            raise ValueError("not a packed callback")
+        body = data[len(PREFIX):]
+        try:
+            raw = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+            ver, action, game_id, nonce = _HEADER.unpack_from(raw)
+        except (ValueError, struct.error) as e:
+            raise ValueError(f"malformed callback: {e}")
+        if ver != CODEC_VERSION:
+            raise StaleCallback(f"codec version {ver}")
+        route = self._routes.get(action)
+        if route is None:
+            raise ValueError(f"unknown action {action}")
+        args_struct, _ = route
+        try:
+            args = args_struct.unpack_from(raw, _HEADER.size)
+        except struct.error as e:
+            raise ValueError(f"malformed args: {e}")
+        return Action(action), game_id, nonce, args
+
+    # -------------------------
+    # dispatch
+    # -------------------------
+    async def dispatch(self, callback, game_id, nonce):
+        """
+        decode + بررسی بازی/nonce + اجرای هندلر.
+        دکمه‌های نامعتبر یا قدیمی بلافاصله جواب داده می‌شوند و اجرا نمی‌شوند.
+        """
+        try:
+            action, data_game_id, data_nonce, args = self.decode(callback.data)
+            if data_game_id != game_id or data_nonce != (nonce & 0xFFFF):
+                raise StaleCallback("game/nonce mismatch")
+        except StaleCallback:
+            await callback.answer("⌛ این دکمه مربوط به بازی قبلی است.", show_alert=True)
+            return
+        except ValueError as e:
+            logging.warning("%s: داده نامعتبر %r: %s", LOG_TAG, callback.data, e)
+            await callback.answer("⚠️ داده دکمه نامعتبر است.", show_alert=True)
+            return
+
+        _, handler = self._routes[action]
+        return await handler(callback, *args)
+
+
+# --------------------------------------------------------
+# بنچمارک سادهٔ هزینهٔ encode/decode:  python callback_codec.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import timeit
+
+    codec = CallbackCodec()
+
+    @codec.route(Action.ACCEPT_BEFORE, "BB")
+    async def _noop(callback, a, b):
+        pass
+
+    gid = -1001760002160
+    packed = codec.encode(Action.ACCEPT_BEFORE, gid, 0xBEEF, 3, 11)
+    legacy = f"accept_before_{6123456789}_{7123456789}"
+
+    def legacy_parse():
+        parts = legacy.split("_")
+        return parts[0], parts[1], int(parts[2]), int(parts[3])
+
+    n = 200_000
+    for name, fn in (
+        ("encode", lambda: codec.encode(Action.ACCEPT_BEFORE, gid, 0xBEEF, 3, 11)),
+        ("decode", lambda: codec.decode(packed)),
+        ("legacy split/int", legacy_parse),
+    ):
+        t = timeit.timeit(fn, number=n)
+        print(f"{name:18s} {t / n * 1e6:6.2f} µs/op")
+    print(f"packed: {packed!r} ({len(packed)} bytes), legacy: {len(legacy)} bytes")
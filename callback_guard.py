@@ -0,0 +1,139 @@
+# callback_guard.py
+# --------------------------------------------------------
+# جلوگیری از اجرای دوباره کال‌بک‌ها (دابل‌کلیک روی دکمه‌ها)
+# + قفل جداگانه برای هر بازی تا آپدیت‌های همزمان پشت سر هم اجرا شوند
+# --------------------------------------------------------
+
+import time
+import asyncio
+import logging
+import functools
+from collections import OrderedDict
+
+LOG_TAG = "CallbackGuard"
+
+DEFAULT_TTL = 10          # ثانیه — عمر هر کلید در کش
+DEFAULT_MAX_SIZE = 2048   # حداکثر تعداد کلیدهای نگه‌داری شده
+
+# هندلری که درخواست را رد کرد یا زود برگشت این را برمی‌گرداند:
+# نه کلید در کش می‌رود و نه نسخهٔ state بالا می‌رود (کلیک دوباره اجرا می‌شود)
+UNCHANGED = object()
+
+
+class CallbackGuard:
+    """
+    لایهٔ idempotency برای کال‌بک‌ها.
+    کلید هر کلیک: (chat, message_id, callback data, state version) + کاربر کلیک‌کننده
+
+    - نسخهٔ state لحظهٔ رسیدن کلیک (قبل از گرفتن قفل) خوانده می‌شود. اگر هندلر
+      state را عوض کرد، کلید با همان نسخه در کش می‌رود و نسخه یک واحد بالا می‌رود؛
+      کلیک تکراری که همزمان با همان نسخه رسیده بدون اجرا جواب داده می‌شود،
+      ولی کلیک بعدی روی همان دکمه (با نسخهٔ جدید) دوباره اجرا می‌شود.
+    - هندلری که UNCHANGED برگرداند یا خطا داد نه کلیدش ذخیره می‌شود نه نسخه بالا می‌رود.
+    - کلیک دوم بعد از تمام شدن اولی دوباره اجرا می‌شود؛ هندلرهای غیر idempotent
+      (پخش نقش، شروع بازی) باید خودشان فاز بازی را چک کنند و UNCHANGED برگردانند.
+    - کش محدود است (OrderedDict + TTL) و قدیمی‌ترین‌ها دور ریخته می‌شوند.
+    - هر بازی یک asyncio.Lock دارد تا هندلرهای تغییر دهندهٔ state سریالی شوند.
+
+    استفاده:
+      guard = CallbackGuard()
+
+      @dp.callback_query_handler(lambda c: c.data == "next")
+      @guard.once(lambda c: group_chat_id)
+      async def handler(callback):
+          if not allowed:
+              return UNCHANGED
+          ...
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()   # key -> expire_at
+        self._versions = {}          # game_id -> int
+        self._locks = {}             # game_id -> asyncio.Lock
+        self.dropped = 0
+
+    # -------------------------
+    # نسخهٔ state هر بازی
+    # -------------------------
+    def version(self, game_id):
+        return self._versions.get(game_id, 0)
+
+    def bump(self, game_id):
+        self._versions[game_id] = self._versions.get(game_id, 0) + 1
+        return self._versions[game_id]
+
+    def lock(self, game_id):
+        lock = self._locks.get(game_id)
+        if lock is None:
+            lock = self._locks[game_id] = asyncio.Lock()
+        return lock
+
+    def forget(self, game_id):
+        """پاک کردن قفل و نسخهٔ یک بازی (وقتی بازی تمام/لغو شد)"""
+        self._versions.pop(game_id, None)
+        lock = self._locks.get(game_id)
+        if lock is not None and not lock.locked():
+            self._locks.pop(game_id, None)
+
+    # -------------------------
+    # کش کلیدها
+    # -------------------------
+    def _purge(self, now):
+        seen = self._seen
+        while seen:
+            key, expire_at = next(iter(seen.items()))
+            if expire_at > now and len(seen) <= self.max_size:
+                break
+            seen.popitem(last=False)
+
+    def is_duplicate(self, key):
+        now = time.monotonic()
+        self._purge(now)
+        expire_at = self._seen.get(key)
+        return expire_at is not None and expire_at > now
+
+    def remember(self, key):
+        now = time.monotonic()
+        self._seen[key] = now + self.ttl
+        self._seen.move_to_end(key)
+        self._purge(now)
+
+    @staticmethod
+    def _key(callback, game_id, version):
+        msg = callback.message
+        chat_id = msg.chat.id if msg else None
+        message_id = msg.message_id if msg else callback.inline_message_id
+        return (chat_id, message_id, callback.data, callback.from_user.id, game_id, version)
+
+    # -------------------------
+    # دکوریتور هندلرها
+    # -------------------------
+    def once(self, game_key):
+        """
+        game_key: تابعی که از روی callback شناسهٔ بازی را برمی‌گرداند
+        (در main.py همان group_chat_id است؛ دکمه‌های پیوی هم به همان بازی تعلق دارند).
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(callback, *args, **kwargs):
+                game_id = game_key(callback)
+                key = self._key(callback, game_id, self.version(game_id))
+                async with self.lock(game_id):
+                    if self.is_duplicate(key):
+                        self.dropped += 1
+                        logging.debug("%s: کلیک تکراری نادیده گرفته شد: %s", LOG_TAG, callback.data)
+                        try:
+                            await callback.answer()
+                        except Exception:
+                            pass
+                        return
+                    result = await handler(callback, *args, **kwargs)
+                    if result is UNCHANGED:
+                        return None
+                    self.remember(key)
+                    self.bump(game_id)
+                    return result
+            return wrapper
+        return decorator
@@ -0,0 +1,217 @@
+# challenge_scheduler.py
+# --------------------------------------------------------
+# صف چالش‌های یک بازی
+# - هر درخواست چالش (صندلی چالش‌دهنده → صندلی هدف) یک رکورد با وضعیت است:
+#     pending → accepted (قبل/بعد) → اجرا شد        یا        pending → rejected
+#   قبول/رد فقط همان یک رکورد را عوض می‌کند (بقیهٔ درخواست‌های همان هدف می‌مانند)
+# - چالش‌های قبول‌شدهٔ هر هدف در یک heap با کلید (قبل=0/بعد=1، ترتیب ثبت):
+#   اول همهٔ «قبل»ها به ترتیب قبول، بعد «بعد»ها — pop در O(log n)
+# - هر هدف چند چالش «بعد» می‌تواند داشته باشد (قبلاً آخری قبلی را پاک می‌کرد)
+# استفاده:
+#   challenges = ChallengeScheduler()
+#   challenges.request(target_seat, challenger_seat)          # None اگر تکراری
+#   challenges.accept(target_seat, challenger_seat, AFTER)    # None اگر دیگر pending نیست
+#   challenges.pop(target_seat)                               # (timing, challenger_seat) یا None
+# --------------------------------------------------------
+
+import heapq
+import itertools
+from collections import Counter
+from enum import Enum
+
+BEFORE = "before"
+AFTER = "after"
+_PRIORITY = {BEFORE: 0, AFTER: 1}
+
+
+class ChallengeState(str, Enum):
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    REJECTED = "rejected"
+
+
+class Challenge:
+    __slots__ = ("target", "challenger", "seq", "state", "timing")
+
+    def __init__(self, target, challenger, seq, state=ChallengeState.PENDING, timing=None):
+        self.target = target
+        self.challenger = challenger
+        self.seq = seq
+        self.state = state
+        self.timing = timing
+
+    def __repr__(self):
+        return f"Challenge({self.challenger}→{self.target}, {self.state.value}, {self.timing})"
+
+
+class ChallengeScheduler:
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._open = {}                 # (target, challenger) → Challenge (pending یا accepted و هنوز اجرا نشده)
+        self._queues = {}               # target → heap[(priority, seq, challenger)]
+        self._pending_from = Counter()  # challenger → تعداد درخواست‌های pending
+        self._seq = itertools.count()
+
+    # -------------------------
+    # درخواست / قبول / رد
+    # -------------------------
+    def request(self, target, challenger):
+        """درخواست جدید؛ None اگر همین چالش‌دهنده برای همین هدف درخواست باز دارد"""
+        key = (target, challenger)
+        if key in self._open:
+            return None
+        ch = self._open[key] = Challenge(target, challenger, next(self._seq))
+        self._pending_from[challenger] += 1
+        return ch
+
+    def accept(self, target, challenger, timing):
+        """pending → accepted؛ None اگر درخواست pending وجود ندارد (دکمهٔ قدیمی)"""
+        ch = self._open.get((target, challenger))
+        if ch is None or ch.state is not ChallengeState.PENDING:
+            return None
+        self._unpend(challenger)
+        ch.state, ch.timing = ChallengeState.ACCEPTED, timing
+        heapq.heappush(self._queues.setdefault(target, []), (_PRIORITY[timing], ch.seq, challenger))
+        return ch
+
+    def reject(self, target, challenger):
+        ch = self._open.get((target, challenger))
+        if ch is None or ch.state is not ChallengeState.PENDING:
+            return None
+        del self._open[(target, challenger)]
+        self._unpend(challenger)
+        ch.state = ChallengeState.REJECTED
+        return ch
+
+    def push(self, target, challenger, timing):
+        """چالش قبول‌شده بدون درخواست قبلی (مثلاً از منوی قدیمی)"""
+        key = (target, challenger)
+        ch = self._open.get(key)
+        if ch is not None and ch.state is ChallengeState.PENDING:
+            return self.accept(target, challenger, timing)
+        seq = next(self._seq)
+        if ch is None:
+            self._open[key] = Challenge(target, challenger, seq, ChallengeState.ACCEPTED, timing)
+        heapq.heappush(self._queues.setdefault(target, []), (_PRIORITY[timing], seq, challenger))
+        return self._open[key]
+
+    # -------------------------
+    # اجرا
+    # -------------------------
+    def pop(self, target, timing=None, skip=()):
+        """چالش بعدی هدف: (timing, challenger) یا None
+        timing: فقط اگر اولین چالش صف از این نوع باشد؛ skip: چالش‌دهنده‌هایی که رد می‌شوند (حذف شده)"""
+        entry = self._top(target, timing, skip)
+        if entry is None:
+            return None
+        heap = self._queues[target]
+        heapq.heappop(heap)
+        if not heap:
+            del self._queues[target]
+        self._open.pop((target, entry[2]), None)
+        return (BEFORE if entry[0] == 0 else AFTER), entry[2]
+
+    def peek(self, target, timing=None, skip=()):
+        """مثل pop بدون برداشتن چالش بعدی (چالش‌های skip شده مثل pop از صف دور ریخته می‌شوند)"""
+        entry = self._top(target, timing, skip)
+        if entry is None:
+            return None
+        return (BEFORE if entry[0] == 0 else AFTER), entry[2]
+
+    def drop(self, seat):
+        """همهٔ چالش‌هایی که seat هدف یا چالش‌دهنده‌شان است حذف شوند"""
+        for _, _, challenger in self._queues.pop(seat, ()):
+            self._open.pop((seat, challenger), None)
+        touched = set()
+        for key in [k for k in self._open if seat in k]:
+            ch = self._open.pop(key)
+            if ch.state is ChallengeState.PENDING:
+                self._unpend(ch.challenger)
+            else:
+                touched.add(ch.target)
+        # چالش‌های قبول‌شدهٔ seat در صف هدف‌های دیگر
+        for target in touched:
+            heap = [e for e in self._queues.get(target, ()) if e[2] != seat]
+            if heap:
+                heapq.heapify(heap)
+                self._queues[target] = heap
+            else:
+                self._queues.pop(target, None)
+
+    # -------------------------
+    # پرس‌وجو
+    # -------------------------
+    def has_pending_from(self, challenger):
+        return self._pending_from[challenger] > 0
+
+    def queued(self, target):
+        """چالش‌های قبول‌شدهٔ هدف به ترتیب اجرا"""
+        return [((BEFORE if p == 0 else AFTER), c) for p, _, c in sorted(self._queues.get(target, ()))]
+
+    def __len__(self):
+        return len(self._open)
+
+    def to_dict(self):
+        return {
+            "open": [[ch.target, ch.challenger, ch.seq, ch.state.value, ch.timing] for ch in self._open.values()],
+            "queues": {str(t): sorted(heap) for t, heap in self._queues.items()},
+        }
+
+    def load(self, data):
+        self.clear()
+        if not data:
+            return
+        last = -1
+        for target, challenger, seq, state, timing in data.get("open") or []:
+            ch = Challenge(target, challenger, seq, ChallengeState(state), timing)
+            self._open[(target, challenger)] = ch
+            if ch.state is ChallengeState.PENDING:
+                self._pending_from[challenger] += 1
+            last = max(last, seq)
+        for target, heap in (data.get("queues") or {}).items():
+            self._queues[int(target)] = [tuple(e) for e in heap]   # لیست مرتب خودش heap است
+            last = max([last] + [e[1] for e in heap])
+        self._seq = itertools.count(last + 1)
+
+    def _top(self, target, timing, skip):
+        """سر صف هدف بعد از دور ریختن (lazy) چالش‌دهنده‌های skip؛ None اگر خالی یا از نوع timing نیست"""
+        heap = self._queues.get(target)
+        while heap and heap[0][2] in skip:
+            self._open.pop((target, heapq.heappop(heap)[2]), None)
+        if not heap:
+            self._queues.pop(target, None)
+            return None
+        if timing is not None and heap[0][0] != _PRIORITY[timing]:
+            return None
+        return heap[0]
+
+    def _unpend(self, challenger):
+        self._pending_from[challenger] -= 1
+        if self._pending_from[challenger] <= 0:
+            del self._pending_from[challenger]
+
+
+# --------------------------------------------------------
+# بنچمارک (تست‌ها: test_challenge_scheduler.py)
+#   python challenge_scheduler.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import time
+
+    # قبول/رد و pop با n درخواست باز برای یک هدف
+    for n in (10, 1000, 100000):
+        s = ChallengeScheduler()
+        for c in range(n):
+            s.request(1, c)
+        t = time.perf_counter()
+        for c in range(0, n, 2):
+            s.accept(1, c, AFTER if c % 4 else BEFORE)
+        for c in range(1, n, 2):
+            s.reject(1, c)
+        while s.pop(1):
+            pass
+        dt = time.perf_counter() - t
+        print(f"n={n:6d}: {dt / n * 1e6:.2f}us/challenge")
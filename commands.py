@@ -1,5 +1,6 @@
 from aiogram import types
 from loader import dp, bot
+from text_commands import normalize
 
 # دستورات فارسی و انگلیسی
 COMMANDS = {
@@ -37,13 +38,10 @@ async def run_command(name, message: types.Message):
 # هندلر متنی
 @dp.message_handler(lambda m: m.text)
 async def handle_text_commands(message: types.Message):
-    text = message.text.strip().lower()
+    text = normalize(message.text)
 
     if text.startswith("/"):
         text = text[1:]
 
-    text = text.replace("‌", " ")
-    text = " ".join(text.split())
-
     if text in COMMANDS:
         await run_command(COMMANDS[text], message)
@@ -0,0 +1,171 @@
+# delete_scheduler.py
+# --------------------------------------------------------
+# سرویس مرکزی حذف زمان‌بندی شدهٔ پیام‌ها
+# به جای اینکه هر پیام موقت یک coroutine را با asyncio.sleep نگه دارد،
+# (زمان حذف, چت, آیدی پیام) در یک min-heap قرار می‌گیرد و فقط یک تسک
+# پیام‌های سررسید شده را (گروه‌بندی شده با deleteMessages) پاک می‌کند.
+# لیست در انتظار روی دیسک ذخیره می‌شود تا بعد از ری‌استارت هم پاک شوند.
+# --------------------------------------------------------
+
+import json
+import time
+import heapq
+import asyncio
+import logging
+
+import storage
+
+LOG_TAG = "DeleteScheduler"
+
+PENDING_FILE = "pending_deletions.json"
+BULK_LIMIT = 100      # سقف deleteMessages در هر درخواست
+MAX_IDLE = 60         # ثانیه — حداکثر خواب تسک وقتی چیزی در صف نیست
+BATCH_WINDOW = 0.5    # ثانیه — پیام‌هایی که تا این مقدار بعد سررسید می‌شوند هم در همان درخواست حذف می‌شوند
+
+
+class DeletionScheduler:
+    """
+    استفاده:
+      deleter = DeletionScheduler(bot)
+      await deleter.start()                          # در on_startup
+      await deleter.send_temp(chat_id, "متن", delay=5)
+      deleter.schedule(chat_id, message_id, delay=5)
+      await deleter.stop()                           # در on_shutdown
+    """
+
+    def __init__(self, bot, path=PENDING_FILE):
+        self.bot = bot
+        self.path = path
+        self._heap = []          # (due_at, chat_id, message_id) — زمان دیواری تا بعد از ری‌استارت معتبر بماند
+        self._wake = None
+        self._task = None
+        self._running = False
+        self.deleted = 0
+        self.failed = 0
+
+    # -------------------------
+    # زمان‌بندی
+    # -------------------------
+    def schedule(self, chat_id, message_id, delay=5):
+        item = (time.time() + delay, chat_id, message_id)
+        heapq.heappush(self._heap, item)
+        self._save()
+        # اگر این آیتم زودتر از سر صف فعلی است، تسک را بیدار کن
+        if self._wake is not None and self._heap[0] is item:
+            self._wake.set()
+
+    async def send_temp(self, chat_id, text, delay=5, **kwargs):
+        """ارسال پیام موقت و سپردن حذفش به زمان‌بند (بدون منتظر ماندن)"""
+        msg = await self.bot.send_message(chat_id, text, **kwargs)
+        self.schedule(chat_id, msg.message_id, delay)
+        return msg
+
+    def __len__(self):
+        return len(self._heap)
+
+    # -------------------------
+    # شروع / توقف
+    # -------------------------
+    async def start(self):
+        self._load()
+        self._wake = asyncio.Event()
+        self._running = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=5):
+        """توقف تسک؛ حذف‌های سررسید نشده روی دیسک می‌مانند"""
+        # با پرچم و بیدار کردن متوقف می‌شود، نه cancel (wait_for در 3.11 ممکن است cancel را قورت دهد)
+        self._running = False
+        if self._task is not None:
+            self._wake.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._task = None
+        self._save()
+
+    # -------------------------
+    # حلقهٔ اصلی
+    # -------------------------
+    async def _run(self):
+        while self._running:
+            self._wake.clear()
+            timeout = MAX_IDLE
+            if self._heap:
+                timeout = max(0.0, self._heap[0][0] - time.time())
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._running:
+                break
+
+            due = self._pop_due(time.time() + BATCH_WINDOW)
+            if not due:
+                continue
+            try:
+                await self._delete_bulk(due)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception("%s: خطا در حذف گروهی: %s", LOG_TAG, e)
+            self._save()
+
+    def _pop_due(self, now):
+        heap = self._heap
+        due = {}
+        while heap and heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(heap)
+            due.setdefault(chat_id, []).append(message_id)
+        return due
+
+    async def _delete_bulk(self, due):
+        for chat_id, ids in due.items():
+            for i in range(0, len(ids), BULK_LIMIT):
+                batch = ids[i:i + BULK_LIMIT]
+                try:
+                    await self.bot.request("deleteMessages", {
+                        "chat_id": chat_id,
+                        "message_ids": json.dumps(batch),
+                    })
+                    self.deleted += len(batch)
+                except Exception:
+                    # سرور قدیمی یا پیام‌های غیرقابل حذف → تک‌تک
+                    for message_id in batch:
+                        try:
+                            await self.bot.delete_message(chat_id, message_id)
+                            self.deleted += 1
+                        except Exception:
+                            self.failed += 1
+
+    # -------------------------
+    # ذخیره / بارگذاری
+    # -------------------------
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logging.warning("%s: فایل %s خوانده نشد: %s", LOG_TAG, self.path, e)
+            return
+        for due_at, chat_id, message_id in items:
+            heapq.heappush(self._heap, (float(due_at), int(chat_id), int(message_id)))
+        if self._heap:
+            logging.info("%s: %d حذف معلق از اجرای قبلی بارگذاری شد.", LOG_TAG, len(self._heap))
+
+    def _save(self):
+        # نوشتن در thread نویسندهٔ storage؛ schedule‌های پشت سر هم یکی می‌شوند
+        try:
+            if self._heap:
+                storage.save_json(self.path, self._heap, indent=None)
+            else:
+                # بدون os.path.exists: ممکن است نوشتنِ قبلی هنوز در صف storage باشد؛
+                # حذف در همان صف و بعد از آن اجرا می‌شود و فایل نبودن را هم تحمل می‌کند
+                storage.remove(self.path)
+        except Exception as e:
+            logging.warning("%s: ذخیرهٔ %s ناموفق: %s", LOG_TAG, self.path, e)
@@ -0,0 +1,113 @@
+# delivery_ledger.py
+# --------------------------------------------------------
+# دفتر تحویل پیام‌های پیوی + کش منفی کاربران غیرقابل دسترس
+# - DeliveryLedger (برای هر بازی): وضعیت آخرین ارسال به هر بازیکن
+#   (delivered / forbidden / failed) با زمان و متن خطا
+# - UnreachableCache (برای کل پروسه): کاربرانی که ربات را بلاک کرده‌اند یا هیچ‌وقت
+#   استارت نکرده‌اند؛ تا TTL دیگر برایشان درخواست API فرستاده نمی‌شود
+# استفاده:
+#   unreachable = UnreachableCache()
+#   deliveries = DeliveryLedger(unreachable)
+#   ok = await deliveries.send(bot, uid, "🎭 نقش شما: ...")
+#   deliveries.undelivered(uids)     # فقط برای این‌ها دوباره بفرست
+#   unreachable.forget(uid)          # کاربر ربات را استارت کرد
+# --------------------------------------------------------
+
+import time
+import logging
+from enum import Enum
+
+from aiogram.utils.exceptions import Unauthorized, ChatNotFound, CantTalkWithBots
+
+LOG_TAG = "DeliveryLedger"
+
+UNREACHABLE_TTL = 6 * 3600   # ثانیه
+
+# خطاهایی که یعنی «تا کاربر خودش کاری نکند، ارسال بی‌فایده است»
+FORBIDDEN_ERRORS = (Unauthorized, ChatNotFound, CantTalkWithBots)
+
+
+class DeliveryStatus(str, Enum):
+    DELIVERED = "delivered"
+    FORBIDDEN = "forbidden"   # بلاک/استارت نکرده/اکانت حذف شده
+    FAILED = "failed"         # خطای گذرا (شبکه، flood، ...)
+
+
+class UnreachableCache:
+    """uid → زمان انقضا"""
+
+    def __init__(self, ttl=UNREACHABLE_TTL):
+        self.ttl = ttl
+        self._until = {}
+
+    def mark(self, uid):
+        self._until[uid] = time.monotonic() + self.ttl
+
+    def forget(self, uid):
+        self._until.pop(uid, None)
+
+    def __contains__(self, uid):
+        until = self._until.get(uid)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._until[uid]
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._until)
+
+
+class DeliveryLedger:
+    """uid → (status, timestamp, error) برای بازی جاری"""
+
+    def __init__(self, unreachable=None):
+        self.unreachable = unreachable if unreachable is not None else UnreachableCache()
+        self._entries = {}
+
+    def record(self, uid, status, error=None):
+        self._entries[uid] = (DeliveryStatus(status), time.time(), error)
+
+    def status(self, uid):
+        entry = self._entries.get(uid)
+        return entry[0] if entry else None
+
+    def undelivered(self, uids):
+        """بازیکنانی که هنوز پیامشان نرسیده (به همان ترتیب ورودی)"""
+        return [uid for uid in uids if self.status(uid) is not DeliveryStatus.DELIVERED]
+
+    def summary(self):
+        counts = {s.value: 0 for s in DeliveryStatus}
+        for status, _, _ in self._entries.values():
+            counts[status.value] += 1
+        return counts
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -------------------------
+    # ارسال
+    # -------------------------
+    async def send(self, bot, uid, text, **kwargs):
+        """ارسال پیوی و ثبت نتیجه؛ True اگر رسید"""
+        if uid in self.unreachable:
+            self.record(uid, DeliveryStatus.FORBIDDEN, "negative cache")
+            return False
+        try:
+            await bot.send_message(uid, text, **kwargs)
+        except FORBIDDEN_ERRORS as e:
+            self.unreachable.mark(uid)
+            self.record(uid, DeliveryStatus.FORBIDDEN, str(e))
+            logging.info("%s: %s در دسترس نیست: %s", LOG_TAG, uid, e)
+            return False
+        except Exception as e:
+            self.record(uid, DeliveryStatus.FAILED, str(e))
+            logging.warning("%s: ارسال به %s شکست خورد: %s", LOG_TAG, uid, e)
+            return False
+        self.unreachable.forget(uid)
+        self.record(uid, DeliveryStatus.DELIVERED)
+        return True
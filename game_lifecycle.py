@@ -0,0 +1,67 @@
+# game_lifecycle.py
+# --------------------------------------------------------
+# چرخهٔ عمر بازی: idle → lobby → running → ended → (reap) → idle
+# - هر انتقال ثبت می‌شود؛ انتقال نامعتبر فقط هشدار لاگ می‌کند
+# - تسک‌های بازی در task_supervisor نگه‌داری و لغو می‌شوند
+# - بعد از reap تعداد اشیای ساختارهای بازی لاگ می‌شود (باید همه صفر باشند)
+# --------------------------------------------------------
+
+import logging
+from enum import Enum
+
+LOG_TAG = "GameLifecycle"
+
+
+class GamePhase(str, Enum):
+    IDLE = "idle"          # بازی‌ای نیست (یا reap شده)
+    LOBBY = "lobby"        # لابی باز است
+    RUNNING = "running"    # نقش‌ها پخش شده و بازی در جریان است
+    ENDED = "ended"        # بازی تمام/لغو شده؛ منتظر reap
+
+
+TRANSITIONS = {
+    GamePhase.IDLE: {GamePhase.LOBBY},
+    GamePhase.LOBBY: {GamePhase.LOBBY, GamePhase.RUNNING, GamePhase.ENDED},
+    GamePhase.RUNNING: {GamePhase.RUNNING, GamePhase.ENDED},
+    GamePhase.ENDED: {GamePhase.IDLE, GamePhase.LOBBY},
+}
+
+
+class GameLifecycle:
+    """
+    استفاده:
+      lifecycle = GameLifecycle()
+      lifecycle.advance(GamePhase.LOBBY)
+      lifecycle.end()                  # رفتن به ENDED
+      lifecycle.reaped(players=players, ...)   # بعد از پاک‌سازی state
+    """
+
+    def __init__(self):
+        self.phase = GamePhase.IDLE
+        self.created = 0
+        self.reaped_count = 0
+
+    def advance(self, phase):
+        phase = GamePhase(phase)
+        if phase not in TRANSITIONS[self.phase]:
+            logging.warning("%s: انتقال نامعتبر %s → %s", LOG_TAG, self.phase.value, phase.value)
+        if phase is GamePhase.LOBBY and self.phase is not GamePhase.LOBBY:
+            self.created += 1
+        self.phase = phase
+
+    def end(self):
+        self.advance(GamePhase.ENDED)
+
+    # -------------------------
+    # بعد از پاک‌سازی
+    # -------------------------
+    def reaped(self, **structures):
+        """structures: ساختارهای بازی بعد از ریست؛ هر چیزی که خالی نشده باشد لاگ می‌شود"""
+        self.reaped_count += 1
+        self.phase = GamePhase.IDLE
+        leftovers = {name: len(obj) for name, obj in structures.items() if obj is not None and len(obj)}
+        if leftovers:
+            logging.warning("%s: بعد از reap خالی نشدند: %s", LOG_TAG, leftovers)
+        logging.info("%s: بازی reap شد (ساخته شده=%d، reap شده=%d)",
+                     LOG_TAG, self.created, self.reaped_count)
+        return leftovers
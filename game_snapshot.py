@@ -0,0 +1,61 @@
+# game_snapshot.py
+# --------------------------------------------------------
+# ذخیره/بازیابی وضعیت بازی جاری هنگام خاموش شدن ربات
+# (deploy روی Heroku/Docker → SIGTERM). فایل مثل بقیهٔ فایل‌ها با storage
+# (اتمیک، در thread نویسنده) نوشته می‌شود و بعد از بازیابی پاک می‌شود
+# تا بازی دو بار از یک snapshot برنگردد.
+# استفاده:
+#   save_snapshot(state); storage.flush(timeout)     # در on_shutdown
+#   state, saved_at = pop_snapshot()                 # در on_startup
+# --------------------------------------------------------
+
+import os
+import json
+import time
+import logging
+
+import storage
+
+LOG_TAG = "GameSnapshot"
+
+GAME_STATE_FILE = "game_state.json"
+SNAPSHOT_VERSION = 1
+MAX_AGE = 6 * 3600     # ثانیه — snapshot قدیمی‌تر از این نادیده گرفته می‌شود
+
+
+def save_snapshot(state, path=GAME_STATE_FILE):
+    """نوشتن در صف storage؛ بعدش storage.flush() تا قبل از خروج روی دیسک برود"""
+    data = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), "state": state}
+    storage.save_json(path, data, callback=lambda p: logging.info("%s: وضعیت بازی در %s ذخیره شد.", LOG_TAG, p))
+
+
+def pop_snapshot(path=GAME_STATE_FILE):
+    """
+    خواندن و حذف snapshot.
+    خروجی: (state, saved_at) یا (None, None)
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    except Exception as e:
+        logging.warning("%s: فایل %s خوانده نشد: %s", LOG_TAG, path, e)
+        data = None
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None, None
+    saved_at = data.get("saved_at") or 0
+    if time.time() - saved_at > MAX_AGE:
+        logging.info("%s: snapshot قدیمی است؛ نادیده گرفته شد.", LOG_TAG)
+        return None, None
+    return data.get("state"), saved_at
+
+
+def int_keys(d):
+    """JSON کلیدها را رشته می‌کند؛ برگرداندن کلیدهای عددی"""
+    return {int(k): v for k, v in (d or {}).items()}
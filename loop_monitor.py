@@ -0,0 +1,189 @@
+# loop_monitor.py
+# --------------------------------------------------------
+# مانیتور تأخیر event loop و پیدا کردن فراخوانی‌های blocking
+# - یک تسک هر interval ثانیه می‌خوابد و تأخیر بیدار شدنش (lag) را در هیستوگرام ثبت می‌کند
+# - حالت debug: یک thread نگهبان اگر loop بیشتر از threshold گیر کند،
+#   stack همان لحظهٔ thread اصلی را لاگ می‌کند (یعنی دقیقاً کد blocking)
+#   + asyncio debug با slow_callback_duration
+# - timed(name): هیستوگرام زمان اجرای هندلرها (مثلاً next_turn)
+# فعال‌سازی با متغیر محیطی LOOP_MONITOR=1 و LOOP_DEBUG=1
+# --------------------------------------------------------
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import traceback
+from bisect import bisect_left
+
+LOG_TAG = "LoopMonitor"
+
+DEFAULT_INTERVAL = 0.25      # ثانیه — فاصلهٔ نمونه‌برداری
+DEFAULT_THRESHOLD = 0.1      # ثانیه — بیشتر از این یعنی loop گیر کرده
+REPORT_EVERY = 300           # ثانیه — گزارش دوره‌ای در لاگ
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """هیستوگرام سادهٔ bucket ثابت (میلی‌ثانیه)"""
+
+    __slots__ = ("counts", "total", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, p):
+        """کران بالای bucketی که صدک p در آن است (ms)"""
+        if not self.total:
+            return 0.0
+        rank = self.total * p / 100
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(float(BUCKETS_MS[i]), round(self.max_ms, 2)) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.total,
+            "avg_ms": round(self.sum_ms / self.total, 2) if self.total else 0.0,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {l: c for l, c in zip(labels, self.counts) if c},
+        }
+
+    def format(self, name):
+        d = self.to_dict()
+        return (f"{name}: n={d['count']} avg={d['avg_ms']}ms p50≤{d['p50_ms']}ms "
+                f"p99≤{d['p99_ms']}ms max={d['max_ms']}ms {d['buckets']}")
+
+
+class LoopMonitor:
+    """
+    استفاده:
+      monitor = LoopMonitor()
+      await monitor.start(debug=True)       # در on_startup
+      @monitor.timed("next_turn")           # هیستوگرام زمان هندلر
+      monitor.report()                      # {"loop_lag": {...}, "next_turn": {...}}
+      await monitor.stop()
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, threshold=DEFAULT_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.histograms = {"loop_lag": Histogram()}
+        self.stalls = 0
+        self._task = None
+        self._watchdog = None
+        self._stop_event = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+
+    # -------------------------
+    # شروع / توقف
+    # -------------------------
+    async def start(self, debug=False):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        if debug:
+            # asyncio خودش callbackهای کندتر از این مقدار را لاگ می‌کند
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logging.info("%s: فعال شد (debug=%s, threshold=%.0fms)", LOG_TAG, debug, self.threshold * 1000)
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.histograms["loop_lag"].total:
+            logging.info("%s: %s", LOG_TAG, self.histograms["loop_lag"].format("loop_lag"))
+
+    # -------------------------
+    # نمونه‌برداری lag
+    # -------------------------
+    async def _sample(self):
+        lag_hist = self.histograms["loop_lag"]
+        next_report = time.monotonic() + REPORT_EVERY
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - before - self.interval)
+            lag_hist.add(lag)
+            if lag > self.threshold:
+                logging.warning("%s: event loop %.0fms گیر کرد", LOG_TAG, lag * 1000)
+            if now >= next_report:
+                next_report = now + REPORT_EVERY
+                for name, hist in self.histograms.items():
+                    logging.info("%s: %s", LOG_TAG, hist.format(name))
+
+    def _watch(self):
+        """thread نگهبان: اگر heartbeat دیر شد، stack فعلی thread اصلی را لاگ کن"""
+        reported_for = None
+        limit = self.interval + self.threshold
+        while not self._stop_event.wait(self.threshold / 2):
+            beat = self._heartbeat
+            if time.monotonic() - beat <= limit or reported_for == beat:
+                continue
+            reported_for = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(stack در دسترس نیست)"
+            logging.warning("%s: loop بیش از %.0fms مسدود است؛ stack:\n%s",
+                            LOG_TAG, limit * 1000, stack)
+
+    # -------------------------
+    # زمان هندلرها
+    # -------------------------
+    def timed(self, name):
+        hist = self.histograms.setdefault(name, Histogram())
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    hist.add(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def report(self):
+        return {name: hist.to_dict() for name, hist in self.histograms.items()}
+
+
+def enabled_from_env():
+    """(monitor فعال؟, debug فعال؟) از روی LOOP_MONITOR و LOOP_DEBUG"""
+    debug = os.getenv("LOOP_DEBUG", "") not in ("", "0")
+    return debug or os.getenv("LOOP_MONITOR", "") not in ("", "0"), debug
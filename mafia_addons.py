@@ -8,6 +8,7 @@ import json
 import os
 import copy
 import logging
+import storage
 from aiogram import types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
@@ -23,11 +24,15 @@ DEFAULT_GROUP_SETTINGS = {
     "next": {
         "anti_spam": True,
         "allow_players_next": True,
-        "allow_moderator_next": True
+        "allow_moderator_next": True,
+        "edit_in_place": False   # نوبت بعدی با ویرایش همان پیام نوبت (بدون پیام جدید)
     },
     "auto_start": {
         "enabled": False
     },
+    "roles": {
+        "dm": False          # ارسال نقش در پیوی (پیش‌فرض: فقط دکمهٔ «نقش من» در گروه)
+    },
     "color": {
         "primary": True,
         "challenge": True,
@@ -45,7 +50,7 @@ class MafiaAddons:
       addons.register(moderator_id=..., group_id=...)  # وقتی گرداننده انتخاب میشود
     """
 
-    def __init__(self, bot):
+    def __init__(self, bot, autoload=True):
         self.bot = bot
         # کل تنظیمات برای همه گروه‌ها: کلید = str(group_id)
         self._all_settings = {}
@@ -54,7 +59,11 @@ class MafiaAddons:
         self.moderator_id = None
         # view جاری که main.py انتظار دارد (addons.settings)
         self.settings = copy.deepcopy(DEFAULT_GROUP_SETTINGS)
-        # بارگذاری از فایل در ابتدای ساخت
+        # بارگذاری از فایل در ابتدای ساخت (یا بعداً با load() در استارتاپ)
+        if autoload:
+            self._load_from_file()
+
+    def load(self):
         self._load_from_file()
 
     # -------------------------
@@ -77,12 +86,17 @@ class MafiaAddons:
             self._all_settings = {}
 
     def _save_to_file(self):
+        # نوشتن اتمیک در thread نویسندهٔ storage (هندلر منتظر دیسک نمی‌ماند)
         try:
-            with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-                json.dump(self._all_settings, f, ensure_ascii=False, indent=2)
+            storage.save_json(SETTINGS_FILE, self._all_settings)
         except Exception as e:
             logging.exception("%s: خطا در نوشتن فایل تنظیمات: %s", LOG_TAG, e)
 
+    def flush(self, timeout=None):
+        """ذخیرهٔ نهایی تنظیمات و صبر تا روی دیسک برود (هنگام خاموش شدن)"""
+        self._save_to_file()
+        return storage.flush(timeout)
+
     # -------------------------
     # کمک‌ها: key conversion / defaults
     # -------------------------
@@ -95,9 +109,11 @@ class MafiaAddons:
         if s is None:
             s = copy.deepcopy(DEFAULT_GROUP_SETTINGS)
             # ensure compatibility keys
-            s.setdefault("next", {"anti_spam": True, "allow_players_next": True, "allow_moderator_next": True})
+            s.setdefault("next", {"anti_spam": True, "allow_players_next": True, "allow_moderator_next": True,
+                                  "edit_in_place": False})
             s.setdefault("security", {"control_speech": True, "delete_out_of_turn": True})
             s.setdefault("auto_start", {"enabled": False})
+            s.setdefault("roles", {"dm": False})
             s.setdefault("color", {"primary": True, "challenge": True, "timer_prefix": ""})
             self._all_settings[key] = s
             self._save_to_file()
@@ -123,6 +139,7 @@ class MafiaAddons:
             self.settings["next"].setdefault("anti_spam", True)
             self.settings["next"].setdefault("allow_players_next", True)
             self.settings["next"].setdefault("allow_moderator_next", True)
+            self.settings["next"].setdefault("edit_in_place", False)
 
             self.settings.setdefault("security", {})
             self.settings["security"].setdefault("control_speech", True)
@@ -131,6 +148,9 @@ class MafiaAddons:
             self.settings.setdefault("auto_start", {})
             self.settings["auto_start"].setdefault("enabled", False)
 
+            self.settings.setdefault("roles", {})
+            self.settings["roles"].setdefault("dm", False)
+
             self.settings.setdefault("color", {})
             self.settings["color"].setdefault("primary", True)
             self.settings["color"].setdefault("challenge", True)
@@ -159,7 +179,10 @@ class MafiaAddons:
         dp.register_callback_query_handler(self._toggle_control_speech, lambda c: c.data == "toggle_control_speech")
         dp.register_callback_query_handler(self._toggle_delete_messages, lambda c: c.data == "toggle_delete_messages")
         dp.register_callback_query_handler(self._toggle_next_antispam, lambda c: c.data == "toggle_next_antispam")
+        dp.register_callback_query_handler(self._toggle_next_edit_in_place,
+                                           lambda c: c.data == "toggle_next_edit_in_place")
         dp.register_callback_query_handler(self._toggle_autostart, lambda c: c.data == "toggle_autostart")
+        dp.register_callback_query_handler(self._toggle_role_dm, lambda c: c.data == "toggle_role_dm")
         dp.register_callback_query_handler(self._toggle_color_primary, lambda c: c.data == "toggle_color_primary")
         dp.register_callback_query_handler(self._toggle_color_challenge, lambda c: c.data == "toggle_color_challenge")
 
@@ -176,7 +199,7 @@ class MafiaAddons:
         kb = InlineKeyboardMarkup()
         kb.add(InlineKeyboardButton("🔐 امنیت بازی", callback_data="addons_security"))
         kb.add(InlineKeyboardButton("⏭ مدیریت نکست", callback_data="addons_next"))
-        kb.add(InlineKeyboardButton("▶ شروع خودکار", callback_data="addons_auto"))
+        kb.add(InlineKeyboardButton("▶ شروع خودکار / پخش نقش", callback_data="addons_auto"))
         kb.add(InlineKeyboardButton("🎨 رنگ‌بندی پیام‌ها", callback_data="addons_color"))
         kb.add(InlineKeyboardButton("🔙 بازگشت", callback_data="panel_back"))
 
@@ -246,6 +269,10 @@ class MafiaAddons:
             f"⏭ ضد اسپم نکست: {'فعال' if self.settings['next'].get('anti_spam', True) else 'غیرفعال'}",
             callback_data="toggle_next_antispam"
         ))
+        kb.add(InlineKeyboardButton(
+            f"✏️ نوبت بعدی در همان پیام: {'فعال' if self.settings['next'].get('edit_in_place', False) else 'غیرفعال'}",
+            callback_data="toggle_next_edit_in_place"
+        ))
         kb.add(InlineKeyboardButton("🔙 بازگشت", callback_data="panel_back"))
 
         try:
@@ -271,16 +298,20 @@ class MafiaAddons:
             f"▶ Auto Start: {'فعال' if self.settings['auto_start'].get('enabled', False) else 'غیرفعال'}",
             callback_data="toggle_autostart"
         ))
+        kb.add(InlineKeyboardButton(
+            f"📩 ارسال نقش در پیوی: {'فعال' if self.settings.setdefault('roles', {}).get('dm', False) else 'غیرفعال'}",
+            callback_data="toggle_role_dm"
+        ))
         kb.add(InlineKeyboardButton("🔙 بازگشت", callback_data="panel_back"))
 
         try:
             await callback.message.edit_text(
-                "▶ <b>شروع خودکار دور جدید</b>",
+                "▶ <b>شروع خودکار دور جدید و پخش نقش</b>",
                 reply_markup=kb, parse_mode="HTML"
             )
         except Exception:
             try:
-                await callback.message.answer("▶ <b>شروع خودکار دور جدید</b>", reply_markup=kb, parse_mode="HTML")
+                await callback.message.answer("▶ <b>شروع خودکار دور جدید و پخش نقش</b>", reply_markup=kb, parse_mode="HTML")
             except:
                 pass
 
@@ -361,6 +392,21 @@ class MafiaAddons:
         await callback.answer("✔️ وضعیت ذخیره شد.")
         await self._open_next_menu(callback)
 
+    async def _toggle_next_edit_in_place(self, callback: types.CallbackQuery):
+        if not self.group_id:
+            await callback.answer("⚠️ ابتدا یک بازی/گروه ثبت شود.", show_alert=True)
+            return
+        if callback.from_user.id != self.moderator_id:
+            await callback.answer("⚠️ فقط گرداننده می‌تواند این تنظیمات را تغییر دهد.", show_alert=True)
+            return
+
+        self.settings['next']['edit_in_place'] = not self.settings['next'].get('edit_in_place', False)
+        self._all_settings[self._group_key(self.group_id)] = self.settings
+        self._save_to_file()
+
+        await callback.answer("✔️ وضعیت ذخیره شد.")
+        await self._open_next_menu(callback)
+
     async def _toggle_autostart(self, callback: types.CallbackQuery):
         if not self.group_id:
             await callback.answer("⚠️ ابتدا یک بازی/گروه ثبت شود.", show_alert=True)
@@ -376,6 +422,22 @@ class MafiaAddons:
         await callback.answer("✔️ وضعیت ذخیره شد.")
         await self._open_auto_menu(callback)
 
+    async def _toggle_role_dm(self, callback: types.CallbackQuery):
+        if not self.group_id:
+            await callback.answer("⚠️ ابتدا یک بازی/گروه ثبت شود.", show_alert=True)
+            return
+        if callback.from_user.id != self.moderator_id:
+            await callback.answer("⚠️ فقط گرداننده می‌تواند این تنظیمات را تغییر دهد.", show_alert=True)
+            return
+
+        roles = self.settings.setdefault('roles', {})
+        roles['dm'] = not roles.get('dm', False)
+        self._all_settings[self._group_key(self.group_id)] = self.settings
+        self._save_to_file()
+
+        await callback.answer("✔️ وضعیت ذخیره شد.")
+        await self._open_auto_menu(callback)
+
     async def _toggle_color_primary(self, callback: types.CallbackQuery):
         if not self.group_id:
             await callback.answer("⚠️ ابتدا یک بازی/گروه ثبت شود.", show_alert=True)
@@ -427,6 +489,9 @@ class MafiaAddons:
     def is_next_antispam_enabled(self):
         return self.settings.get("next", {}).get("anti_spam", True)
 
+    def is_next_edit_in_place(self):
+        return self.settings.get("next", {}).get("edit_in_place", False)
+
     def is_player_next_allowed(self):
         return self.settings.get("next", {}).get("allow_players_next", True)
 
@@ -436,6 +501,9 @@ class MafiaAddons:
     def is_auto_start_enabled(self):
         return self.settings.get("auto_start", {}).get("enabled", False)
 
+    def is_role_dm_enabled(self):
+        return self.settings.get("roles", {}).get("dm", False)
+
     def is_color_primary(self):
         return self.settings.get("color", {}).get("primary", True)
 
@@ -1,19 +1,17 @@
 import os
-import json
 import random
+import signal
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
 import html
-import commands
 from aiogram.utils.exceptions import ChatAdminRequired
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.utils.exceptions import MessageNotModified, MessageToEditNotFound, MessageCantBeEdited
-import jdatetime
 class AddScenario(StatesGroup):
     waiting_for_name = State()
     waiting_for_roles = State()
@@ -23,6 +21,26 @@ import time
 now = time.time()
 
 from mafia_addons import MafiaAddons
+from callback_guard import CallbackGuard, UNCHANGED
+from callback_codec import CallbackCodec, Action, PREFIX as CODEC_PREFIX
+from render_cache import TemplateCache, keyboard_json, chunk
+from scenario_registry import ScenarioRegistry, ScenarioError, MAFIA, CITIZEN, INDEPENDENT
+from ordered_queue import OrderedQueue
+from delete_scheduler import DeletionScheduler
+from game_snapshot import save_snapshot, pop_snapshot, int_keys
+from player_record import Roster
+from game_lifecycle import GameLifecycle, GamePhase
+from task_supervisor import TaskSupervisor
+from loop_monitor import LoopMonitor, enabled_from_env
+import profiler
+from update_filter import UpdateFilter
+from text_commands import CommandTable, normalize
+from delivery_ledger import DeliveryLedger, DeliveryStatus, UnreachableCache
+from api_calls import gather_calls, ok
+from turn_sequence import TurnSequence
+from challenge_scheduler import ChallengeScheduler, BEFORE
+from voting import Ballot, CoalescedEdit
+from night_actions import NightEngine, NightActor, KIND_LABELS, ANSWERED, SKIPPED, TIMED_OUT, UNREACHABLE
 
 # ======================
 # تنظیمات ربات
@@ -31,13 +49,59 @@ API_TOKEN = os.getenv("API_TOKEN")
 if not API_TOKEN:
     raise ValueError("API_TOKEN environment variable is not set!")
 
+# آدرس Bot API دیگر (سرور محلی telegram-bot-api یا stub تست‌ها)؛ پیش‌فرض api.telegram.org
+API_SERVER = os.getenv("TELEGRAM_API_SERVER")
+
 logging.basicConfig(level=logging.INFO)
-bot = Bot(token=API_TOKEN, parse_mode="HTML")
+if API_SERVER:
+    from aiogram.bot.api import TelegramAPIServer
+    bot = Bot(token=API_TOKEN, parse_mode="HTML", server=TelegramAPIServer.from_base(API_SERVER))
+else:
+    bot = Bot(token=API_TOKEN, parse_mode="HTML")
 dp = Dispatcher(bot, storage=MemoryStorage())
 
-addons = MafiaAddons(bot)
+addons = MafiaAddons(bot, autoload=False)   # تنظیمات در on_startup خوانده می‌شود
 addons.setup_handlers(dp)
 
+# جلوگیری از اجرای دوباره کلیک‌های تکراری + قفل هر بازی
+guard = CallbackGuard()
+
+def game_key(callback):
+    # فعلاً هر بار فقط یک بازی داریم؛ دکمه‌های پیوی هم متعلق به همان گروه هستند
+    return group_chat_id
+
+# callback_data فشرده (action + بازی + nonce + صندلی‌ها)
+codec = CallbackCodec()
+
+# قالب‌های آماده (کیبوردها و منشن‌ها) — فقط بخش‌های متغیر هر بار پر می‌شوند
+templates = TemplateCache()
+
+# حذف زمان‌بندی شدهٔ پیام‌های موقت (یک تسک برای همه + ذخیره روی دیسک)
+deleter = DeletionScheduler(bot)
+
+# چرخهٔ عمر بازی (lobby → running → ended → reap)
+lifecycle = GameLifecycle()
+
+# همهٔ تسک‌های پس‌زمینهٔ هر بازی (تایمر نوبت و ...) از این‌جا ساخته و لغو می‌شوند
+supervisor = TaskSupervisor()
+
+# کاربرانی که پیوی‌شان در دسترس نیست (TTL) + وضعیت تحویل پیام‌های پیوی بازی جاری
+unreachable = UnreachableCache()
+deliveries = DeliveryLedger(unreachable)
+night_deliveries = DeliveryLedger(unreachable)   # جدا تا وضعیت تحویل نقش‌ها (resend_roles) عوض نشود
+moderator_deliveries = DeliveryLedger(unreachable)   # لیست نقش‌ها/خلاصهٔ شب در پیوی گرداننده
+# 📵 لابی فقط از همین ارسال‌های پیوی پر می‌شود؛ کسی که هنوز پیوی‌ای برایش نرفته ناشناخته می‌ماند
+
+# اقدام‌های شب از پیوی؛ مهلت همهٔ بازیکنان در یک heap و یک تسک
+night_engine = NightEngine(
+    send=lambda uid, text, kb: night_deliveries.send(bot, uid, text, reply_markup=kb),
+    keyboard=lambda game_id, actor: night_keyboard(actor),
+    on_complete=lambda night: send_night_summary(night),
+)
+
+# مانیتور تأخیر event loop + هیستوگرام زمان هندلرهای داغ (LOOP_MONITOR=1 / LOOP_DEBUG=1)
+monitor = LoopMonitor()
+
 # فقط این گروه اجازه اجرای بازی داره
 #تست
 #ALLOWED_GROUP_ID = -1003080272814
@@ -46,10 +110,23 @@ ALLOWED_GROUP_ID = -1001760002160
 #چکنویس
 #ALLOWED_GROUP_ID = -1002356353761
 
+# دستورات متنی (متن نرمال‌شده → هندلر)؛ هندلرها با @text_table.command ثبت می‌شوند
+text_table = CommandTable()
+text_table.reserve("تگ لیست", "تگ ادمین")   # در text_commands_handler
+
+# بقیهٔ گپ گروه وقتی بازی نیست قبل از هندلرها دور ریخته می‌شود
+update_filter = UpdateFilter(
+    known_chat=lambda chat_id: chat_id == ALLOWED_GROUP_ID or chat_id == group_chat_id,
+    game_active=lambda: lifecycle.phase is not GamePhase.IDLE,
+    commands=text_table,
+)
+dp.middleware.setup(update_filter)
+
 # ======================
 # متغیرهای سراسری
 # ======================
 players = {}                # بازیکنان: {user_id: name}
+roster = Roster()           # رکورد کامل هر بازیکن (منشن آماده، صندلی، نقش، زنده بودن، آمار صحبت)
 moderator_id = None         # آیدی گرداننده
 selected_scenario = None    # سناریوی انتخابی
 scenarios = {}              # لیست سناریوها
@@ -59,30 +136,36 @@ group_chat_id = None
 admins = set()
 game_running = False     # وقتی بازی واقعاً شروع شده است (نقش‌ها ارسال شدند)
 lobby_active = False     # وقتی لابی فعال است (انتخاب سناریو و گرداننده)
-turn_order = []             # ترتیب نوبت‌ها
-current_turn_index = 0      # اندیس نوبت فعلی
-current_turn_message_id = None  # پیام پین شده برای نوبت
+current_turn_message_id = None  # پیام نوبت فعلی (برای ویرایش در جا)
+next_announcement = None        # (key, text, kb) اعلام نوبت نفر بعدی، از قبل ساخته شده
+current_turn_seat = None    # صندلی‌ای که الان نوبت صحبت دارد (برای رد کردن دکمه‌های قدیمی)
 turn_timer_task = None      # تسک تایمر نوبت
+turn_deadline = None        # زمان پایان نوبت جاری (time.time) — برای ذخیره/ادامهٔ تایمر بعد از ری‌استارت
+turn_is_challenge = False   # نوبت جاری نوبت چالش است؟
+turn_started_at = None      # شروع نوبت جاری (برای آمار صحبت)
 player_slots = {}  # {slot_number: user_id}
-challenge_requests = {}  
-pending_challenges = {}
 active_challenger_seats = set()
 challenge_mode = False      # آیا الان در حالت نوبت چالش هستیم؟
-paused_main_player = None   # اگر چالش "قبل" ثبت شد، اینجا id نوبت اصلی ذخیره می‌شود تا بعد از چالش resume شود
-paused_main_duration = None # (اختیاری) مدت زمان نوبت اصلی برای resume — معمولا 120
 DEFAULT_TURN_DURATION = 120  # مقدار پیش‌فرض نوبت اصلی (در صورت تمایل تغییر بده)
+CHALLENGE_TURN_DURATION = 60
+challenge_queue = ChallengeScheduler()   # درخواست‌ها و صف چالش‌های قبول‌شده (به ترتیب قبل/بعد، اول‌آمده)
+turns = TurnSequence(DEFAULT_TURN_DURATION, CHALLENGE_TURN_DURATION, challenge_queue)   # ترتیب نوبت‌ها + چالش‌ها + نوبت اضافه
 challenges = {}  # {player_id: {"type": "before"/"after", "challenger": user_id}}
 challenge_active = True
-post_challenge_advance = False   # وقتی اجرای چالش 'بعد' باشه، بعد از چالش به نوبت بعدی می‌رویم
-substitute_list = {}  # group_id: {user_id: {"name": name}}
 players_in_game = {}  # group_id: {seat_number: {"id": user_id, "name": name, "role": role}}
 removed_players = {}  # group_id: {seat_number: {"id": user_id, "name": name, "roles": []}}
 MAX_SEATS = 0        # تعداد صندلی‌ها، بعد از انتخاب سناریو مقداردهی میشه
 waiting_message_id = None
-waiting_list = []     # لیست انتظار جایگزین
-substitute_list = {}  # لیست جایگزین‌ها بر اساس گروه
-extra_turns = []  # لیست بازیکن‌هایی که باید بعد از پایان دور یک ترن اضافه بگیرن
+waiting_message_text = None   # آخرین متن پیام رزرو (برای جلوگیری از edit بی‌تغییر)
+MAX_WAITING = 30
+waiting_list = OrderedQueue(maxlen=MAX_WAITING)   # لیست رزرو: (user_id, name) به ترتیب ورود
+substitute_list = OrderedQueue()                  # لیست جایگزین‌های بازی جاری
+lobby_notice = None   # پیام یک‌باره‌ای که در آپدیت بعدی لابی نمایش داده می‌شود (مثلاً جایگزینی خودکار)
 last_next_time = 0
+ballot = None           # رأی‌گیری روز جاری (Ballot)
+vote_message_id = None  # پیام رأی‌گیری (شمارش با ویرایش تجمیعی)
+vote_edit = None        # CoalescedEdit پیام رأی‌گیری
+game_nonce = 0        # با هر بازی جدید عوض می‌شود؛ دکمه‌های فشردهٔ بازی قبلی رد می‌شوند
 next_by_players_enabled = True
 next_by_moderator_enabled = True
 
@@ -90,34 +173,123 @@ next_by_moderator_enabled = True
 # داده های ریست در شروع روز
 #=======================
 def reset_round_data():
-    global current_turn_index, turn_order, challenge_requests, active_challenger_seats
-    global paused_main_player, paused_main_duration, post_challenge_advance, pending_challenges
+    global active_challenger_seats, ballot
 
-    current_turn_index = 0
-    turn_order = []
-    challenge_requests = {}
+    turns.clear()   # صف چالش‌ها هم خالی می‌شود
     active_challenger_seats = set()
-    paused_main_player = None
-    paused_main_duration = None
-    post_challenge_advance = False
-    pending_challenges = {}
+    ballot = None   # رأی‌گیری باز روز قبل دیگر دکمه‌ای قبول نمی‌کند
+
+#=======================
+# پایان بازی: لغو تسک‌ها + آزادسازی کامل state بازی
+#=======================
+async def end_game():
+    """تسک‌های بازی را لغو و همهٔ ساختارهای بازی را ریست می‌کند"""
+    global turn_timer_task
+    await supervisor.cancel_game(group_chat_id)
+    night_engine.cancel(group_chat_id)
+    turn_timer_task = None
+    lifecycle.end()
+    reap_game()
+
+def reap_game():
+    global moderator_id, selected_scenario, game_message_id, lobby_message_id, group_chat_id
+    global game_running, lobby_active, current_turn_message_id, next_announcement
+    global current_turn_seat, turn_deadline, turn_is_challenge, turn_started_at
+    global challenge_mode
+    global MAX_SEATS, waiting_message_id, waiting_message_text, lobby_notice, last_next_time
+    global ballot, vote_message_id, vote_edit
+
+    if group_chat_id is not None:
+        guard.forget(group_chat_id)
+
+    players.clear()
+    roster.clear()
+    player_slots.clear()
+    admins.clear()
+    turns.clear()
+    active_challenger_seats.clear()
+    challenges.clear()
+    players_in_game.clear()
+    removed_players.clear()
+    waiting_list.clear()
+    substitute_list.clear()
+    deliveries.clear()
+    night_deliveries.clear()
+    moderator_deliveries.clear()
+    templates.clear()
+
+    moderator_id = None
+    selected_scenario = None
+    game_message_id = None
+    lobby_message_id = None
+    group_chat_id = None
+    game_running = False
+    lobby_active = False
+    current_turn_message_id = None
+    next_announcement = None
+    current_turn_seat = None
+    turn_deadline = None
+    turn_is_challenge = False
+    turn_started_at = None
+    challenge_mode = False
+    MAX_SEATS = 0
+    waiting_message_id = None
+    waiting_message_text = None
+    lobby_notice = None
+    last_next_time = 0
+    ballot = None             # تسک ویرایش شمارش با supervisor.cancel_game لغو می‌شود
+    vote_message_id = None
+    vote_edit = None
+
+    lifecycle.reaped(
+        players=players, roster=roster, player_slots=player_slots, turns=turns,
+        challenge_queue=challenge_queue,
+        active_challenger_seats=active_challenger_seats, challenges=challenges,
+        removed_players=removed_players, waiting_list=waiting_list,
+        substitute_list=substitute_list, deliveries=deliveries, night_deliveries=night_deliveries,
+    )
+
+def seat_record(seat):
+    """رکورد بازیکن روی صندلی (یا None)"""
+    uid = player_slots.get(seat)
+    if uid is None:
+        return None
+    return roster.seated(seat, uid, players.get(uid, "❓"))
+
+def seated_records():
+    """رکورد همهٔ بازیکنان نشسته به ترتیب صندلی"""
+    return [roster.seated(seat, uid, players.get(uid, "❓")) for seat, uid in sorted(player_slots.items())]
+
+def render_role_list():
+    """لیست نقش‌ها برای گرداننده"""
+    text = "༄\n    Mafia Nights\n\n"
+    text += "⏱ Time : 21:00\n"
+    text += f"📆 Date : {get_jalali_today()}\n"
+    text += f"🗓 Scenario : {selected_scenario}\n"
+    text += f"👮‍♂ God : {players.get(moderator_id, '❓')}\n\n"
+    text += " ~ ~ ~ ~ ~ ~ ~ ~ ~ ~ \n"
+    text += "          لیست نقش‌ها\n"
+    text += "◤◢◣◥◤◢◣◥◤◢◣◥\n\n"
+    for rec in seated_records():
+        text += f"\u200E{rec.seat:02d} {rec.bold_mention} — {rec.role_text}\n"
+    text += "\n◤◢◣◥◤◢◣◥◤◢◣◥\n\n༄"
+    return text
+
+def packed(action, *args):
+    """ساخت callback_data فشرده برای بازی جاری"""
+    return codec.encode(action, group_chat_id or 0, game_nonce, *args)
 
 # ======================
 #  لود سناریوها
 # ======================
 def load_scenarios():
-    try:
-        with open("scenarios.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            "سناریو کلاسیک": {"min_players": 5, "max_players": 10, "roles": ["مافیا", "مافیا", "شهروند", "شهروند", "شهروند"]},
-            "سناریو ویژه": {"min_players": 6, "max_players": 12, "roles": ["مافیا", "مافیا", "شهروند", "شهروند", "شهروند", "کارآگاه"]}
-        }
+    # سناریوها با متادیتای آماده؛ تغییر فایل بدون ری‌استارت اعمال می‌شود
+    # فایل در on_startup (یا اولین دسترسی) خوانده می‌شود، نه هنگام ایمپورت
+    return ScenarioRegistry("scenarios.json", autoload=False)
 
 def save_scenarios():
-    with open("scenarios.json", "w", encoding="utf-8") as f:
-        json.dump(scenarios, f, ensure_ascii=False, indent=2)
+    # نوشتن اتمیک (فایل موقت + rename)
+    scenarios.save()
 
 scenarios = load_scenarios()
 
@@ -126,13 +298,14 @@ scenarios = load_scenarios()
 # ------------------------------
 def set_max_seats_from_scenario(scenario_name: str):
     global MAX_SEATS
-    roles = scenarios.get(scenario_name, [])
-    MAX_SEATS = len(roles)
+    scen = scenarios.get(scenario_name)
+    MAX_SEATS = scen.seat_count if scen else 0
 
 # ================================
 # تابع تقویم
 # ================================
 def get_jalali_today():
+    import jdatetime   # ایمپورت lazy — فقط وقتی تاریخ لازم است
     today = jdatetime.date.today()
     return today.strftime("%Y/%m/%d")
 
@@ -198,17 +371,14 @@ async def add_scenario_min_players(message: types.Message, state: FSMContext):
 
     name = data["name"]
     roles = data["roles"]
-    max_players = len(roles)  # حداکثر تعداد بازیکن = تعداد نقش‌ها
 
-    # ذخیره در دیکشنری scenarios
-    scenarios[name] = {
-        "roles": roles,
-        "min_players": min_players,
-        "max_players": max_players
-    }
-
-    # ذخیره در فایل
-    save_scenarios()
+    # اعتبارسنجی + ذخیرهٔ اتمیک در فایل
+    try:
+        scen = scenarios.add(name, roles, min_players)
+    except ScenarioError as e:
+        await message.answer(f"⚠️ سناریو نامعتبر است: {html.escape(str(e))}")
+        return
+    max_players = scen.seat_count  # حداکثر تعداد بازیکن = تعداد نقش‌ها
 
     await message.answer(
         f"✅ سناریو <b>{name}</b> با موفقیت ذخیره شد!\n\n"
@@ -232,9 +402,7 @@ async def remove_scenario(callback: types.CallbackQuery):
 @dp.callback_query_handler(lambda c: c.data.startswith("delete_scen_"))
 async def delete_scenario(callback: types.CallbackQuery):
     scen = callback.data.replace("delete_scen_", "")
-    if scen in scenarios:
-        scenarios.pop(scen)
-        save_scenarios()
+    if scenarios.remove(scen):
         await callback.message.edit_text(f"✅ سناریو «{scen}» حذف شد.", reply_markup=main_menu_keyboard())
     else:
         await callback.answer("⚠ این سناریو وجود ندارد.", show_alert=True)
@@ -266,19 +434,18 @@ async def manage_game_handler(callback: types.CallbackQuery):
 # لیست بعد از انتخاب سر صحبت
 # ==============================
 async def send_turn_order_list():
-    if not turn_order:
+    order = turns.order()
+    if not order:
         return
 
     text = "👥 لیست بازیکنان (بر اساس نوبت صحبت):\n"
     text += "◤◢◣◥◤◢◣◥◤◢◣◥\n\n"
 
-    for i, seat in enumerate(turn_order, start=1):
-        uid = player_slots.get(seat)
-        if not uid:
+    for i, seat in enumerate(order, start=1):
+        rec = seat_record(seat)
+        if not rec:
             continue
-        name = players.get(uid, "❓")
-        mention = f"<a href='tg://user?id={uid}'><b>{html.escape(name)}</b></a>"
-        text += f"\u200F{i:02d} {mention}\n"
+        text += f"\u200F{i:02d} {rec.bold_mention}\n"
 
     text += "\n◤◢◣◥◤◢◣◥◤◢◣◥"
     await bot.send_message(group_chat_id, text, parse_mode="HTML")
@@ -286,10 +453,18 @@ async def send_turn_order_list():
 
 
 
+# =========================
+# دستورات متنی (یک هندلر برای همه؛ جدول در text_table)
+# =========================
+@dp.message_handler(text_table.filter)
+async def text_command_dispatch(message: types.Message, command_handler):
+    await command_handler(message)
+
+
 # -----------------------------
 # اضافه شدن به لیست جایگزین
 # -----------------------------
-@dp.message_handler(lambda m: m.text and m.text.strip().lower() in ["جایگزین", "/sub"])
+@text_table.command("جایگزین", "/sub")
 async def add_to_substitute_list(message: types.Message):
     global substitute_list, group_chat_id
 
@@ -300,27 +475,17 @@ async def add_to_substitute_list(message: types.Message):
     user_id = message.from_user.id
     user_name = message.from_user.full_name
 
-    # اطمینان از وجود ساختار گروه
-    if group_chat_id not in substitute_list:
-        substitute_list[group_chat_id] = {}
-
-    # جلوگیری از تکرار
-    if user_id in substitute_list[group_chat_id]:
+    # جلوگیری از تکرار + افزودن کاربر جدید به لیست جایگزین
+    if not substitute_list.join(user_id, user_name):
         await message.reply("ℹ️ شما قبلاً در لیست جایگزین هستید.")
         return
 
-    # افزودن کاربر جدید به لیست جایگزین
-    substitute_list[group_chat_id][user_id] = {
-        "id": user_id,
-        "name": user_name
-    }
-
     await message.reply(f"✅ {user_name} به لیست جایگزین اضافه شد.")
 
 # =========================
 # صندلی من
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() == "صندلی من")
+@text_table.command("صندلی من")
 async def my_seat_handler(message: types.Message):
     global player_slots, group_chat_id
 
@@ -336,7 +501,7 @@ async def my_seat_handler(message: types.Message):
 # =========================
 # لیست صندلی
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() == "لیست صندلی")
+@text_table.command("لیست صندلی")
 async def seats_list_handler(message: types.Message):
     global player_slots, players, reserved_list, group_chat_id
 
@@ -361,33 +526,43 @@ async def seats_list_handler(message: types.Message):
 # =========================
 # نقش من (فقط در پیوی)
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() == "نقش من")
+@text_table.command("نقش من")
 async def my_role_handler(message: types.Message):
-    global last_role_map, group_chat_id
-
     if message.chat.type != "private":
         await message.reply("ℹ️ برای دریافت نقش، لطفاً در پیوی این پیام را ارسال کنید: «نقش من»")
         return
 
     uid = message.from_user.id
-    # نقش‌ها ممکنه در last_role_map یا player_roles ذخیره شده باشه
-    role = None
-    if globals().get("last_role_map"):
-        role = last_role_map.get(uid)
-    if not role and globals().get("player_roles"):
-        role = globals().get("player_roles").get(uid)
+    role = roster.role_of(uid)
 
     if role:
         # نقش خصوصی به کاربر در پیوی ارسال می‌شود
         await message.reply(f"🔐 نقش شما: {html.escape(str(role))}")
     else:
-        await message.reply("⚠️ هنوز نقشی برای شما اختصاص داده نشده یا بازی شروع نشده.")
+        await message.reply(NO_ROLE_TEXT)
+
+
+NO_ROLE_TEXT = "⚠️ هنوز نقشی برای شما اختصاص داده نشده یا بازی شروع نشده."
+ROLE_HINT_TEXT = "ℹ️ برای دیدن نقش دکمهٔ «🎭 نقش من» را بزنید.\n"
+
+
+# =========================
+# دکمهٔ «نقش من» در گروه (alert فقط برای همان کاربر)
+# =========================
+@dp.callback_query_handler(lambda c: c.data == "my_role")
+async def my_role_callback(callback: types.CallbackQuery):
+    role = roster.role_of(callback.from_user.id)
+    if role:
+        # متن alert حداکثر ۲۰۰ کاراکتر و بدون HTML است
+        await callback.answer(f"🎭 نقش شما: {role}"[:200], show_alert=True)
+    else:
+        await callback.answer(NO_ROLE_TEXT, show_alert=True)
 
 
 # =========================
 # لیست بازیکنان (فقط گرداننده یا مدیران)
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() == "لیست بازیکنان")
+@text_table.command("لیست بازیکنان")
 async def show_players_handler(message: types.Message):
     global group_chat_id, reserved_god, players, player_slots, group_admins, bot
 
@@ -430,9 +605,9 @@ async def show_players_handler(message: types.Message):
 # =========================
 # وضعیت بازی
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() == "وضعیت بازی")
+@text_table.command("وضعیت بازی")
 async def game_status_handler(message: types.Message):
-    global group_chat_id, players, player_slots, reserved_list, reserved_scenario, round_active, turn_order
+    global group_chat_id, players, player_slots, reserved_list, reserved_scenario, round_active
 
     num_players = len(players) if globals().get("players") else 0
     seats_total = None
@@ -441,7 +616,7 @@ async def game_status_handler(message: types.Message):
     else:
         try:
             if reserved_scenario:
-                seats_total = len(scenarios[reserved_scenario]["roles"])
+                seats_total = scenarios[reserved_scenario].seat_count
         except Exception:
             seats_total = None
 
@@ -450,14 +625,14 @@ async def game_status_handler(message: types.Message):
     text += f"مجموع صندلی‌ها: {seats_total if seats_total is not None else '---'}\n"
     text += f"سناریو: {reserved_scenario or '---'}\n"
     text += f"وضعیت دور: {'فعال' if round_active else 'غیرفعال'}\n"
-    text += f"ترتیب نوبت: {len(turn_order) if globals().get('turn_order') else 0}\n"
+    text += f"ترتیب نوبت: {len(turns)}\n"
 
     await message.reply(text)
 
 # =============================
 # خروج بازیکن (فقط در لابی)
 # =============================
-@dp.message_handler(lambda m: m.chat.type in ["group", "supergroup"] and m.text and m.text.strip() == "خروج")
+@text_table.command("خروج", chat_types=("group", "supergroup"))
 async def leave_game(message: types.Message):
     global round_active
 
@@ -490,10 +665,13 @@ async def leave_game(message: types.Message):
 
     await message.reply(f"🚪 بازیکن {html.escape(name)} از بازی خارج شد (صندلی {seat_to_remove}).")
 
+    if promote_next_reserve(seat_to_remove):
+        await update_lobby()
+
 # =========================
 # راهنما / help (عمومی)
 # =========================
-@dp.message_handler(lambda m: m.text and m.text.strip() in ["راهنما", "/help"])
+@text_table.command("راهنما", "/help")
 async def help_handler(message: types.Message):
     help_text = (
         "📚 راهنمای دستورات ربات:\n\n"
@@ -511,6 +689,46 @@ async def help_handler(message: types.Message):
     await message.reply(help_text)
 
 
+# =========================
+# پروفایل روی درخواست (فقط مدیران گروه، در پیوی)
+#   /profile cpu 10 | /profile mem 30 | /profile tasks
+# =========================
+@dp.message_handler(lambda m: m.chat.type == "private" and m.text and m.text.startswith("/profile"))
+async def profile_handler(message: types.Message):
+    try:
+        member = await bot.get_chat_member(ALLOWED_GROUP_ID, message.from_user.id)
+    except Exception:
+        member = None
+    if member is None or member.status not in ("creator", "administrator"):
+        await message.reply("🚫 فقط مدیران گروه اجازهٔ این دستور را دارند.")
+        return
+
+    parts = message.text.split()
+    kind = parts[1].lower() if len(parts) > 1 else "cpu"
+    seconds = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+
+    try:
+        if kind == "cpu":
+            await message.reply(f"⏱ پروفایل CPU به مدت {profiler.clamp(seconds or 10)} ثانیه...")
+            path, summary = await profiler.profile_cpu(seconds or 10)
+        elif kind == "mem":
+            await message.reply(f"🧠 پروفایل حافظه به مدت {profiler.clamp(seconds or 30)} ثانیه...")
+            path, summary = await profiler.profile_memory(seconds or 30)
+        elif kind == "tasks":
+            path, summary = await profiler.dump_tasks()
+            summary += (f"\n\nsupervisor: {supervisor.stats()}\nmonitor: {monitor.report()}"
+                        f"\nupdates: {update_filter.stats()}")
+        else:
+            await message.reply("❓ استفاده: /profile cpu|mem|tasks [ثانیه]")
+            return
+    except profiler.ProfilerBusy:
+        await message.reply("⏳ یک پروفایل دیگر در حال اجراست.")
+        return
+
+    await message.reply(f"📄 {html.escape(path)}\n<pre>{html.escape(summary[:3500])}</pre>",
+                        parse_mode="HTML")
+
+
 
 # ======================
 # لیست بازیکنان
@@ -619,14 +837,9 @@ def manage_game_keyboard(group_id: int):
 # =========================
 # توابع کمکی
 # =========================
-# پیام موقتی
+# پیام موقتی (حذفش به deleter سپرده می‌شود؛ coroutine منتظر نمی‌ماند)
 async def send_temp_message(chat_id, text, delay=5, **kwargs):
-    msg = await bot.send_message(chat_id, text, **kwargs)
-    await asyncio.sleep(delay)
-    try:
-        await bot.delete_message(chat_id, msg.message_id)
-    except:
-        pass
+    return await deleter.send_temp(chat_id, text, delay=delay, **kwargs)
 
 # ========================
 # لیست مدیران
@@ -670,14 +883,16 @@ async def reserve_waiting(callback: types.CallbackQuery):
         return
 
     # 2) جلوگیری از اضافه شدن تکراری
-    if any(w.get("id") == user_id for w in waiting_list):
+    if user_id in waiting_list:
         await callback.answer("ℹ️ شما قبلاً در لیست رزرو هستید.", show_alert=True)
         # اما اگر پیام لیست رزرو ناقص است، آن را آپدیت کن
         await update_waiting_list_message()
         return
 
-    # 3) ثبت با ساختار ثابت (dict)
-    waiting_list.append({"id": user_id, "name": user_name})
+    # 3) ثبت
+    if not waiting_list.join(user_id, user_name):
+        await callback.answer("⚠️ لیست رزرو پر است.", show_alert=True)
+        return
 
     await callback.answer("✅ شما به لیست رزرو اضافه شدید.")
     # به‌روزرسانی پیام لیست رزرو و لابی (در صورت نیاز)
@@ -695,9 +910,9 @@ async def cancel_seat(callback: types.CallbackQuery):
     if seat_info:
         seat_info["player"] = None
         await callback.answer("❌ رزرو شما لغو شد")
-        if waiting_list:
-            next_user = waiting_list.pop(0)
-            seat_info["player"] = next_user
+        nxt = waiting_list.pop_next()
+        if nxt:
+            seat_info["player"] = {"id": nxt[0], "name": nxt[1]}
 
         await update_reserved_message(callback.message)
     else:
@@ -738,7 +953,7 @@ async def show_roles_list(user_id: int):
     # 📆 تاریخ روز شمسی
     today = JalaliDate.today().strftime("%Y/%m/%d")
 
-    max_players = len(scenarios[selected_scenario]["roles"])
+    max_players = scenarios[selected_scenario].seat_count
     current_players = len(players)
 
     # 📝 هدر لیست
@@ -765,10 +980,7 @@ async def show_roles_list(user_id: int):
     text += "\n◤◢◣◥◤◢◣◥◤◢◣◥\n\n༄"
 
     # 📤 ارسال پیام به پیوی گرداننده
-    try:
-        await bot.send_message(user_id, text, parse_mode="HTML")
-    except Exception as e:
-        logging.exception("⚠️ خطا در ارسال لیست نقش‌ها به گرداننده")
+    await moderator_deliveries.send(bot, user_id, text, parse_mode="HTML")
 
 # =========================
 # وضعیت نکست
@@ -847,32 +1059,31 @@ async def resend_roles_handler(callback: types.CallbackQuery):
         return
 
     # بررسی وجود نقش‌های قبلی
-    global last_role_map
-    if not last_role_map:
+    if not roster.has_roles():
         await callback.message.answer("⚠️ نقش‌ها هنوز پخش نشده‌اند؛ ابتدا «پخش نقش» در گروه را بزنید.")
         await callback.answer()
         return
 
-    # ارسال نقش به هر بازیکن
+    # ارسال نقش فقط به بازیکنانی که هنوز نقششان به دستشان نرسیده
+    uids = [rec.uid for rec in seated_records()] if player_slots else list(players.keys())
+    pending = deliveries.undelivered(uids)
+    if not pending:
+        await callback.answer("✅ نقش همهٔ بازیکنان قبلاً رسیده است.", show_alert=True)
+        return
+
     sent = 0
-    if player_slots:
-        for seat in sorted(player_slots.keys()):
-            uid = player_slots[seat]
-            role = last_role_map.get(uid, "❓")
-            try:
-                await bot.send_message(uid, f"🎭 نقش شما: {html.escape(str(role))}")
-                sent += 1
-            except Exception as e:
-                logging.warning("⚠️ ارسال نقش به %s خطا: %s", uid, e)
-    else:
-        # fallback
-        for uid in players.keys():
-            role = last_role_map.get(uid, "❓")
-            try:
-                await bot.send_message(uid, f"🎭 نقش شما: {html.escape(str(role))}")
-                sent += 1
-            except Exception as e:
-                logging.warning("⚠️ ارسال نقش به %s خطا: %s", uid, e)
+    for uid in pending:
+        role = roster.role_of(uid, "❓")
+        if await deliveries.send(bot, uid, f"🎭 نقش شما: {html.escape(str(role))}"):
+            sent += 1
+
+    unreachable_names = [players.get(uid, str(uid)) for uid in pending
+                         if deliveries.status(uid) is DeliveryStatus.FORBIDDEN]
+    if unreachable_names:
+        await callback.message.answer(
+            "📵 این بازیکنان ربات را استارت نکرده‌اند یا بلاک کرده‌اند:\n"
+            + "\n".join(f"- {html.escape(n)}" for n in unreachable_names)
+        )
 
     if sent == 0:
         await callback.message.answer("⚠️ هیچ پیامی ارسال نشد (شاید بازیکنانی پیویشان بسته است).")
@@ -880,29 +1091,10 @@ async def resend_roles_handler(callback: types.CallbackQuery):
         return
 
     # 📜 ساخت متن لیست نقش‌ها برای گرداننده
-    fancy_text = "༄\n    Mafia Nights\n\n"
-    fancy_text += "⏱ Time : 21:00\n"
-    fancy_text += f"📆 Date : {get_jalali_today()}\n"
-    fancy_text += f"🗓 Scenario : {selected_scenario}\n"
-    fancy_text += f"👮‍♂ God : {players.get(moderator_id, '❓')}\n\n"
-    fancy_text += " ~ ~ ~ ~ ~ ~ ~ ~ ~ ~ \n"
-    fancy_text += "          لیست نقش‌ها\n"
-    fancy_text += "◤◢◣◥◤◢◣◥◤◢◣◥\n\n"
-
-    for seat in sorted(player_slots.keys()):
-        uid = player_slots[seat]
-        role = last_role_map.get(uid, "❓")
-        name = players.get(uid, "❓")
-        mention = f"<a href='tg://user?id={uid}'><b>{html.escape(name)}</b></a>"
-        fancy_text += f"\u200E{seat:02d} {mention} — {html.escape(role)}\n"
-
-    fancy_text += "\n◤◢◣◥◤◢◣◥◤◢◣◥\n\n༄"
+    fancy_text = render_role_list()
 
     # ارسال لیست به گرداننده
-    try:
-        await bot.send_message(moderator_id, fancy_text, parse_mode="HTML")
-    except Exception as e:
-        logging.warning("⚠️ ارسال لیست نقش‌ها به گرداننده شکست خورد: %s", e)
+    await moderator_deliveries.send(bot, moderator_id, fancy_text, parse_mode="HTML")
 
     await callback.answer(f"✅ نقش‌ها به {sent} بازیکن ارسال شدند.")
 
@@ -915,16 +1107,15 @@ async def replace_player_list_handler(callback: types.CallbackQuery):
         await callback.answer()
         return
 
-    subs = substitute_list.get(group_chat_id, {})
-    if not subs:
+    if not substitute_list:
         await callback.message.answer("🚫 لیست جایگزین‌ها خالی است.")
         await callback.answer()
         return
 
     kb = InlineKeyboardMarkup(row_width=1)
-    for uid, info in subs.items():
-        name = info.get("name") or "❓"
-        kb.add(InlineKeyboardButton(html.escape(name), callback_data=f"choose_sub_{uid}"))
+    for uid, name in substitute_list:
+        name = name or "❓"
+        kb.add(InlineKeyboardButton(html.escape(name), callback_data=packed(Action.CHOOSE_SUB, uid)))
 
     await callback.message.answer("👥 لیست جایگزین‌ها:", reply_markup=kb)
     await callback.answer()
@@ -932,9 +1123,8 @@ async def replace_player_list_handler(callback: types.CallbackQuery):
 # -----------------------------
 # انتخاب بازیکن اصلی برای جایگزینی
 # -----------------------------
-@dp.callback_query_handler(lambda c: c.data.startswith("choose_sub_"))
-async def choose_substitute_for_replace(callback: types.CallbackQuery):
-    uid_sub = int(callback.data.replace("choose_sub_", ""))
+@codec.route(Action.CHOOSE_SUB, "q")
+async def choose_substitute_for_replace(callback: types.CallbackQuery, uid_sub):
 
     # بازیکنان فعلی
     current = {seat: players.get(uid, "❓") for seat, uid in player_slots.items()}
@@ -946,7 +1136,7 @@ async def choose_substitute_for_replace(callback: types.CallbackQuery):
     kb = InlineKeyboardMarkup(row_width=1)
     for seat, name in sorted(current.items()):
         label = f"{seat}. {html.escape(name)}"
-        kb.add(InlineKeyboardButton(label, callback_data=f"do_replace_{uid_sub}_{seat}"))
+        kb.add(InlineKeyboardButton(label, callback_data=packed(Action.DO_REPLACE, uid_sub, seat)))
 
     await callback.message.answer("👤 بازیکن جایگزین، بازیکن فعلی را انتخاب کنید:", reply_markup=kb)
     await callback.answer()
@@ -954,35 +1144,25 @@ async def choose_substitute_for_replace(callback: types.CallbackQuery):
 # -----------------------------
 # انجام جایگزینی
 # -----------------------------
-@dp.callback_query_handler(lambda c: c.data.startswith("do_replace_"))
-async def do_replace_handler(callback: types.CallbackQuery):
-    try:
-        _, _, uid_sub_str, seat_str = callback.data.split("_")
-        uid_sub = int(uid_sub_str)
-        seat = int(seat_str)
-    except Exception:
-        await callback.answer("⚠️ داده جایگزینی نامعتبر است.", show_alert=True)
-        return
-
-    subs = substitute_list.get(group_chat_id, {})
-    sub_info = subs.pop(uid_sub, None)
-    if not sub_info:
+@codec.route(Action.DO_REPLACE, "qB")
+@guard.once(game_key)
+async def do_replace_handler(callback: types.CallbackQuery, uid_sub, seat):
+    sub_name = substitute_list.pop(uid_sub)
+    if sub_name is None:
         await callback.message.answer("⚠️ جایگزینی پیدا نشد.")
         await callback.answer()
-        return
+        return UNCHANGED
 
     # بازیکن قدیمی
     old_uid = player_slots.get(seat)
     old_name = players.pop(old_uid, "❓") if old_uid in players else "❓"
 
     # جایگزین جدید
-    players[uid_sub] = sub_info.get("name", f"User{uid_sub}")
+    players[uid_sub] = sub_name or f"User{uid_sub}"
     player_slots[seat] = uid_sub
 
-    # انتقال نقش در صورت وجود
-    global last_role_map
-    if old_uid and last_role_map and old_uid in last_role_map:
-        last_role_map[uid_sub] = last_role_map.pop(old_uid)
+    # انتقال نقش و وضعیت صندلی به جایگزین
+    roster.transfer(old_uid, uid_sub, players[uid_sub], seat)
 
     await callback.message.answer(
         f"✅ بازیکن {html.escape(old_name)} با {html.escape(players[uid_sub])} جایگزین شد (صندلی {seat})."
@@ -1029,6 +1209,7 @@ async def remove_player_handler(callback: types.CallbackQuery):
 
 # پردازش تایید حذف بر اساس صندلی
 @dp.callback_query_handler(lambda c: c.data.startswith("confirm_remove_"))
+@guard.once(game_key)
 async def remove_player_confirm(callback: types.CallbackQuery):
     data = callback.data
     # دو حالت: confirm_remove_{seat} یا confirm_remove_uid_{uid}
@@ -1043,10 +1224,13 @@ async def remove_player_confirm(callback: types.CallbackQuery):
     if uid is None:
         await callback.message.answer("⚠️ بازیکن پیدا نشد.")
         await callback.answer()
-        return
+        return UNCHANGED
 
     # حذف از player_slots و players؛ و اضافه شدن به removed_players[group]
     removed_players.setdefault(group_chat_id, {})[seat] = {"id": uid, "name": players.get(uid, "❓")}
+    rec = roster.get(uid)
+    if rec:
+        rec.alive = False
     # حذف از players dict اگر موجوده
     try:
         if uid in players:
@@ -1056,6 +1240,7 @@ async def remove_player_confirm(callback: types.CallbackQuery):
 
     if seat in player_slots:
         del player_slots[seat]
+    turns.remove(seat)   # نوبت‌های باقیماندهٔ این صندلی رد می‌شوند
 
     await callback.message.answer(f"✅ بازیکن با آی‌دی {uid} حذف شد و به لیست خارج‌شده‌ها منتقل شد.")
     await callback.answer()
@@ -1089,27 +1274,32 @@ async def birthday_player_handler(callback: types.CallbackQuery):
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith("confirm_revive_"))
+@guard.once(game_key)
 async def birthday_player_confirm(callback: types.CallbackQuery):
     seat = int(callback.data.replace("confirm_revive_", ""))
     info = removed_players.get(group_chat_id, {}).pop(seat, None)
     if not info:
         await callback.message.answer("⚠️ موردی برای بازگرداندن پیدا نشد.")
         await callback.answer()
-        return
+        return UNCHANGED
 
     uid = info["id"]
     name = info.get("name", "❓")
     # بازگرداندن به players و player_slots
     players[uid] = name
     player_slots[seat] = uid
+    rec = roster.seated(seat, uid, name)
+    rec.alive = True
+    turns.revive(seat)
 
-    await callback.message.answer(f"✅ بازیکن {html.escape(name)} با صندلی {seat} بازگردانده شد.")
+    await callback.message.answer(f"✅ بازیکن {rec.mention} با صندلی {seat} بازگردانده شد.")
     await callback.answer()
 
 #=======================
 # لغو بازی
 #=======================
 @dp.callback_query_handler(lambda c: c.data.startswith("cancel_"))
+@guard.once(game_key)
 async def cancel_game_handler(callback: types.CallbackQuery):
     global players, removed_players, substitute_list, group_chat_id, lobby_active, game_running
 
@@ -1117,7 +1307,7 @@ async def cancel_game_handler(callback: types.CallbackQuery):
 
     if not group_chat_id:
         await callback.answer("🚫 هنوز هیچ بازی فعالی وجود ندارد.", show_alert=True)
-        return
+        return UNCHANGED
 
     # گرفتن لیست ادمین‌های گروه برای دسترسی
     admins = await bot.get_chat_administrators(group_chat_id)
@@ -1125,17 +1315,14 @@ async def cancel_game_handler(callback: types.CallbackQuery):
 
     if user_id != moderator_id and user_id not in admin_ids:
         await callback.answer("⛔ فقط گرداننده یا مدیران گروه می‌توانند بازی را لغو کنند.", show_alert=True)
-        return
+        return UNCHANGED
 
-    # پاک‌سازی کامل داده‌ها
-    players.clear()
-    removed_players.clear()
-    substitute_list.clear()
-    lobby_active = False
-    game_running = False
+    # پاک‌سازی کامل داده‌ها (تسک‌ها لغو و همهٔ ساختارهای بازی آزاد می‌شوند)
+    chat_id = group_chat_id
+    await end_game()
 
     try:
-        await bot.send_message(group_chat_id, "🚫 بازی لغو شد توسط گرداننده یا مدیر.")
+        await bot.send_message(chat_id, "🚫 بازی لغو شد توسط گرداننده یا مدیر.")
     except:
         pass
 
@@ -1178,46 +1365,45 @@ async def back_main(callback: types.CallbackQuery):
 # تابع کمکی برای پخش نقش‌ها
 #======================
 @dp.callback_query_handler(lambda c: c.data == "distribute_roles")
+@guard.once(game_key)
 async def distribute_roles_callback(callback: types.CallbackQuery):
-    global game_message_id, lobby_message_id, game_running, group_chat_id, last_role_map
+    global game_message_id, lobby_message_id, game_running, group_chat_id
 
     # فقط گرداننده اجازه دارد
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند نقش‌ها را پخش کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     if not selected_scenario:
         await callback.answer("❌ سناریو انتخاب نشده.", show_alert=True)
-        return
+        return UNCHANGED
+
+    # کلیک دوباره بعد از پخش (حتی بعد از تمام شدن کلیک اول) نقش‌ها را دوباره بُر نزند
+    if game_running:
+        await callback.answer("✅ نقش‌ها قبلاً پخش شده‌اند.")
+        return UNCHANGED
 
     try:
         mapping = await distribute_roles()
-        last_role_map = mapping
+        seated_records()
+        roster.assign_roles(mapping)
     except Exception as e:
         logging.exception("⚠️ مشکل در پخش نقش‌ها: %s", e)
         await callback.answer("❌ خطا در پخش نقش‌ها.", show_alert=True)
-        return
+        return UNCHANGED
 
     # نمایش لیست بازیکنان در گروه
-    seats = {seat: (uid, players.get(uid, "❓")) for seat, uid in player_slots.items()}
-    players_list = "\n".join([
-        f"{seat:02d}. <a href='tg://user?id={uid}'>{html.escape(name)}</a>"
-        for seat, (uid, name) in sorted(seats.items())
-    ])
+    players_list = "\n".join(f"{rec.seat:02d}. {rec.mention}" for rec in seated_records())
 
     text = (
         "🎭 نقش‌ها پخش شد!\n\n"
         f"👥 لیست بازیکنان:\n{players_list}\n\n"
-        "ℹ️ برای دیدن نقش به پیوی ربات بروید.\n"
+        f"{ROLE_HINT_TEXT}"
         "👑 گرداننده سر صحبت را انتخاب کند تا بازی شروع شود."
     )
 
     # ساخت کیبورد مدیریت دور
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("👑 انتخاب سر صحبت", callback_data="choose_head"))
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    kb.add(InlineKeyboardButton("⚔ چالش روشن" if challenge_active else "⚔ چالش خاموش",
-                                callback_data="challenge_toggle"))
+    kb = round_menu_keyboard()
 
     # ویرایش یا ارسال پیام بازی در گروه
     try:
@@ -1236,46 +1422,18 @@ async def distribute_roles_callback(callback: types.CallbackQuery):
         game_message_id = msg.message_id
 
     game_running = True
+    lifecycle.advance(GamePhase.RUNNING)
     # اگر Auto Start فعال است → شروع دور اول خودکار
     if addons.settings.get("auto_start", {}).get("enabled", False):
-        # ساخت turn_order بر اساس صندلی‌ها یا players
-        if player_slots:
-            seats_list = sorted(player_slots.keys())
-            turn_order = seats_list[:]
-        else:
-            turn_order = list(players.keys())
-
-        if turn_order:
-            current_turn_index = 0
-            first_seat = turn_order[current_turn_index]
-            # start_turn تابع شماست — آن را فراخوانی کن
-            await start_turn(first_seat, duration=DEFAULT_TURN_DURATION, is_challenge=False)
+        # ترتیب نوبت بر اساس صندلی‌ها یا players
+        first = turns.start(sorted(player_slots.keys()) if player_slots else list(players.keys()))
+        if first:
+            await start_turn(first.seat, duration=first.duration, is_challenge=False)
 
     await callback.answer("✅ نقش‌ها پخش شد!")
 
     # 💠 ارسال لیست نقش‌ها به گرداننده (مثل resend_roles)
-    try:
-        fancy_text = "༄\n    Mafia Nights\n\n"
-        fancy_text += "⏱ Time : 21:00\n"
-        fancy_text += f"📆 Date : {get_jalali_today()}\n"
-        fancy_text += f"🗓 Scenario : {selected_scenario}\n"
-        fancy_text += f"👮‍♂ God : {players.get(moderator_id, '❓')}\n\n"
-        fancy_text += " ~ ~ ~ ~ ~ ~ ~ ~ ~ ~ \n"
-        fancy_text += "          لیست نقش‌ها\n"
-        fancy_text += "◤◢◣◥◤◢◣◥◤◢◣◥\n\n"
-
-        for seat in sorted(player_slots.keys()):
-            uid = player_slots[seat]
-            role = last_role_map.get(uid, "❓")
-            name = players.get(uid, "❓")
-            mention = f"<a href='tg://user?id={uid}'><b>{html.escape(name)}</b></a>"
-            fancy_text += f"\u200E{seat:02d} {mention} — {html.escape(role)}\n"
-
-        fancy_text += "\n◤◢◣◥◤◢◣◥◤◢◣◥\n\n༄"
-
-        await bot.send_message(moderator_id, fancy_text, parse_mode="HTML")
-    except Exception as e:
-        logging.warning("⚠️ ارسال لیست نقش‌ها به گرداننده شکست خورد: %s", e)
+    await moderator_deliveries.send(bot, moderator_id, render_role_list(), parse_mode="HTML")
 
 
 #==================
@@ -1285,7 +1443,7 @@ async def distribute_roles_callback(callback: types.CallbackQuery):
 # =========================
 @dp.message_handler(lambda m: m.chat.type in ["group", "supergroup"] and not m.text.startswith("/"))
 async def text_commands_handler(message: types.Message):
-    text = message.text.strip().lower()
+    text = normalize(message.text)
     group_id = message.chat.id
 
     # helper: تعیین لیست uidهای بازیکنان برای گروه جاری با چند fallback
@@ -1408,47 +1566,84 @@ def join_menu():
 # منوی مدیریت بازی
 # -----------------------------
 def manage_game_keyboard(group_id: int):
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("👥 لیست بازیکنان", callback_data="list_players"))
-    kb.add(InlineKeyboardButton("📤 ارسال نقش", callback_data="resend_roles"))
-    kb.add(InlineKeyboardButton("🗑 حذف بازیکن", callback_data="remove_player"))
-    kb.add(InlineKeyboardButton("🔄 جایگزین بازیکن", callback_data="replace_player"))
-    kb.add(InlineKeyboardButton("🎂 تولد بازیکن", callback_data="player_birthday"))
-    kb.add(InlineKeyboardButton("⚔ وضعیت چالش", callback_data="challenge_status"))
-    kb.add(
-        InlineKeyboardButton(
-            f"⏭ نکست بازیکن: {'فعال' if next_by_players_enabled else 'غیرفعال'}",
-            callback_data="toggle_next_player_pm"
-        )
-    )
-    kb.add(
-        InlineKeyboardButton(
-            f"⏭ نکست گرداننده: {'فعال' if next_by_moderator_enabled else 'غیرفعال'}",
-            callback_data="toggle_next_moderator_pm"
-        )
+    return templates.get(
+        ("manage_game", group_id, next_by_players_enabled, next_by_moderator_enabled),
+        lambda: keyboard_json([[templates.button(text, data)] for text, data in (
+            ("👥 لیست بازیکنان", "list_players"),
+            ("📤 ارسال نقش", "resend_roles"),
+            ("🗑 حذف بازیکن", "remove_player"),
+            ("🔄 جایگزین بازیکن", "replace_player"),
+            ("🎂 تولد بازیکن", "player_birthday"),
+            ("⚔ وضعیت چالش", "challenge_status"),
+            (f"⏭ نکست بازیکن: {'فعال' if next_by_players_enabled else 'غیرفعال'}", "toggle_next_player_pm"),
+            (f"⏭ نکست گرداننده: {'فعال' if next_by_moderator_enabled else 'غیرفعال'}", "toggle_next_moderator_pm"),
+            ("⚙️ تنظیم گرداننده", "manage_moderator"),
+            ("🚫 لغو بازی", f"cancel_{group_id}"),
+            ("⬅️ بازگشت", "back_main"),
+        )])
     )
 
-    kb.add(InlineKeyboardButton("⚙️ تنظیم گرداننده", callback_data="manage_moderator"))
-    kb.add(InlineKeyboardButton("🚫 لغو بازی", callback_data=f"cancel_{group_id}"))
-    kb.add(InlineKeyboardButton("⬅️ بازگشت", callback_data="back_main"))
-    return kb
+def round_menu_keyboard(head_label="👑 انتخاب سر صحبت", with_head=True):
+    """کیبورد «انتخاب سر صحبت / شروع دور / چالش» — فقط به وضعیت چالش بستگی دارد"""
+    def build():
+        rows = []
+        if with_head:
+            rows.append([templates.button(head_label, "choose_head")])
+        rows.append([templates.button("▶ شروع دور", "start_round")])
+        rows.append([templates.button("⚔ چالش روشن" if challenge_active else "⚔ چالش خاموش", "challenge_toggle")])
+        rows.append([templates.button("🎭 نقش من", "my_role")])
+        return keyboard_json(rows)
+    return templates.get(("round_menu", head_label, with_head, challenge_active), build)
+
+def turn_text(prefix, mention, remaining):
+    return f"{prefix} ⏳ {remaining//60:02d}:{remaining%60:02d}\n🎙 نوبت صحبت {mention} است. ({remaining} ثانیه)"
+
+def turn_prefix(is_challenge=False):
+    color = addons.settings.get("color", {})
+    if is_challenge and color.get("challenge", True):
+        return "🟥"
+    if color.get("primary", True):
+        return "🟦"
+    return ""
+
+# ======================
+# اعلام نوبت بعدی از قبل ساخته شده
+# بعد از هر start_turn متن و کیبورد نفر بعدی ساخته می‌شود تا با زدن «نکست»
+# فقط یک send/edit لازم باشد. کلید شامل همهٔ چیزهایی است که روی متن/کیبورد اثر دارند؛
+# اگر از آن موقع چیزی عوض شده باشد (بازیکن، اسم، رنگ، وضعیت چالش) دوباره ساخته می‌شود.
+# ======================
+def announcement_key(seat, duration, is_challenge=False):
+    uid = player_slots.get(seat)
+    # اسم نمایشی هم جزو کلید است تا بعد از تنظیم نیک‌نیم منشن قدیمی اعلام نشود
+    return (seat, uid, players.get(uid), duration, bool(is_challenge),
+            turn_prefix(is_challenge), show_challenge_request(seat, is_challenge))
+
+def render_turn(seat, duration, is_challenge=False):
+    rec = seat_record(seat)
+    return (turn_text(turn_prefix(is_challenge), rec.mention, duration),
+            turn_keyboard(seat, is_challenge))
+
+def prerender_next_turn():
+    global next_announcement
+    nxt = turns.peek()
+    if nxt and nxt.seat in player_slots:
+        next_announcement = (announcement_key(nxt.seat, nxt.duration, nxt.is_challenge),
+                             *render_turn(nxt.seat, nxt.duration, nxt.is_challenge))
+    else:
+        next_announcement = None
+
+def take_announcement(seat, duration, is_challenge=False):
+    """(text, kb) نوبت؛ اگر از قبل ساخته و هنوز معتبر است همان را برمی‌گرداند"""
+    if next_announcement is not None and next_announcement[0] == announcement_key(seat, duration, is_challenge):
+        return next_announcement[1], next_announcement[2]
+    return render_turn(seat, duration, is_challenge)
 
-# =========================
-# توابع کمکی
-# =========================
-# پیام موقتی
-async def send_temp_message(chat_id, text, delay=5, **kwargs):
-    msg = await bot.send_message(chat_id, text, **kwargs)
-    await asyncio.sleep(delay)
-    try:
-        await bot.delete_message(chat_id, msg.message_id)
-    except:
-        pass
 
 # ======================
 # انتخاب / لغو انتخاب صندلی
 # ======================
 @dp.callback_query_handler(lambda c: c.data.startswith("slot_"))
+@guard.once(game_key)
 async def handle_slot(callback: types.CallbackQuery):
     global player_slots, player_slots
     user = callback.from_user
@@ -1456,16 +1651,16 @@ async def handle_slot(callback: types.CallbackQuery):
     
     if not selected_scenario:
         await callback.answer("❌ هنوز سناریویی انتخاب نشده.", show_alert=True)
-        return
+        return UNCHANGED
     try:
         seat_number = int(callback.data.split("_", 1)[1])
     except Exception:
         await callback.answer("⚠ شماره صندلی نامعتبر است.", show_alert=True)
-        return
+        return UNCHANGED
         
     if user.id not in players:
         await callback.answer("❌ ابتدا وارد بازی شوید.", show_alert=True)
-        return   
+        return UNCHANGED
         
         
     slot_num = int(callback.data.replace("slot_", ""))
@@ -1482,7 +1677,7 @@ async def handle_slot(callback: types.CallbackQuery):
         # اگه جایگاه پر باشه
         if seat_number in player_slots and player_slots[seat_number] != user.id:
             await callback.answer("❌ این صندلی قبلاً رزرو شده است.", show_alert=True)
-            return
+            return UNCHANGED
         # اگه بازیکن قبلاً جای دیگه نشسته → اون رو آزاد کن
     for seat, uid in list(player_slots.items()):
         if uid == user.id:
@@ -1492,53 +1687,26 @@ async def handle_slot(callback: types.CallbackQuery):
     await callback.answer(f"✅ صندلی {seat_number} برای شما رزرو شد.")        
     await update_lobby()
     
-def turn_keyboard(seat, is_challenge=False):
-    kb = InlineKeyboardMarkup(row_width=2)
-
-    # =============================
-    # مدیریت دکمه نکست (بر اساس تنظیمات امنیتی)
-    # =============================
-    allow_player_next = addons.settings.get("next", {}).get("player_enabled", True)
-    allow_mod_next = addons.settings.get("next", {}).get("moderator_enabled", True)
-
-    # تشخیص اینکه این بازیکن اجازه نکست دارد یا نه
-    can_use_next = True
-    if not allow_player_next:
-        # اگر بازیکن بود و نکست بازیکن خاموش → دکمه حذف می‌شود
-        pass
-
-    # اگر فقط گرداننده حق نکست دارد → دکمه فقط برای او نمایش داده می‌شود
-    # (اما aiogram خودش در handler هم چک می‌کند → دو لایه امنیت)
-    kb.add(InlineKeyboardButton("⏭ نکست", callback_data=f"next_{seat}"))
-
-    # =============================
-    # مدیریت چالش‌ها
-    # =============================
-    if not is_challenge:
-        if not challenge_active:
-            return kb
+def show_challenge_request(seat, is_challenge=False):
+    # دکمهٔ «درخواست چالش» فقط در نوبت عادی، وقتی چالش روشن است و
+    # بازیکن این صندلی نه در حال چالش است و نه درخواست pending دارد
+    if is_challenge or not challenge_active:
+        return False
+    player_id = player_slots.get(seat)
+    if not player_id or seat in active_challenger_seats:
+        return False
+    return not challenge_queue.has_pending_from(seat)
 
-        player_id = player_slots.get(seat)
-        if player_id:
+def turn_keyboard(seat, is_challenge=False):
+    show_request = show_challenge_request(seat, is_challenge)
 
-            # اگر این بازیکن در حال چالش است → دکمه درخواست نمایش داده نشود
-            if seat in active_challenger_seats:
-                return kb
+    def build():
+        rows = [[templates.button("⏭ نکست", f"next_{seat}")]]
+        if show_request:
+            rows.append([templates.button("⚔ درخواست چالش", f"challenge_request_{seat}")])
+        return keyboard_json(rows)
 
-            # اگر چالشی pending دارد → درخواست جدید نده
-            already_pending = any(
-                reqs.get(player_id) == "pending"
-                for reqs in challenge_requests.values()
-            )
-            if not already_pending:
-                kb.add(
-                    InlineKeyboardButton(
-                        "⚔ درخواست چالش",
-                        callback_data=f"challenge_request_{seat}"
-                    )
-                )
-
-    return kb
+    return templates.get(("turn_kb", seat, show_request), build)
 
 
 # =======================
@@ -1735,6 +1903,9 @@ async def birthday_player_confirm(callback: types.CallbackQuery):
 @dp.message_handler(commands=["start"])
 async def start_cmd(message: types.Message):
     if message.chat.type == "private":
+        # کاربر ربات را استارت کرد → دوباره قابل دسترس است
+        unreachable.forget(message.from_user.id)
+
         # منوی پیوی ربات
         kb = InlineKeyboardMarkup(row_width=1)
         kb.add(InlineKeyboardButton("🛠 مدیریت بازی", callback_data="manage_game"))
@@ -1765,12 +1936,15 @@ async def start_game(callback: types.CallbackQuery):
         await callback.answer("❌ این ربات فقط در گروه اصلی کار می‌کند.", show_alert=True)
         return
 
-    global group_chat_id, lobby_active, admins, lobby_message_id
+    global group_chat_id, lobby_active, admins, lobby_message_id, game_nonce
 
     # فقط در گروه: شروع لابی
     if callback.message.chat.type != "private":
         group_chat_id = callback.message.chat.id
         lobby_active = True    # فقط لابی فعال، بازی هنوز شروع نشده
+        lifecycle.advance(GamePhase.LOBBY)
+        game_nonce = random.getrandbits(16)
+        roster.clear()
         admins = {member.user.id for member in await bot.get_chat_administrators(group_chat_id)}
 
         msg = await callback.message.reply(
@@ -1802,7 +1976,12 @@ async def choose_scenario(callback: types.CallbackQuery):
 @dp.callback_query_handler(lambda c: c.data.startswith("scenario_"))
 async def scenario_selected(callback: types.CallbackQuery):
     global selected_scenario
-    selected_scenario = callback.data.replace("scenario_", "")
+    name = callback.data.replace("scenario_", "")
+    if name not in scenarios:
+        await callback.answer("⚠ این سناریو وجود ندارد.", show_alert=True)
+        return
+    selected_scenario = name
+    set_max_seats_from_scenario(selected_scenario)
     await callback.message.edit_text(
         f"📝 سناریو انتخاب شد: {selected_scenario}\nحالا گرداننده را انتخاب کنید.",
         reply_markup=game_menu_keyboard()
@@ -1860,6 +2039,7 @@ async def moderator_selected(callback: types.CallbackQuery):
 # ورود و انصراف
 # ======================
 @dp.callback_query_handler(lambda c: c.data == "join_game")
+@guard.once(game_key)
 async def join_game_callback(callback: types.CallbackQuery):
     global players, player_slots
 
@@ -1868,26 +2048,27 @@ async def join_game_callback(callback: types.CallbackQuery):
     # جلوگیری از ورود در حین بازی
     if game_running:
         await callback.answer("❌ بازی در جریان است. نمی‌توانید وارد شوید.", show_alert=True)
-        return
+        return UNCHANGED
 
     # جلوگیری از ورود دوباره بازیکن
     if user.id in players:
         await callback.answer("⚠️ شما از قبل در لیست هستید.", show_alert=True)
-        return
+        return UNCHANGED
 
     # ظرفیت سناریو
     if not selected_scenario:
         await callback.answer("⚠️ لطفاً اول سناریو انتخاب کنید.", show_alert=True)
-        return
+        return UNCHANGED
 
-    max_players = len(scenarios[selected_scenario]["roles"])
+    max_players = scenarios[selected_scenario].seat_count
     if len(player_slots) >= max_players:
         # اضافه به لیست رزرو
-        if not any(w["id"] == user.id for w in waiting_list):
-            waiting_list.append({"id": user.id, "name": user.full_name})
+        if user.id in waiting_list:
+            await callback.answer("⚠️ شما در لیست رزرو هستید.", show_alert=True)
+        elif waiting_list.join(user.id, user.full_name):
             await callback.answer("✅ شما به لیست رزرو اضافه شدید.")
         else:
-            await callback.answer("⚠️ شما در لیست رزرو هستید.", show_alert=True)
+            await callback.answer("⚠️ لیست رزرو پر است.", show_alert=True)
     else:
         # ثبت در لیست اصلی
         players[user.id] = user.full_name
@@ -1904,6 +2085,7 @@ async def join_game_callback(callback: types.CallbackQuery):
 # خروج از بازی
 #================================
 @dp.callback_query_handler(lambda c: c.data == "leave_game")
+@guard.once(game_key)
 async def leave_game_callback(callback: types.CallbackQuery):
     global players, player_slots, waiting_list, waiting_message_id
 
@@ -1912,54 +2094,76 @@ async def leave_game_callback(callback: types.CallbackQuery):
     # جلوگیری از خروج در حین بازی
     if game_running:
         await callback.answer("❌ بازی در جریان است. نمی‌توانید خارج شوید.", show_alert=True)
-        return
+        return UNCHANGED
 
     # پیدا کردن صندلی بازیکن
     seat = next((s for s, uid in player_slots.items() if uid == user_id), None)
     if seat is None:
         await callback.answer("⚠️ شما در لیست اصلی نیستید.", show_alert=True)
-        return
+        return UNCHANGED
 
-    # حذف بازیکن
+    # حذف بازیکن + نشستن خودکار نفر اول رزرو روی صندلی آزاد شده
     player_slots.pop(seat, None)
     players.pop(user_id, None)
+    promoted = promote_next_reserve(seat)
     await callback.answer("❌ شما از بازی خارج شدید.")
+
+    # یک آپدیت لابی (جایگزینی هم در همان پیام اعلام می‌شود)
     await update_lobby()
+    if promoted and waiting_message_id:
+        await update_waiting_list_message()
+
+# ======================
+# جایگزینی خودکار از لیست رزرو
+# ======================
+def promote_next_reserve(seat):
+    """
+    اولین نفر لیست رزرو را روی صندلی آزاد شده می‌نشاند (فقط در لابی).
+    خروجی: (user_id, name) یا None
+    """
+    global lobby_notice
 
-    # اگر لیست رزرو خالی نبود → جایگزین کن
-    if waiting_list:
-        sub = waiting_list.pop(0)
-        player_slots[seat] = sub["id"]
-        players[sub["id"]] = sub["name"]
+    if game_running or seat is None or seat in player_slots:
+        return None
 
-        await bot.send_message(group_chat_id, f"♻️ {sub['name']} جایگزین شد (صندلی {seat}).")
-        await update_lobby()
+    nxt = waiting_list.pop_next()
+    if not nxt:
+        return None
 
-        # اگه لیست رزرو خالی شد → پیام رزرو رو حذف کن
-        if not waiting_list and waiting_message_id:
-            try:
-                await bot.delete_message(group_chat_id, waiting_message_id)
-            except:
-                pass
-            waiting_message_id = None
+    uid, name = nxt
+    player_slots[seat] = uid
+    players[uid] = name
+    lobby_notice = f"♻️ {templates.mention(uid, name)} از لیست رزرو جایگزین شد (صندلی {seat})."
+    return nxt
 
 # ======================
 # بروزرسانی لابی
 # ======================
 async def update_lobby():
-    global lobby_message_id
+    global lobby_message_id, lobby_notice
 
     if not group_chat_id:
         return
 
+    scen = scenarios.get(selected_scenario)
+
     text = f"📋 <b>لیست بازی:</b>\n"
-    text += f"سناریو: {selected_scenario or 'انتخاب نشده'}\n\n"
+    text += f"سناریو: {selected_scenario or 'انتخاب نشده'}\n"
+    if scen:
+        balance = dict(scen.faction_balance)
+        text += (f"👥 {len(player_slots)}/{scen.seat_count} (حداقل {scen.min_players}) | "
+                 f"🔴 مافیا {balance[MAFIA]} · 🟢 شهر {balance[CITIZEN]}")
+        if balance[INDEPENDENT]:
+            text += f" · ⚪ مستقل {balance[INDEPENDENT]}"
+        text += "\n"
+    text += "\n"
 
     # 👤 گرداننده
     if moderator_id:
         try:
             moderator = await bot.get_chat_member(group_chat_id, moderator_id)
-            text += f"👤 گرداننده: {html.escape(moderator.user.full_name)}\n\n"
+            mark = " 📵" if moderator_id in unreachable else ""
+            text += f"👤 گرداننده: {html.escape(moderator.user.full_name)}{mark}\n\n"
         except:
             text += "👤 گرداننده: انتخاب نشده\n\n"
     else:
@@ -1967,64 +2171,66 @@ async def update_lobby():
 
     # 👥 بازیکنان اصلی
     if players:
+        seat_of = {u: s for s, u in player_slots.items()}
         for uid, name in players.items():
-            seat = next((s for s, u in player_slots.items() if u == uid), None)
-            seat_str = f" (صندلی {seat})" if seat else ""
-            text += f"- <a href='tg://user?id={uid}'>{html.escape(name)}</a>{seat_str}\n"
+            seat = seat_of.get(uid)
+            # 📵 = قبلاً پیوی‌اش در دسترس نبوده (بلاک/استارت نکرده)
+            mark = " 📵" if uid in unreachable else ""
+            if seat:
+                text += f"- {roster.seated(seat, uid, name).mention} (صندلی {seat}){mark}\n"
+            else:
+                text += f"- {templates.mention(uid, name)}{mark}\n"
     else:
         text += "هیچ بازیکنی وارد بازی نشده است.\n"
 
-    kb = InlineKeyboardMarkup(row_width=5)
+    rows = []
 
-    if selected_scenario:
-        max_players = len(scenarios[selected_scenario]["roles"])
+    if scen:
+        max_players = scen.seat_count
 
-        # 🎯 دکمه‌های صندلی
+        # 🎯 دکمه‌های صندلی (۵ تا در هر ردیف)
+        seat_buttons = []
         for i in range(1, max_players + 1):
             if i in player_slots:
                 player_name = players.get(player_slots[i], "❓")
-                kb.insert(InlineKeyboardButton(f"{i} ({player_name})", callback_data=f"slot_{i}"))
+                seat_buttons.append(templates.button(f"{i} ({player_name})", f"slot_{i}"))
             else:
-                kb.insert(InlineKeyboardButton(str(i), callback_data=f"slot_{i}"))
+                seat_buttons.append(templates.button(str(i), f"slot_{i}"))
+        rows.extend(chunk(seat_buttons, 5))
 
         # 🎯 ورود/خروج یا غیرفعال شدن
         if len(player_slots) >= max_players:
-            kb.row(
-                InlineKeyboardButton("🚫 لیست پر شده", callback_data="full_list"),
-                InlineKeyboardButton("❌ خروج از بازی", callback_data="leave_game"),
-            )    
-            
+            rows.append([templates.button("🚫 لیست پر شده", "full_list"),
+                         templates.button("❌ خروج از بازی", "leave_game")])
+
             # لیست رزرو
             if waiting_list:
                 text += "\n\n📌 <b>لیست رزرو:</b>\n"
-                for w in waiting_list:
-                    text += f"- <a href='tg://user?id={w['id']}'>{html.escape(w['name'])}</a>\n"
+                for uid, name in waiting_list:
+                    text += f"- {templates.mention(uid, name)}\n"
             else:
                 text += "\n\n📌 لیست رزرو خالی است."
 
-            kb.row(
-                InlineKeyboardButton("📝 رزرو", callback_data="join_waiting"),
-                InlineKeyboardButton("❌ کنسل", callback_data="leave_waiting"),
-            )
+            rows.append([templates.button("📝 رزرو", "join_waiting"),
+                         templates.button("❌ کنسل", "leave_waiting")])
         else:
-            kb.row(
-                InlineKeyboardButton("✅ ورود به بازی", callback_data="join_game"),
-                InlineKeyboardButton("❌ خروج از بازی", callback_data="leave_game"),
-            )
+            rows.append([templates.button("✅ ورود به بازی", "join_game"),
+                         templates.button("❌ خروج از بازی", "leave_game")])
 
-            
     # 🎭 پخش نقش
-    if selected_scenario and moderator_id:
-        min_players = scenarios[selected_scenario]["min_players"]
-        max_players = len(scenarios[selected_scenario]["roles"])
-        if min_players <= len(players) <= max_players:
-            kb.add(InlineKeyboardButton("🎭 پخش نقش", callback_data="distribute_roles"))
-         # 🎭 پخش نقش
-
+    if scen and moderator_id:
+        if scen.accepts(len(players)):
+            rows.append([templates.button("🎭 پخش نقش", "distribute_roles")])
 
     # 🚫 لغو بازی
     if moderator_id and moderator_id in admins:
-        kb.add(InlineKeyboardButton("🚫 لغو بازی", callback_data="cancel_game"))
+        rows.append([templates.button("🚫 لغو بازی", "cancel_game")])
+
+    kb = keyboard_json(rows)
+
+    if lobby_notice:
+        text += f"\n\n{lobby_notice}"
+        lobby_notice = None
 
     # 🔄 بروزرسانی پیام
     try:
@@ -2049,7 +2255,7 @@ async def update_waiting_list_message():
     پیام لیست رزرو را ایجاد یا آپدیت می‌کند.
     اگر لیست رزرو خالی شود، پیام حذف می‌شود.
     """
-    global waiting_message_id, waiting_list, group_chat_id
+    global waiting_message_id, waiting_list, group_chat_id, waiting_message_text
 
     # اگر لیست رزرو خالی است → پیام را پاک کن (اگه وجود دارد) و تمام
     if not waiting_list:
@@ -2059,13 +2265,13 @@ async def update_waiting_list_message():
             except:
                 pass
             waiting_message_id = None
+            waiting_message_text = None
         return
 
     # ساخت متن لیست رزرو
     text = "📢 <b>لیست رزرو</b>\n\n"
-    for idx, item in enumerate(waiting_list, start=1):
-        name = item.get("name", "❓")
-        text += f"{idx}. {html.escape(name)}\n"
+    for idx, (uid, name) in enumerate(waiting_list, start=1):
+        text += f"{idx}. {html.escape(name or '❓')}\n"
 
     text += "\nاگر می‌خواید جایگزین شوید، روی «💺 رزرو» بزنید.\nبرای انصراف از رزرو «❌ کنسل»."
 
@@ -2075,26 +2281,26 @@ async def update_waiting_list_message():
         InlineKeyboardButton("❌ کنسل", callback_data="cancel_waiting")
     )
 
+    # اگر متن عوض نشده → نیازی به edit نیست
+    if waiting_message_id and text == waiting_message_text:
+        return
+
     # اگر قبلاً پیام وجود داشت → ویرایشش کن، در غیر این صورت ارسال جدید
     if waiting_message_id:
         try:
             await bot.edit_message_text(text, chat_id=group_chat_id, message_id=waiting_message_id,
                                         parse_mode="HTML", reply_markup=kb)
+            waiting_message_text = text
             return
         except Exception:
             # اگر ویرایش موفق نبود (مثلاً پیام پاک شده)، پیام جدید ارسال کن
-            try:
-                msg = await bot.send_message(group_chat_id, text, parse_mode="HTML", reply_markup=kb)
-                waiting_message_id = msg.message_id
-                return
-            except Exception:
-                return
-    else:
-        try:
-            msg = await bot.send_message(group_chat_id, text, parse_mode="HTML", reply_markup=kb)
-            waiting_message_id = msg.message_id
-        except Exception:
-            return
+            pass
+    try:
+        msg = await bot.send_message(group_chat_id, text, parse_mode="HTML", reply_markup=kb)
+        waiting_message_id = msg.message_id
+        waiting_message_text = text
+    except Exception:
+        return
 
 #==========================
 # ورود به رزرو
@@ -2109,12 +2315,14 @@ async def join_waiting_handler(callback: types.CallbackQuery):
         return
 
     # ✅ اگر از قبل در رزرو هست → تکراری نره
-    if any(w["id"] == user.id for w in waiting_list):
+    if user.id in waiting_list:
         await callback.answer("⚠️ شما قبلاً در لیست رزرو هستید.", show_alert=True)
         return
 
     # ✅ اضافه به رزرو
-    waiting_list.append({"id": user.id, "name": user.full_name})
+    if not waiting_list.join(user.id, user.full_name):
+        await callback.answer("⚠️ لیست رزرو پر است.", show_alert=True)
+        return
     await callback.answer("✅ شما به لیست رزرو اضافه شدید.", show_alert=True)
 
     await update_lobby()
@@ -2127,10 +2335,7 @@ async def leave_waiting_handler(callback: types.CallbackQuery):
     user = callback.from_user
 
     # ✅ بررسی وجود در رزرو
-    before = len(waiting_list)
-    waiting_list[:] = [w for w in waiting_list if w["id"] != user.id]
-
-    if len(waiting_list) < before:
+    if waiting_list.leave(user.id):
         await callback.answer("✅ شما از لیست رزرو خارج شدید.", show_alert=True)
     else:
         await callback.answer("⚠️ شما در لیست رزرو نبودید.", show_alert=True)
@@ -2154,30 +2359,20 @@ async def cancel_game(callback: types.CallbackQuery):
     await callback.answer()
 
 @dp.callback_query_handler(lambda c: c.data == "confirm_cancel")
+@guard.once(game_key)
 async def confirm_cancel(callback: types.CallbackQuery):
-    global players, player_slots, game_running, selected_scenario, moderator_id, lobby_message_id
-    players.clear()
-    player_slots.clear()
-    game_running = False
-    selected_scenario = None
-    moderator_id = None
-    lobby_message_id = None
-    # ریست کردن متغیرهای چالش
-    pending_challenges.clear()
-    challenge_mode = False
-    paused_main_player = None
-    paused_main_duration = None
-
-    # یک بار ویرایش کن
-    msg = await callback.message.edit_text("🚫 بازی لغو شد.")
-    await callback.answer()
+    # ریست کامل بازی (قبلاً فقط بخشی پاک می‌شد و challenge_mode/paused_* بدون global محلی بودند)
+    # اول end_game تا تمام شود (تایمرها لغو شوند و پیامی بعد از «لغو شد» نیاید)، بعد ویرایش پیام و جواب callback همزمان
+    await end_game()
+    msg, _ = await gather_calls(
+        callback.message.edit_text("🚫 بازی لغو شد."),
+        callback.answer(),
+        label="confirm_cancel",
+    )
 
     # بعد ۵ ثانیه پاکش کن
-    await asyncio.sleep(5)
-    try:
-        await bot.delete_message(callback.message.chat.id, msg.message_id)
-    except:
-        pass
+    if isinstance(msg, types.Message):
+        deleter.schedule(msg.chat.id, msg.message_id, delay=5)
 
 @dp.callback_query_handler(lambda c: c.data == "back_to_lobby")
 async def back_to_lobby(callback: types.CallbackQuery):
@@ -2188,17 +2383,23 @@ async def back_to_lobby(callback: types.CallbackQuery):
 # تابع کمکی برای پخش نقش‌ها
 #======================
 @dp.callback_query_handler(lambda c: c.data == "distribute_roles")
+@guard.once(game_key)
 async def distribute_roles_callback(callback: types.CallbackQuery):
     global game_message_id, lobby_message_id, game_running
 
     # فقط گرداننده اجازه دارد
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند نقش‌ها را پخش کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     if not selected_scenario:
         await callback.answer("❌ سناریو انتخاب نشده.", show_alert=True)
-        return
+        return UNCHANGED
+
+    # کلیک دوباره بعد از پخش (حتی بعد از تمام شدن کلیک اول) نقش‌ها را دوباره بُر نزند
+    if game_running:
+        await callback.answer("✅ نقش‌ها قبلاً پخش شده‌اند.")
+        return UNCHANGED
 
     try:
         mapping = await distribute_roles()
@@ -2206,27 +2407,19 @@ async def distribute_roles_callback(callback: types.CallbackQuery):
     except Exception as e:
         logging.exception("⚠️ مشکل در پخش نقش‌ها: %s", e)
         await callback.answer("❌ خطا در پخش نقش‌ها.", show_alert=True)
-        return
+        return UNCHANGED
 
     # نمایش خلاصه در گروه و تبديل پیام لابی به پیام بازی (game_message_id)
-    seats = {seat: (uid, players.get(uid, "❓")) for seat, uid in player_slots.items()}
-    players_list = "\n".join([f"{seat}. <a href='tg://user?id={uid}'>{html.escape(name)}</a>" for seat, (uid, name) in sorted(seats.items())])
+    players_list = "\n".join(f"{rec.seat}. {rec.mention}" for rec in seated_records())
 
     text = (
         "🎭 نقش‌ها پخش شد!\n\n"
         f"👥 لیست بازیکنان:\n{players_list}\n\n"
-        "ℹ️ برای دیدن نقش به پیوی ربات بروید.\n"
+        f"{ROLE_HINT_TEXT}"
         "👑 گرداننده سر صحبت را انتخاب کند تا بازی شروع شود."
     )
 
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("👑 انتخاب سر صحبت", callback_data="choose_head"))
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    
-    if challenge_active:
-        kb.add(InlineKeyboardButton("⚔ چالش روشن", callback_data="challenge_toggle"))
-    else:
-        kb.add(InlineKeyboardButton("⚔ چالش خاموش", callback_data="challenge_toggle"))
+    kb = round_menu_keyboard()
 
     try:
         if lobby_message_id:
@@ -2242,32 +2435,26 @@ async def distribute_roles_callback(callback: types.CallbackQuery):
         game_message_id = msg.message_id
 
     game_running = True
+    lifecycle.advance(GamePhase.RUNNING)
     await callback.answer("✅ نقش‌ها پخش شد!")
     # اگر Auto Start فعال است → شروع دور اول خودکار
     if addons.settings.get("auto_start", {}).get("enabled", False):
-    # ساخت turn_order مثل start_round_handler
-        if player_slots:
-            seats_list = sorted(player_slots.keys())
-            turn_order = seats_list[:]
-        else:
-            turn_order = list(players.keys())
-
-    # اگر خالی نیست → شروع دور اول
-        if turn_order:
-            current_turn_index = 0
-            first_seat = turn_order[current_turn_index]
-            # start_turn در کد شما هست — همان تابع را صدا بزن
-            await start_turn(first_seat, duration=DEFAULT_TURN_DURATION, is_challenge=False)
+        # ترتیب نوبت مثل start_round_handler
+        first = turns.start(sorted(player_slots.keys()) if player_slots else list(players.keys()))
+        if first:
+            await start_turn(first.seat, duration=first.duration, is_challenge=False)
 
 async def distribute_roles():
     """
-    نقش‌ها را به پیوی بازیکنان می‌فرستد و mapping از user_id -> role برمی‌گرداند.
+    نقش‌ها را پخش می‌کند و mapping از user_id -> role برمی‌گرداند.
+    بازیکنان نقش را با دکمهٔ «🎭 نقش من» در گروه می‌بینند؛ ارسال در پیوی فقط
+    وقتی است که در تنظیمات افزونه روشن شده باشد.
     ترتیب اختصاص نقش: اگر صندلی رزرو شده باشد بر اساس شماره صندلی، در غیر اینصورت بر اساس insertion-order players.
     """
     if not selected_scenario:
         raise ValueError("سناریو انتخاب نشده")
 
-    roles_template = scenarios[selected_scenario]["roles"]
+    roles_template = scenarios[selected_scenario].roles
     # ترتیب بازیکنان: بر اساس صندلی اگر موجود باشد، وگرنه بر اساس players.keys()
     if player_slots:
         player_ids = [player_slots[s] for s in sorted(player_slots.keys())]
@@ -2284,50 +2471,42 @@ async def distribute_roles():
 
     random.shuffle(roles)
 
-    mapping = {}
-    for pid, role in zip(player_ids, roles):
-        mapping[pid] = role
-        try:
-            await bot.send_message(pid, f"🎭 نقش شما: {html.escape(str(role))}")
-        except Exception as e:
-            # به گرداننده اطلاع بده که ارسال به یکی از بازیکنان شکست خورد
-            logging.warning("⚠️ ارسال نقش به %s شکست خورد: %s", pid, e)
-            if moderator_id:
-                try:
-                    await bot.send_message(moderator_id, f"⚠ نمی‌توانم نقش را به {players.get(pid, pid)} ارسال کنم.")
-                except:
-                    pass
+    mapping = dict(zip(player_ids, roles))
+    deliveries.clear()   # نقش‌های جدید؛ تحویل‌های قبلی دیگر معتبر نیستند
+    failed = []
+    for pid, role in (mapping.items() if addons.is_role_dm_enabled() else ()):
+        if not await deliveries.send(bot, pid, f"🎭 نقش شما: {html.escape(str(role))}"):
+            failed.append(players.get(pid, str(pid)))
+
+    # به گرداننده یک‌جا اطلاع بده که ارسال به کدام بازیکنان شکست خورد (parse_mode پیش‌فرض HTML است)
+    if failed and moderator_id:
+        await moderator_deliveries.send(bot, moderator_id, "⚠ نمی‌توانم نقش را به این بازیکنان ارسال کنم:\n"
+                                        + "\n".join(f"- {html.escape(n)}" for n in failed))
 
     # ارسال لیست نقش‌ها به گرداننده (اگر وجود داشته باشد)
     if moderator_id:
         text = "📜 لیست نقش‌ها:\n"
         for pid, role in mapping.items():
-            text += f"{players.get(pid,'❓')} → {role}\n"
-        try:
-            await bot.send_message(moderator_id, text)
-        except Exception:
-            pass
+            text += f"{html.escape(players.get(pid, '❓'))} → {html.escape(str(role))}\n"
+        await moderator_deliveries.send(bot, moderator_id, text)
 
     return mapping
 #==================
 # شروع راند
 #==================
 @dp.callback_query_handler(lambda c: c.data == "start_round")
+@guard.once(game_key)
 async def start_round_handler(callback: types.CallbackQuery):
-    global turn_order, current_turn_index, round_active
+    global round_active
 
-    if not turn_order:
-        seats_list = sorted(player_slots.keys())
-        if not seats_list:
-            await callback.answer("⚠️ هیچ بازیکنی در بازی نیست.", show_alert=True)
-            return
-        turn_order = seats_list[:]  # همه بازیکن‌ها به ترتیب صندلی
+    # شروع از سر صحبت؛ اگر هنوز ترتیبی ساخته نشده همه بازیکن‌ها به ترتیب صندلی
+    first = turns.restart() if turns else turns.start(sorted(player_slots.keys()))
+    if not first:
+        await callback.answer("⚠️ هیچ بازیکنی در بازی نیست.", show_alert=True)
+        return UNCHANGED
 
     round_active = True
-    current_turn_index = 0  # شروع از سر صحبت
-
-    first_seat = turn_order[current_turn_index]  # صندلی یا آی‌دی بازیکن اول
-    await start_turn(first_seat, duration=DEFAULT_TURN_DURATION, is_challenge=False)
+    await start_turn(first.seat, duration=first.duration, is_challenge=False)
     await callback.answer()
 
 #======================
@@ -2345,13 +2524,11 @@ async def render_game_message(edit=True):
         return
 
     # لیست بازیکنان بر اساس صندلی مرتب
-    max_players = len(scenarios[selected_scenario]["roles"])
+    max_players = scenarios[selected_scenario].seat_count
     lines = []
-    for seat in range(1, max_players+1):
-        if seat in player_slots:
-            uid = player_slots[seat]
-            name = players.get(uid, "❓")
-            lines.append(f"{seat}. <a href='tg://user?id={uid}'>{html.escape(name)}</a>")
+    for rec in seated_records():
+        if rec.seat <= max_players:
+            lines.append(f"{rec.seat}. {rec.mention}")
     players_list = "\n".join(lines) if lines else "هیچ بازیکنی ثبت نشده است."
 
     head_text = ""
@@ -2362,23 +2539,15 @@ async def render_game_message(edit=True):
 
     text = (
         "🎮 بازی شروع شد!\n"
-        "📩 نقش‌ها در پیوی ارسال شدند.\n\n"
+        "🎭 نقش‌ها پخش شد.\n\n"
         f"لیست بازیکنان حاضر (بر اساس صندلی):\n{players_list}\n\n"
-        "ℹ️ برای دیدن نقش به پیوی ربات برید\n"
+        f"{ROLE_HINT_TEXT}"
         "📜 لیست نقش‌ها برای گرداننده ارسال شد"
         f"{head_text}\n\n"
         "🎤 گرداننده باید «سر صحبت» را انتخاب کند و سپس «شروع دور» را بزند."
     )
 
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("🎯 انتخاب سر صحبت", callback_data="choose_head"))
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    
-    if challenge_active:
-        kb.add(InlineKeyboardButton("⚔ چالش روشن", callback_data="challenge_toggle"))
-    else:
-        kb.add(InlineKeyboardButton("⚔ چالش خاموش", callback_data="challenge_toggle"))
-    
+    kb = round_menu_keyboard("🎯 انتخاب سر صحبت")
 
     try:
         if edit and game_message_id:
@@ -2407,12 +2576,8 @@ async def global_message_control(message: types.Message):
 
     # اگر حذف پیام‌های خارج نوبت فعال است و پیام توسط کسی است که نوبتش نیست → حذف کن
     if addons.settings.get("security", {}).get("delete_out_of_turn", True):
-        # فرض می‌کنیم current turn seat -> uid = player_slots[turn_order[current_turn_index]]
-        try:
-            current_seat = turn_order[current_turn_index]
-            allowed_uid = player_slots.get(current_seat)
-        except Exception:
-            allowed_uid = None
+        # نوبت جاری (اصلی یا چالش) → uid
+        allowed_uid = player_slots.get(turns.current.seat) if turns.current else None
 
         if message.from_user.id != allowed_uid and message.from_user.id != moderator_id:
             try:
@@ -2425,35 +2590,41 @@ async def global_message_control(message: types.Message):
 # شروع بازی و نوبت اول
 # ======================
 @dp.callback_query_handler(lambda c: c.data == "start_play")
+@guard.once(game_key)
 async def start_play(callback: types.CallbackQuery):
-    global game_running, lobby_active, turn_order, current_turn_index, game_message_id
+    global game_running, lobby_active, game_message_id
 
     # فقط گرداننده می‌تواند شروع کند
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند بازی را شروع کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     if not selected_scenario:
         await callback.answer("❌ سناریو انتخاب نشده.", show_alert=True)
-        return
+        return UNCHANGED
+
+    if game_running:
+        await callback.answer("✅ بازی قبلاً شروع شده است.")
+        return UNCHANGED
 
-    max_players = len(scenarios[selected_scenario]["roles"])
+    max_players = scenarios[selected_scenario].seat_count
     # اطمینان از اینکه صندلی‌ها حداقل به اندازه حداقل بازیکنان پر شده‌اند
     occupied_seats = [s for s in range(1, max_players+1) if s in player_slots]
-    if len(occupied_seats) < scenarios[selected_scenario]["min_players"]:
-        await callback.answer(f"❌ تعداد بازیکنان کافی نیست. حداقل {scenarios[selected_scenario]['min_players']} صندلی باید انتخاب شود.", show_alert=True)
-        return
+    if len(occupied_seats) < scenarios[selected_scenario].min_players:
+        await callback.answer(f"❌ تعداد بازیکنان کافی نیست. حداقل {scenarios[selected_scenario].min_players} صندلی باید انتخاب شود.", show_alert=True)
+        return UNCHANGED
 
     # یا اگر خواستی می‌تونی اصرار کنی که همهٔ بازیکنان صندلی انتخاب کنند:
     if len(occupied_seats) != len(players):
         await callback.answer("❌ لطفا همه بازیکنان ابتدا صندلی انتخاب کنند تا لیست مرتب بر اساس صندلی ساخته شود.", show_alert=True)
-        return
+        return UNCHANGED
 
     game_running = True
     lobby_active = False
+    lifecycle.advance(GamePhase.RUNNING)
 
     # پخش نقش‌ها
-    await distribute_roles()
+    roster.assign_roles(await distribute_roles())
     
         # ✅ اضافه شده
     # ساخت متن لیست بازیکنان بر اساس صندلی‌ها
@@ -2464,24 +2635,16 @@ async def start_play(callback: types.CallbackQuery):
 
     text = (
         "🎮 بازی شروع شد!\n"
-        "📩 نقش‌ها در پیوی ارسال شدند.\n\n"
+        "🎭 نقش‌ها پخش شد.\n\n"
         f"👥 لیست بازیکنان حاضر در بازی:\n{players_list}\n\n"
-        "ℹ️ برای دیدن نقش به پیوی ربات بروید.\n"
+        f"{ROLE_HINT_TEXT}"
         "📜 لیست نقش‌ها به گرداننده ارسال شد.\n\n"
         "👑 گرداننده سر صحبت را انتخاب کند و شروع دور را بزند."
     )
 
-    # کیبورد جدید (انتخاب سر صحبت + شروع دور)
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(
-        InlineKeyboardButton("👑 انتخاب سر صحبت", callback_data="choose_head"),
-        InlineKeyboardButton("▶ شروع دور", callback_data="start_round")
-    )
-    if challenge_active:
-        kb.add(InlineKeyboardButton("⚔ چالش روشن", callback_data="challenge_toggle"))
-    else:
-        kb.add(InlineKeyboardButton("⚔ چالش خاموش", callback_data="challenge_toggle"))
-    
+    # کیبورد جدید (انتخاب سر صحبت + شروع دور + چالش + نقش من)
+    kb = round_menu_keyboard()
+
     # ویرایش پیام لابی به پیام شروع بازی
     try:
         if lobby_message_id:
@@ -2535,59 +2698,53 @@ async def choose_head(callback: types.CallbackQuery):
 # انتخاب خودکار → نمایش لیست صندلی‌ها با دکمه برای انتخاب
 #=======================================
 @dp.callback_query_handler(lambda c: c.data == "speaker_auto")
+@guard.once(game_key)
 async def speaker_auto(callback: types.CallbackQuery):
     import random
-    global current_speaker, turn_order, current_turn_index, game_message_id
+    global current_speaker
 
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند انتخاب کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     if not player_slots:
         await callback.answer("⚠ هیچ صندلی ثبت نشده.", show_alert=True)
-        return
+        return UNCHANGED
 
     seats_list = sorted(player_slots.keys())
     current_speaker = random.choice(seats_list)
-    current_turn_index = seats_list.index(current_speaker)
-    turn_order = seats_list[current_turn_index:] + seats_list[:current_turn_index]
-
-    # اطمینان از اینکه سر صحبت اول لیست باشد
-    if current_speaker in turn_order:
-        turn_order.remove(current_speaker)
-    turn_order.insert(0, current_speaker)
-
-    await callback.answer(f"✅ صندلی {current_speaker} به صورت تصادفی سر صحبت شد.")
-
-    # نمایش نوبت‌ها (اختیاری، اگر تابع داری)
-    try:
-        await send_turn_order_list()
-    except Exception as e:
-        logging.warning(f"⚠️ send_turn_order_list failed: {e}")
+    turns.start(seats_list, head=current_speaker)
 
     # ساخت منوی اصلی
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("👑 انتخاب سر صحبت", callback_data="choose_head"))
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    kb.add(
-        InlineKeyboardButton(
-            "⚔ چالش روشن" if challenge_active else "⚔ چالش خاموش",
-            callback_data="challenge_toggle"
-        )
-    )
+    kb = round_menu_keyboard()
 
     text = f"🎯 سر صحبت انتخاب شد (صندلی {current_speaker}).\nبرای شروع دور، دکمه‌ی «▶ شروع دور» را بزنید."
 
     msg_id = game_message_id or callback.message.message_id
-    try:
-        await bot.edit_message_text(
-            text, chat_id=group_chat_id, message_id=msg_id, reply_markup=kb
-        )
-        game_message_id = msg_id
-    except Exception as e:
-        logging.warning(f"⚠️ speaker_auto edit failed: {e}")
-        msg = await bot.send_message(group_chat_id, text, reply_markup=kb)
-        game_message_id = msg.message_id
+
+    async def show_menu():
+        global game_message_id
+        try:
+            await bot.edit_message_text(
+                text, chat_id=group_chat_id, message_id=msg_id, reply_markup=kb
+            )
+            game_message_id = msg_id
+        except Exception as e:
+            logging.warning(f"⚠️ speaker_auto edit failed: {e}")
+            msg = await bot.send_message(group_chat_id, text, reply_markup=kb)
+            game_message_id = msg.message_id
+
+    # لیست نوبت‌ها قبل از منو (اگر edit نشد، منو پیام جدید است و باید زیر لیست بیاید)
+    async def send_list_then_menu():
+        await gather_calls(send_turn_order_list(), label="speaker_auto_list")   # خطای لیست منو را نگه ندارد
+        await show_menu()
+
+    # جواب callback همزمان با پیام‌ها
+    await gather_calls(
+        callback.answer(f"✅ صندلی {current_speaker} به صورت تصادفی سر صحبت شد."),
+        send_list_then_menu(),
+        label="speaker_auto",
+    )
 
 #=======================================
 # انتخاب دستی → نمایش لیست صندلی‌ها با دکمه برای انتخاب
@@ -2628,26 +2785,21 @@ async def speaker_manual(callback: types.CallbackQuery):
 # هد ست
 #==========================
 @dp.callback_query_handler(lambda c: c.data.startswith("head_set_"))
+@guard.once(game_key)
 async def head_set_handler(callback: types.CallbackQuery):
-    global turn_order, current_turn_index
-
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند سر صحبت را تعیین کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     # صندلی انتخاب شده
     seat = int(callback.data.split("head_set_")[1])
 
     if seat not in player_slots:
         await callback.answer("⚠ این صندلی خالی است.", show_alert=True)
-        return
+        return UNCHANGED
 
     # ساخت ترتیب نوبت: بازیکن انتخاب‌شده اول، بقیه به ترتیب صندلی‌ها
-    all_seats = sorted(player_slots.keys())
-    start_index = all_seats.index(seat)
-    turn_order = all_seats[start_index:] + all_seats[:start_index]
-
-    current_turn_index = 0
+    turns.start(sorted(player_slots.keys()), head=seat)
 
     await callback.answer("✅ سر صحبت انتخاب شد!")
 
@@ -2655,26 +2807,22 @@ async def head_set_handler(callback: types.CallbackQuery):
     await send_turn_order_list()
 
     # نمایش منوی شروع دور و چالش
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    if challenge_active:
-        kb.add(InlineKeyboardButton("⚔ چالش روشن", callback_data="challenge_toggle"))
-    else:
-        kb.add(InlineKeyboardButton("⚔ چالش خاموش", callback_data="challenge_toggle"))
+    kb = round_menu_keyboard(with_head=False)
 
     await bot.send_message(group_chat_id, "🔧 حالا می‌توانید دور را شروع کنید:", reply_markup=kb)
 
 # ======================
 # شروع بازی و نوبت اول
 # ======================
-async def start_turn(seat, duration=DEFAULT_TURN_DURATION, is_challenge=False):
+async def start_turn(seat, duration=DEFAULT_TURN_DURATION, is_challenge=False, edit_in_place=False):
     """
     شروع نوبت برای یک seat (صندلی). این تابع:
-    - پیام نوبت را در گروه می‌فرستد و پین می‌کند
-    - کیبورد مناسب را می‌سازد
+    - پیام نوبت را در گروه می‌فرستد (یا با edit_in_place همان پیام نوبت قبلی را ویرایش می‌کند)
+    - کیبورد مناسب را می‌سازد (اگر از قبل ساخته شده باشد همان استفاده می‌شود)
     - تایمر زنده را با countdown ایجاد می‌کند
     """
-    global current_turn_message_id, turn_timer_task, challenge_mode
+    global current_turn_message_id, turn_timer_task, challenge_mode, current_turn_seat
+    global turn_deadline, turn_is_challenge, turn_started_at
 
     if not group_chat_id:
         return
@@ -2684,9 +2832,19 @@ async def start_turn(seat, duration=DEFAULT_TURN_DURATION, is_challenge=False):
         await bot.send_message(group_chat_id, f"⚠️ صندلی {seat} بازیکنی ندارد.")
         return
 
-    user_id = player_slots[seat]
-    player_name = players.get(user_id, "بازیکن")
-    mention = f"<a href='tg://user?id={user_id}'>{html.escape(str(player_name))}</a>"
+    # آمار صحبت نوبت قبلی
+    now = time.time()
+    prev = seat_record(current_turn_seat) if current_turn_seat is not None else None
+    if prev and turn_started_at:
+        prev.talk_seconds += min(now, turn_deadline or now) - turn_started_at
+
+    current_turn_seat = seat
+    turn_started_at = now
+    turn_deadline = now + duration
+    turn_is_challenge = bool(is_challenge)
+
+    rec = seat_record(seat)
+    rec.talk_turns += 1
 
     # حالت چالش را تنظیم کن
     challenge_mode = bool(is_challenge)
@@ -2698,22 +2856,21 @@ async def start_turn(seat, duration=DEFAULT_TURN_DURATION, is_challenge=False):
         #except:
             #pass
 
-    # قبل از ارسال متن نوبت:
-    use_primary = addons.settings.get("color", {}).get("primary", True)
-    use_challenge_color = addons.settings.get("color", {}).get("challenge", True)
+    # متن و کیبورد نوبت (رنگ prefix بر اساس تنظیمات افزونه)
+    text, kb = take_announcement(seat, duration, is_challenge)
 
-    if is_challenge and use_challenge_color:
-        prefix = "🟥"  # یا هر اموجی دلخواهت
-    elif use_primary:
-        prefix = "🟦"
-    else:
-        prefix = ""
-
-    text = f"{prefix} ⏳ {duration//60:02d}:{duration%60:02d}\n🎙 نوبت صحبت {mention} است. ({duration} ثانیه)"
-    # سپس ارسال یا edit پیام با همین text
-
-
-    msg = await bot.send_message(group_chat_id, text, parse_mode="HTML", reply_markup=turn_keyboard(seat, is_challenge))
+    message_id = None
+    if edit_in_place and current_turn_message_id:
+        try:
+            await bot.edit_message_text(text, chat_id=group_chat_id, message_id=current_turn_message_id,
+                                        parse_mode="HTML", reply_markup=kb)
+            message_id = current_turn_message_id
+        except Exception as e:
+            logging.debug("ویرایش پیام نوبت قبلی ممکن نشد؛ پیام جدید: %s", e)
+    if message_id is None:
+        msg = await bot.send_message(group_chat_id, text, parse_mode="HTML", reply_markup=kb)
+        message_id = msg.message_id
+    current_turn_message_id = message_id
 
     # تلاش برای پین کردن پیام جدید (اختیاری)
     #try:
@@ -2721,32 +2878,31 @@ async def start_turn(seat, duration=DEFAULT_TURN_DURATION, is_challenge=False):
     #except:
         #pass
 
-    #current_turn_message_id = msg.message_id
-
-    # لغو تایمر قبلی
-    if turn_timer_task and not turn_timer_task.done():
-        turn_timer_task.cancel()
+    # راه‌اندازی تایمر (task) — تایمر قبلی همین بازی توسط supervisor لغو می‌شود
+    turn_timer_task = supervisor.spawn(
+        group_chat_id, countdown(seat, duration, message_id, is_challenge),
+        name="turn_timer", replace=True,
+    )
 
-    # راه‌اندازی تایمر (task)
-    turn_timer_task = asyncio.create_task(countdown(seat, duration, msg.message_id, is_challenge))
+    # اعلام نفر بعدی را همین حالا بساز (بیرون از مسیر داغ «نکست»)
+    prerender_next_turn()
 
 # ======================
 # هندلر دکمه شروع دور
 # ======================
 @dp.callback_query_handler(lambda c: c.data == "start_turn")
+@guard.once(game_key)
 async def handle_start_turn(callback: types.CallbackQuery):
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تونه دور رو شروع کنه.", show_alert=True)
-        return
+        return UNCHANGED
 
-    global current_turn_index
-    if not turn_order:
+    first = turns.restart() if turns else None
+    if not first:
         await callback.answer("⚠️ ترتیب نوبتا مشخص نشده.", show_alert=True)
-        return
+        return UNCHANGED
 
-    current_turn_index = 0
-    first_seat = turn_order[current_turn_index]
-    await start_turn(first_seat)
+    await start_turn(first.seat)
 
     await callback.answer()
 
@@ -2765,6 +2921,7 @@ async def challenge_off_handler(callback: types.CallbackQuery):
         return
 
 @dp.callback_query_handler(lambda c: c.data == "challenge_toggle")
+@guard.once(game_key)
 async def challenge_toggle_handler(callback: types.CallbackQuery):
     global challenge_active, group_chat_id, game_message_id
 
@@ -2774,21 +2931,13 @@ async def challenge_toggle_handler(callback: types.CallbackQuery):
 
     if callback.from_user.id != moderator_id and callback.from_user.id not in admin_ids:
         await callback.answer("⛔ فقط گرداننده یا ادمینا می‌تونن وضعیت چالشو تغییر بدن.", show_alert=True)
-        return
+        return UNCHANGED
 
     # تغییر وضعیت چالش
     challenge_active = not challenge_active
 
     # ساخت کیبورد جدید
-    kb = InlineKeyboardMarkup(row_width=1)
-    kb.add(InlineKeyboardButton("👑 انتخاب سر صحبت", callback_data="choose_head"))
-    kb.add(InlineKeyboardButton("▶ شروع دور", callback_data="start_round"))
-    kb.add(
-        InlineKeyboardButton(
-            "⚔ چالش روشن" if challenge_active else "⚔ چالش خاموش",
-            callback_data="challenge_toggle"
-        )
-    )
+    kb = round_menu_keyboard()
 
     # به‌روزرسانی پیام بازی در گروه
     try:
@@ -2803,9 +2952,8 @@ async def challenge_toggle_handler(callback: types.CallbackQuery):
 #=============================
 async def countdown(seat, duration, message_id, is_challenge=False):
     remaining = duration
-    user_id = player_slots.get(seat)
-    player_name = players.get(user_id, "بازیکن")
-    mention = f"<a href='tg://user?id={user_id}'>{html.escape(str(player_name))}</a>"
+    rec = seat_record(seat)
+    mention = rec.mention if rec else "بازیکن"
 
     # 🔧 تعیین prefix (برای رنگ‌بندی نوبت / امکانات افزونه)
     prefix = ""
@@ -2820,10 +2968,7 @@ async def countdown(seat, duration, message_id, is_challenge=False):
             remaining -= 5
 
             # پیام جدید تایمر
-            new_text = (
-                f"{prefix} ⏳ {max(0, remaining)//60:02d}:{max(0, remaining)%60:02d}\n"
-                f"🎙 نوبت صحبت {mention} است. ({max(0, remaining)} ثانیه)"
-            )
+            new_text = turn_text(prefix, mention, max(0, remaining))
 
             try:
                 await bot.edit_message_text(
@@ -2851,9 +2996,10 @@ async def countdown(seat, duration, message_id, is_challenge=False):
 # نکست نوبت
 # ======================
 @dp.callback_query_handler(lambda c: c.data.startswith("next_"))
+@monitor.timed("next_turn")
+@guard.once(game_key)
 async def next_turn(callback: types.CallbackQuery):
-    global current_turn_index, challenge_mode
-    global paused_main_player, paused_main_duration, post_challenge_advance
+    global challenge_mode, current_turn_seat
     global last_next_time
     global next_by_players_enabled, next_by_moderator_enabled
 
@@ -2863,18 +3009,18 @@ async def next_turn(callback: types.CallbackQuery):
     # اگر بازیکن نکست زده ولی غیرفعاله:
     if callback.from_user.id != moderator_id and not next_by_players_enabled:
         await callback.answer("⛔ نکست برای بازیکنان غیرفعال شده.", show_alert=True)
-        return
+        return UNCHANGED
 
     # اگر گرداننده نکست زده ولی غیرفعاله:
     if callback.from_user.id == moderator_id and not next_by_moderator_enabled:
         await callback.answer("⛔ نکست برای گرداننده غیرفعال شده.", show_alert=True)
-        return
+        return UNCHANGED
 
     if addons.settings.get("next", {}).get("anti_spam", True):
         global last_next_time
         if now - last_next_time < 3:
             await callback.answer("⏳ لطفاً چند ثانیه صبر کنید...", show_alert=True)
-            return
+            return UNCHANGED
         last_next_time = now
 
 
@@ -2882,92 +3028,252 @@ async def next_turn(callback: types.CallbackQuery):
         seat = int(callback.data.split("_", 1)[1])
     except Exception:
         await bot.send_message(group_chat_id, "⚠️ دادهٔ نادرست برای نکست.")
-        return
+        return UNCHANGED
+
+    # دکمهٔ نکستِ یک نوبت تمام‌شده (پیام قدیمی) → بدون اجرا جواب بده
+    if current_turn_seat is not None and seat != current_turn_seat:
+        await callback.answer("⏭ این نوبت قبلاً تمام شده.")
+        return UNCHANGED
 
     player_uid = player_slots.get(seat)
     if callback.from_user.id != moderator_id and callback.from_user.id != player_uid:
         await callback.answer("❌ فقط بازیکن مربوطه یا گرداننده می‌تواند نوبت را پایان دهد.", show_alert=True)
-        return
+        return UNCHANGED
 
     # لغو تایمر اگر فعال است
     if turn_timer_task and not turn_timer_task.done():
         turn_timer_task.cancel()
 
-    # =========================
-    #  حالت "چالش"
-    # =========================
-    if challenge_mode:
-        challenge_mode = False
-
-        if paused_main_player is not None:
-            if post_challenge_advance:
-                # بعد از چالش → برو نفر بعد از main
-                post_challenge_advance = False
-                current_turn_index += 1
-
-            # پاکسازی وضعیت
-            paused_main_player = None
-            paused_main_duration = None
-
-    # =========================
-    #  حالت "نوبت عادی"
-    # =========================
-    else:
-        # بررسی کنیم آیا برای این بازیکن چالش رزرو شده؟
-        if seat in pending_challenges:
-            challenger_id = pending_challenges.pop(seat)
-            challenger_seat = next((s for s, u in player_slots.items() if u == challenger_id), None)
-            if challenger_seat:
-                # ذخیره نوبت اصلی
-                paused_main_player = seat
-                paused_main_duration = 120  # یا زمان واقعی نوبت اصلی
-                post_challenge_advance = True
-                challenge_mode = True
-
-                # شروع چالش
-                await start_turn(challenger_seat, duration=60, is_challenge=True)
-                return
-
-        # اگر چالشی نبود → برو نفر بعدی
-        current_turn_index += 1
-
-    # =========================
-    #  پایان روز یا ادامه نوبت
-    # =========================
-    if current_turn_index >= len(turn_order):
+    # نوبت بعدی: ادامهٔ نوبت اصلی بعد از چالش «قبل»، چالش «بعد» این صندلی، نفر بعدی حلقه یا نوبت اضافه
+    challenge_mode = False
+    turn = turns.advance()
+    if turn is None:
+        current_turn_seat = None
         kb = InlineKeyboardMarkup()
+        kb.add(InlineKeyboardButton("🗳 رأی‌گیری", callback_data="start_vote"))
         kb.add(InlineKeyboardButton("🌙 شروع فاز شب", callback_data="start_night"))
-        await bot.send_message(group_chat_id, "✅ همه بازیکنان صحبت کردند. فاز روز پایان یافت.", reply_markup=kb)
+        step = bot.send_message(group_chat_id, "✅ همه بازیکنان صحبت کردند. فاز روز پایان یافت.", reply_markup=kb)
+    else:
+        step = start_turn(turn.seat, duration=turn.duration, is_challenge=turn.is_challenge,
+                          edit_in_place=addons.is_next_edit_in_place())
+
+    # جواب callback همزمان با پیام بعدی (قبلاً اصلاً جواب داده نمی‌شد و دکمه تا timeout می‌چرخید)
+    # خطای start_turn بالا می‌رود تا guard این کلیک را ثبت نکند و نکست دوباره قابل زدن باشد
+    _, result = await gather_calls(callback.answer(), step, label="next_turn")
+    if not ok(result):
+        raise result
+
+
+#========================
+# رأی‌گیری روز
+# یک پیام با دکمهٔ هر صندلی؛ شمارش در Ballot و ویرایش پیام تجمیعی (نه یک edit برای هر کلیک)
+#========================
+VOTE_REASONS = {
+    "recorded": "✅ رأی شما ثبت شد.",
+    "unchanged": "ℹ️ قبلاً به همین صندلی رأی داده‌اید.",
+    "changes_exhausted": "❌ سقف تغییر رأی شما پر شده است.",
+    "cannot_vote_self": "❌ نمی‌توانید به خودتان رأی بدهید.",
+    "not_a_voter": "❌ فقط بازیکنان داخل بازی می‌توانند رأی بدهند.",
+    "invalid_target": "⚠️ این صندلی در رأی‌گیری نیست.",
+    "closed": "⌛ رأی‌گیری تمام شده است.",
+}
+
+def vote_keyboard():
+    kb = InlineKeyboardMarkup(row_width=4)
+    kb.add(*[InlineKeyboardButton(str(seat), callback_data=packed(Action.VOTE, seat)) for seat in ballot.seats])
+    kb.add(InlineKeyboardButton("🔒 پایان رأی‌گیری", callback_data=packed(Action.VOTE_CLOSE)))
+    return kb
+
+def render_vote(final=False):
+    text = "🗳 نتیجهٔ رأی‌گیری:\n\n" if final else "🗳 رأی‌گیری — به صندلی مورد نظر رأی بدهید:\n\n"
+    for seat, votes in ballot.counts():
+        rec = seat_record(seat)
+        name = rec.mention if rec else f"صندلی {seat}"
+        text += f"\u200F{seat:02d} {name} — {'▮' * votes} {votes}\n"
+    text += f"\n✋ {ballot.voted} از {len(ballot.seats)} نفر رأی دادند"
+    return text
+
+async def flush_vote_message():
+    if ballot is None or ballot.closed or not vote_message_id:
+        return
+    try:
+        await bot.edit_message_text(render_vote(), chat_id=group_chat_id, message_id=vote_message_id,
+                                    parse_mode="HTML", reply_markup=vote_keyboard())
+    except MessageNotModified:
+        pass
+
+@dp.callback_query_handler(lambda c: c.data == "start_vote")
+@guard.once(game_key)
+async def start_vote(callback: types.CallbackQuery):
+    global ballot, vote_message_id, vote_edit
+
+    if callback.from_user.id != moderator_id:
+        await callback.answer("❌ فقط گرداننده می‌تواند رأی‌گیری را شروع کند.", show_alert=True)
+        return UNCHANGED
+    if ballot is not None and not ballot.closed:
+        await callback.answer("ℹ️ رأی‌گیری در جریان است.", show_alert=True)
+        return UNCHANGED
+    if not player_slots:
+        await callback.answer("⚠ هیچ بازیکنی در بازی نیست.", show_alert=True)
+        return UNCHANGED
+
+    ballot = Ballot(sorted(player_slots))
+    game_id = group_chat_id
+    vote_edit = CoalescedEdit(flush_vote_message,
+                              spawn=lambda coro: supervisor.spawn(game_id, coro, name="vote_tally", replace=True))
+    msg = await bot.send_message(group_chat_id, render_vote(), parse_mode="HTML", reply_markup=vote_keyboard())
+    vote_message_id = msg.message_id
+    await callback.answer()
+
+@codec.route(Action.VOTE, "B")
+async def cast_vote(callback: types.CallbackQuery, target_seat):
+    if ballot is None:
+        await callback.answer(VOTE_REASONS["closed"], show_alert=True)
+        return
+    voter_seat = next((s for s, u in player_slots.items() if u == callback.from_user.id), None)
+    ok, reason = ballot.cast(voter_seat, target_seat)
+    if reason == "updated":
+        text = f"🔄 رأی شما به صندلی {target_seat} تغییر کرد ({ballot.changes_left(voter_seat)} تغییر باقی‌مانده)."
     else:
-        next_seat = turn_order[current_turn_index]
-        await start_turn(next_seat)
+        text = VOTE_REASONS.get(reason, reason)
+    if ok:
+        vote_edit.touch()
+    await callback.answer(text, show_alert=not ok)
+
+@codec.route(Action.VOTE_CLOSE)
+@guard.once(game_key)
+async def close_vote(callback: types.CallbackQuery):
+    if callback.from_user.id != moderator_id:
+        await callback.answer("❌ فقط گرداننده می‌تواند رأی‌گیری را ببندد.", show_alert=True)
+        return UNCHANGED
+    results = ballot.close() if ballot is not None else None
+    if results is None:
+        await callback.answer(VOTE_REASONS["closed"])
+        return UNCHANGED
+
+    await vote_edit.cancel()
+    leaders = ballot.leaders()
+    if not leaders:
+        verdict = "هیچ رأیی ثبت نشد."
+    elif len(leaders) == 1:
+        rec = seat_record(leaders[0])
+        verdict = f"بیشترین رأی: صندلی {leaders[0]} {rec.mention if rec else ''}"
+    else:
+        verdict = "تساوی بین صندلی‌های " + "، ".join(str(s) for s in leaders)
 
+    kb = InlineKeyboardMarkup()
+    kb.add(InlineKeyboardButton("🌙 شروع فاز شب", callback_data="start_night"))
+    # شمارش نهایی در همان پیام (بدون دکمه) + اعلام نتیجه فقط یک بار
+    await gather_calls(
+        bot.edit_message_text(render_vote(final=True), chat_id=group_chat_id, message_id=vote_message_id,
+                              parse_mode="HTML"),
+        bot.send_message(group_chat_id, f"🗳 {verdict}", parse_mode="HTML", reply_markup=kb),
+        callback.answer(),
+        label="close_vote",
+    )
 
 #========================
 # شب کردن
 #========================
 @dp.callback_query_handler(lambda c: c.data == "start_night")
+@guard.once(game_key)
 async def start_night(callback: types.CallbackQuery):
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند فاز شب را شروع کند.", show_alert=True)
-        return
+        return UNCHANGED
 
     kb = InlineKeyboardMarkup()
     kb.add(InlineKeyboardButton("🌞 شروع روز جدید", callback_data="start_new_day"))
 
-    await bot.send_message(group_chat_id, "🌙 فاز شب شروع شد. بازیکنان ساکت باشند...", reply_markup=kb)
-    await callback.answer()
+    actors = night_actors()
+    # اعلام در گروه + ارسال همزمان کیبورد اقدام شب به پیوی نقش‌ها
+    await gather_calls(
+        bot.send_message(group_chat_id, "🌙 فاز شب شروع شد. بازیکنان ساکت باشند...", reply_markup=kb),
+        night_engine.open(group_chat_id, actors) if actors else None,
+        callback.answer(f"🌙 کیبورد اقدام شب برای {len(actors)} نقش ارسال شد." if actors else None),
+        label="start_night",
+    )
+
+#========================
+# اقدام‌های شب (پیوی)
+# نقش‌هایی که در متادیتای سناریو اقدام شب دارند کیبورد انتخاب هدف می‌گیرند؛
+# بعد از جواب همه یا تمام شدن مهلت، یک خلاصه به ترتیب اجرا برای گرداننده فرستاده می‌شود
+#========================
+NIGHT_STATUS = {
+    SKIPPED: "🚫 بدون اقدام",
+    TIMED_OUT: "⌛ جواب نداد",
+    UNREACHABLE: "📵 پیوی در دسترس نبود",
+}
+NIGHT_NOTES = {"blocked": " (⛔ بسته شده بود)", "saved": " (🛡 نجات یافت)"}
+
+def night_actors():
+    scen = scenarios.get(selected_scenario)
+    if scen is None:
+        return []
+    actors, teams = [], {}
+    for rec in seated_records():
+        action = scen.night_action(rec.role) if rec.role and rec.alive else None
+        if action is None:
+            continue
+        if action.shared:
+            # اقدام تیمی (شلیک مافیا): فقط رهبر تیم کیبورد می‌گیرد
+            teams.setdefault((scen.faction_of(rec.role), action.kind), []).append(rec)
+        else:
+            actors.append(NightActor(rec.seat, rec.uid, rec.role, action))
+    for members in teams.values():
+        seat, _ = scen.team_leader([(rec.seat, rec.role) for rec in members])
+        rec = next(r for r in members if r.seat == seat)
+        actors.append(NightActor(rec.seat, rec.uid, rec.role, scen.night_action(rec.role)))
+    return actors
+
+def night_keyboard(actor):
+    kb = InlineKeyboardMarkup(row_width=4)
+    kb.add(*[InlineKeyboardButton(str(seat), callback_data=packed(Action.NIGHT_TARGET, seat))
+             for seat in sorted(player_slots)])
+    kb.add(InlineKeyboardButton("🚫 بدون اقدام", callback_data=packed(Action.NIGHT_TARGET, 0)))
+    return kb
+
+async def send_night_summary(night):
+    text = "🌙 خلاصهٔ اقدام‌های شب (به ترتیب اجرا):\n\n"
+    for i, (actor, status, target, note) in enumerate(night.summary(), start=1):
+        rec = seat_record(actor.seat)
+        who = f"{html.escape(actor.role)} (صندلی {actor.seat} {rec.mention if rec else ''})"
+        if status == ANSWERED:
+            label = KIND_LABELS.get(actor.action.kind, actor.action.kind)
+            outcome = f"{label} → صندلی {target}{NIGHT_NOTES.get(note, '')}"
+        else:
+            outcome = NIGHT_STATUS[status]
+        text += f"\u200F{i}. {who}: {outcome}\n"
+    if moderator_id:
+        await moderator_deliveries.send(bot, moderator_id, text, parse_mode="HTML")
+
+@codec.route(Action.NIGHT_TARGET, "B")
+async def night_target(callback: types.CallbackQuery, target_seat):
+    seat = next((s for s, u in player_slots.items() if u == callback.from_user.id), None)
+    if not night_engine.answer(group_chat_id, seat, target_seat or None):
+        await callback.answer("⌛ مهلت اقدام شب تمام شده یا قبلاً انتخاب کرده‌اید.", show_alert=True)
+        return
+    choice = f"صندلی {target_seat}" if target_seat else "بدون اقدام"
+    await gather_calls(
+        callback.message.edit_text(f"{callback.message.text}\n\n✅ انتخاب شما: {choice}"),
+        callback.answer("✅ ثبت شد."),
+        label="night_target",
+    )
 
 #===========================
 # روز کردن و ریست دور قبل
 #===========================
 @dp.callback_query_handler(lambda c: c.data == "start_new_day")
+@guard.once(game_key)
 async def start_new_day(callback: types.CallbackQuery):
     global game_message_id
 
     if callback.from_user.id != moderator_id:
         await callback.answer("❌ فقط گرداننده می‌تواند روز جدید را شروع کند.", show_alert=True)
-        return
+        return UNCHANGED
+
+    # شب هنوز باز است → بقیه «جواب نداد» و خلاصه همین حالا برای گرداننده
+    await night_engine.close(group_chat_id)
 
     # ریست داده‌های دور قبلی
     reset_round_data()
@@ -3003,8 +3309,6 @@ async def start_new_day(callback: types.CallbackQuery):
 #=======================
 @dp.callback_query_handler(lambda c: c.data.startswith(("challenge_before_", "challenge_after_", "challenge_none_")))
 async def challenge_choice(callback: types.CallbackQuery):
-    global paused_main_player, paused_main_duration
-
     parts = callback.data.split("_")
     action = parts[1]     # before / after / none
     challenger_id = int(parts[2])
@@ -3018,9 +3322,6 @@ async def challenge_choice(callback: types.CallbackQuery):
         return
 
     if action == "before":
-        paused_main_player = target_seat
-        paused_main_duration = DEFAULT_TURN_DURATION
-
         if turn_timer_task and not turn_timer_task.done():
             turn_timer_task.cancel()
 
@@ -3029,14 +3330,18 @@ async def challenge_choice(callback: types.CallbackQuery):
             await bot.send_message(group_chat_id, "⚠️ چالش‌کننده صندلی ندارد؛ نمی‌توان چالش را اجرا کرد.")
         else:
             await bot.send_message(group_chat_id, f"⚔ چالش قبل صحبت برای {target_name} توسط {challenger_name} اجرا شد.")
-            await start_turn(challenger_seat, duration=60, is_challenge=True)
+            turn = turns.pause_for(challenger_seat)
+            if turn is not None:
+                await start_turn(turn.seat, duration=turn.duration, is_challenge=True)
 
     elif action == "after":
         target_seat = next((s for s,u in player_slots.items() if u == target_id), None)
         if target_seat is None:
             await bot.send_message(group_chat_id, "⚠️ هدف چالش صندلی ندارد؛ نمی‌توان چالش را ثبت کرد.")
         else:
-            pending_challenges[target_seat] = challenger_id
+            challenger_seat = next((s for s, u in player_slots.items() if u == challenger_id), None)
+            if challenger_seat is not None:
+                turns.queue_after(target_seat, challenger_seat)
             await bot.send_message(group_chat_id, f"⚔ چالش بعد صحبت برای {target_name} ثبت شد (چالش‌کننده: {challenger_name}).")
 
     elif action == "none":
@@ -3047,44 +3352,45 @@ async def challenge_choice(callback: types.CallbackQuery):
 # ======================
 # درخواست چالش (باز کردن منوی انتخاب قبل/بعد/انصراف)
 # ======================
-challenge_requests = {}
 
 @dp.callback_query_handler(lambda c: c.data.startswith("challenge_request_"))
+@guard.once(game_key)
 async def challenge_request(callback: types.CallbackQuery):
     challenger_id = callback.from_user.id
     try:
         target_seat = int(callback.data.split("_", 2)[2])
     except (IndexError, ValueError):
         await callback.answer("⚠️ خطا در داده چالش.", show_alert=True)
-        return
+        return UNCHANGED
 
     target_id = player_slots.get(target_seat)
     if not target_id:
         await callback.answer("⚠️ بازیکن یافت نشد.", show_alert=True)
-        return
+        return UNCHANGED
 
     # نمی‌تونی به خودت درخواست بدی
     if challenger_id == target_id:
         await callback.answer("❌ نمی‌توانی به خودت درخواست چالش بدهی.", show_alert=True)
-        return
+        return UNCHANGED
+
+    challenger_seat = next((s for s, u in player_slots.items() if u == challenger_id), None)
+    if challenger_seat is None:
+        await callback.answer("⚠️ فقط بازیکنان داخل بازی می‌توانند درخواست چالش بدهند.", show_alert=True)
+        return UNCHANGED
 
     challenger_name = players.get(challenger_id, "بازیکن")
     target_name = players.get(target_id, "بازیکن")
 
     # ثبت درخواست جدید
-    if target_seat not in challenge_requests:
-        challenge_requests[target_seat] = {}
-    if challenger_id in challenge_requests[target_seat]:
+    if challenge_queue.request(target_seat, challenger_seat) is None:
         await callback.answer("❌ در این نوبت قبلاً درخواست داده‌ای.", show_alert=True)
-        return
-
-    challenge_requests[target_seat][challenger_id] = "pending"
+        return UNCHANGED
 
     kb = InlineKeyboardMarkup(row_width=2)
     kb.add(
-        InlineKeyboardButton("✅ قبول (قبل)", callback_data=f"accept_before_{challenger_id}_{target_id}"),
-        InlineKeyboardButton("✅ قبول (بعد)", callback_data=f"accept_after_{challenger_id}_{target_id}"),
-        InlineKeyboardButton("❌ رد", callback_data=f"reject_{challenger_id}_{target_id}")
+        InlineKeyboardButton("✅ قبول (قبل)", callback_data=packed(Action.ACCEPT_BEFORE, challenger_seat, target_seat)),
+        InlineKeyboardButton("✅ قبول (بعد)", callback_data=packed(Action.ACCEPT_AFTER, challenger_seat, target_seat)),
+        InlineKeyboardButton("❌ رد", callback_data=packed(Action.REJECT, challenger_seat, target_seat))
     )
 
     await bot.send_message(group_chat_id, f"⚔ {challenger_name} از {target_name} درخواست چالش کرد.", reply_markup=kb)
@@ -3093,80 +3399,85 @@ async def challenge_request(callback: types.CallbackQuery):
 #=======================
 # پذیرش/رد چالش
 #=======================
-@dp.callback_query_handler(lambda c: c.data.startswith(("accept_before_", "accept_after_", "reject_")))
-async def handle_challenge_response(callback: types.CallbackQuery):
-    global paused_main_player, paused_main_duration, challenge_mode, post_challenge_advance
+@codec.route(Action.ACCEPT_BEFORE, "BB")
+async def accept_challenge_before(callback: types.CallbackQuery, challenger_seat, target_seat):
+    await handle_challenge_response(callback, "accept", "before", challenger_seat, target_seat)
 
-    parts = callback.data.split("_")
-    action = parts[0]      # accept / reject
-    timing = parts[1] if action == "accept" else None
-    challenger_id = int(parts[2])
-    target_id = int(parts[3])
+@codec.route(Action.ACCEPT_AFTER, "BB")
+async def accept_challenge_after(callback: types.CallbackQuery, challenger_seat, target_seat):
+    await handle_challenge_response(callback, "accept", "after", challenger_seat, target_seat)
 
-    target_seat = next((s for s, u in player_slots.items() if u == target_id), None)
-    challenger_seat = next((s for s, u in player_slots.items() if u == challenger_id), None)
+@codec.route(Action.REJECT, "BB")
+async def reject_challenge(callback: types.CallbackQuery, challenger_seat, target_seat):
+    await handle_challenge_response(callback, "reject", None, challenger_seat, target_seat)
+
+@guard.once(game_key)
+async def handle_challenge_response(callback: types.CallbackQuery, action, timing, challenger_seat, target_seat):
+    challenger_id = player_slots.get(challenger_seat)
+    target_id = player_slots.get(target_seat)
 
-    if not target_seat or not challenger_seat:
+    if not target_id or not challenger_id:
         await callback.answer("⚠️ صندلی نامعتبر.", show_alert=True)
-        return
+        return UNCHANGED
 
     if callback.from_user.id not in [target_id, moderator_id]:
         await callback.answer("❌ فقط صاحب نوبت یا گرداننده می‌تواند تصمیم بگیرد.", show_alert=True)
-        return
+        return UNCHANGED
 
     challenger_name = players.get(challenger_id, "بازیکن")
     target_name = players.get(target_id, "بازیکن")
 
-    # درخواست‌های بازیکن مربوطه رو از لیست پاک می‌کنیم
-    if target_seat in challenge_requests:
-        challenge_requests[target_seat].pop(challenger_id, None)
+    # فقط وضعیت همین درخواست عوض می‌شود (pending → accepted/rejected)
+    if action == "reject":
+        challenge = challenge_queue.reject(target_seat, challenger_seat)
+    else:
+        challenge = challenge_queue.accept(target_seat, challenger_seat, timing)
+    if challenge is None:
+        await gather_calls(
+            callback.message.edit_reply_markup(reply_markup=None),
+            callback.answer("⏭ این درخواست قبلاً بررسی شده."),
+            label="stale_challenge",
+        )
+        return UNCHANGED
 
     if action == "reject":
-        challenge_requests[target_seat] = {}
-        await callback.message.edit_reply_markup(reply_markup=None)  # ❌ حذف دکمه‌ها
-        await bot.send_message(group_chat_id, f"🚫 {target_name} درخواست چالش {challenger_name} را رد کرد.")
-        await callback.answer()
+        # حذف دکمه‌ها + اعلام در گروه + جواب callback همزمان
+        await gather_calls(
+            callback.message.edit_reply_markup(reply_markup=None),
+            bot.send_message(group_chat_id, f"🚫 {target_name} درخواست چالش {challenger_name} را رد کرد."),
+            callback.answer(),
+            label="reject_challenge",
+        )
         return
 
-    if action == "accept":
-        # همه درخواست‌های مربوط به target پاک بشن
-        challenge_requests[target_seat] = {}
-        # فقط target به active_challenger_seats اضافه میشه
-        active_challenger_seats.add(target_seat)
-
-        await callback.message.edit_reply_markup(reply_markup=None)  # ❌ حذف دکمه‌ها
-
     # ✅ فقط target (صاحب نوبت) به لیست چالش‌دهنده‌ها اضافه میشه
     active_challenger_seats.add(target_seat)
 
-    if timing == "before":
-        paused_main_player = target_seat
-        paused_main_duration = DEFAULT_TURN_DURATION
-        challenge_mode = True
-
-        await bot.send_message(
-            group_chat_id,
-            f"⚔ {target_name} درخواست چالش {challenger_name} را قبول کرد (قبل از صحبت)."
-        )
-        await start_turn(challenger_seat, duration=60, is_challenge=True)
-
-    elif timing == "after":
-        pending_challenges[target_seat] = challenger_id
-
-        await bot.send_message(
-            group_chat_id,
-            f"⚔ {target_name} درخواست چالش {challenger_name} را قبول کرد (بعد از صحبت)."
-        )
+    turn = None
+    if timing == BEFORE:
+        # اگر هدف همین الان صحبت می‌کند: وقفه و بعد از چالش نوبتش از اول؛ وگرنه قبل از نوبتش
+        if target_seat == turns.main_seat:
+            turn = turns.interrupt()
+        announce = f"⚔ {target_name} درخواست چالش {challenger_name} را قبول کرد (قبل از صحبت)."
+    else:
+        announce = f"⚔ {target_name} درخواست چالش {challenger_name} را قبول کرد (بعد از صحبت)."
+
+    # ❌ حذف دکمه‌ها + اعلام + جواب callback همزمان؛ پیام نوبت چالش بعد از اعلام می‌آید
+    await gather_calls(
+        callback.message.edit_reply_markup(reply_markup=None),
+        bot.send_message(group_chat_id, announce),
+        callback.answer(),
+        label="accept_challenge",
+    )
 
-    await callback.answer()
+    if turn is not None:
+        await start_turn(turn.seat, duration=turn.duration, is_challenge=True)
 
 # ======================
 # انتخاب نوع چالش (قبل / بعد / انصراف)
 # ======================
 @dp.callback_query_handler(lambda c: c.data.startswith("challenge_"))
 async def challenge_choice(callback: types.CallbackQuery):
-    global paused_main_player, paused_main_duration
-
     parts = callback.data.split("_")
     # مثال: challenge_before_12345_67890
     action = parts[1]     # before / after / none
@@ -3182,9 +3493,6 @@ async def challenge_choice(callback: types.CallbackQuery):
         return
 
     if action == "before":
-        paused_main_player = target_id
-        paused_main_duration = DEFAULT_TURN_DURATION
-
         if turn_timer_task and not turn_timer_task.done():
             turn_timer_task.cancel()
 
@@ -3193,14 +3501,18 @@ async def challenge_choice(callback: types.CallbackQuery):
             await bot.send_message(group_chat_id, "⚠️ چالش‌کننده صندلی ندارد؛ نمی‌توان چالش را اجرا کرد.")
         else:
             await bot.send_message(group_chat_id, f"⚔ چالش قبل صحب برای {challenger_name} از {target_name} اجرا شد.")
-            await start_turn(challenger_seat, duration=60, is_challenge=True)
+            turn = turns.pause_for(challenger_seat)
+            if turn is not None:
+                await start_turn(turn.seat, duration=turn.duration, is_challenge=True)
 
     elif action == "after":
         target_seat = next((s for s,u in player_slots.items() if u == target_id), None)
         if target_seat is None:
             await bot.send_message(group_chat_id, "⚠️ هدف چالش صندلی ندارد؛ نمی‌توان چالش را ثبت کرد.")
         else:
-            pending_challenges[target_seat] = challenger_id
+            challenger_seat = next((s for s, u in player_slots.items() if u == challenger_id), None)
+            if challenger_seat is not None:
+                turns.queue_after(target_seat, challenger_seat)
             await bot.send_message(group_chat_id, f"⚔ چالش بعد صحبت برای {target_name} ثبت شد (: {challenger_name}).")
 
     elif action == "none":
@@ -3273,12 +3585,180 @@ async def _(c):
     addons.toggle("color", "challenge")
     await addons.menu_color(c)
 
+# ======================
+# دکمه‌های فشرده (callback_codec)
+# ======================
+@dp.callback_query_handler(lambda c: c.data.startswith(CODEC_PREFIX))
+async def packed_callback_handler(callback: types.CallbackQuery):
+    await codec.dispatch(callback, group_chat_id or 0, game_nonce)
+
 # ======================
 # استارتاپ
 # ======================
+SHUTDOWN_GRACE = 10   # ثانیه — مهلت تمام شدن هندلرها و ارسال‌های در حال اجرا
+
+def snapshot_game():
+    """وضعیت بازی جاری به صورت dict قابل JSON (یا None اگر بازی/لابی فعالی نیست)"""
+    if not group_chat_id or not (lobby_active or game_running or player_slots):
+        return None
+    remaining = None
+    if current_turn_seat is not None and turn_deadline:
+        remaining = max(0, int(turn_deadline - time.time()))
+    seated_records()   # رکورد نشسته‌ها با players/player_slots همگام شود
+    return {
+        "group_chat_id": group_chat_id,
+        "moderator_id": moderator_id,
+        "selected_scenario": selected_scenario,
+        "game_running": game_running,
+        "lobby_active": lobby_active,
+        "lobby_message_id": lobby_message_id,
+        "game_message_id": game_message_id,
+        "game_nonce": game_nonce,
+        "max_seats": MAX_SEATS,
+        "players": players,
+        "player_slots": player_slots,
+        "turns": turns.to_dict(),
+        "current_turn_seat": current_turn_seat,
+        "turn_remaining": remaining,
+        "turn_is_challenge": turn_is_challenge,
+        "waiting_list": list(waiting_list),
+        "substitute_list": list(substitute_list),
+        "removed_players": removed_players.get(group_chat_id, {}),
+        # نقش حذف‌شده‌ها هم لازم است (تولد بازیکن / لیست نقش‌ها بعد از ری‌استارت)
+        "roles": {rec.uid: rec.role for rec in roster if rec.role},
+    }
+
+def restore_game(state):
+    """برگرداندن globals از snapshot؛ خروجی: (صندلی نوبت, زمان باقیمانده, چالش؟) برای ادامهٔ تایمر"""
+    global group_chat_id, moderator_id, selected_scenario, game_running, lobby_active
+    global lobby_message_id, game_message_id, game_nonce, MAX_SEATS, players, player_slots
+    global current_turn_seat
+
+    group_chat_id = state["group_chat_id"]
+    moderator_id = state.get("moderator_id")
+    selected_scenario = state.get("selected_scenario")
+    game_running = bool(state.get("game_running"))
+    lobby_active = bool(state.get("lobby_active"))
+    lobby_message_id = state.get("lobby_message_id")
+    game_message_id = state.get("game_message_id")
+    game_nonce = state.get("game_nonce", 0)
+    MAX_SEATS = state.get("max_seats", 0)
+    players = int_keys(state.get("players"))
+    player_slots = int_keys(state.get("player_slots"))
+    turns_state = state.get("turns")
+    if turns_state is None and state.get("turn_order"):
+        # snapshot قدیمی: turn_order + current_turn_index
+        order, index = state["turn_order"], state.get("current_turn_index", 0)
+        main = order[index] if index < len(order) else None
+        turns_state = {"ring": order, "pos": index, "main": main,
+                       "extra": state.get("extra_turns") or [],
+                       "current": [main, False, DEFAULT_TURN_DURATION] if main is not None else None}
+    turns.load(turns_state)
+    current_turn_seat = state.get("current_turn_seat")
+    waiting_list.clear()
+    for uid, name in state.get("waiting_list") or []:
+        waiting_list.join(uid, name)
+    substitute_list.clear()
+    for uid, name in state.get("substitute_list") or []:
+        substitute_list.join(uid, name)
+    removed = int_keys(state.get("removed_players"))
+    removed_players.clear()
+    if removed:
+        removed_players[group_chat_id] = removed
+    roster.clear()
+    seated_records()
+    for seat, info in removed.items():
+        roster.seated(seat, info["id"], info.get("name", "❓")).alive = False
+    roster.assign_roles(int_keys(state.get("roles")))
+    lifecycle.advance(GamePhase.LOBBY)
+    if game_running:
+        lifecycle.advance(GamePhase.RUNNING)
+
+    return current_turn_seat, state.get("turn_remaining"), bool(state.get("turn_is_challenge"))
+
+async def resume_game():
+    state, saved_at = pop_snapshot()
+    if not state:
+        return
+    try:
+        seat, remaining, is_challenge = restore_game(state)
+    except Exception as e:
+        logging.exception("بازیابی وضعیت بازی ناموفق: %s", e)
+        return
+    logging.info("وضعیت بازی گروه %s بازیابی شد.", group_chat_id)
+
+    try:
+        if game_running and seat is not None and remaining:
+            # تایمر نوبت با زمان باقیمانده دوباره شروع می‌شود
+            await bot.send_message(group_chat_id, "♻️ ربات دوباره راه‌اندازی شد؛ بازی از همان‌جا ادامه دارد.")
+            await start_turn(seat, duration=remaining, is_challenge=is_challenge)
+        elif not game_running and lobby_active:
+            await update_lobby()
+    except Exception as e:
+        logging.warning("ادامهٔ بازی بعد از ری‌استارت ناموفق: %s", e)
+
 async def on_startup(dp):
-    await bot.delete_webhook(drop_pending_updates=True)
-    logging.info("Webhook deleted and ready for polling.")
+    # مراحل مستقل راه‌اندازی همزمان اجرا می‌شوند (I/O فایل در thread جدا)
+    started = time.perf_counter()
+    await asyncio.gather(
+        bot.delete_webhook(drop_pending_updates=True),
+        asyncio.to_thread(scenarios.load),
+        asyncio.to_thread(addons.load),
+        deleter.start(),
+        night_engine.start(),
+    )
+    await resume_game()
+
+    monitor_enabled, monitor_debug = enabled_from_env()
+    if monitor_enabled:
+        await monitor.start(debug=monitor_debug)
+
+    # SIGTERM (deploy روی Heroku/Docker) → توقف حلقه تا on_shutdown اجرا شود
+    loop = asyncio.get_event_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    except (NotImplementedError, RuntimeError):
+        pass
+    logging.info("Webhook deleted and ready for polling (startup %.0f ms).", (time.perf_counter() - started) * 1000)
+
+async def on_shutdown(dp):
+    # ۱) دریافت آپدیت جدید متوقف شود
+    dp.stop_polling()
+
+    # ۲) تسک‌های بازی (تایمر نوبت) متوقف شوند (زمان باقیمانده در snapshot ذخیره می‌شود)
+    await supervisor.cancel_all()
+
+    # ۳) هندلرهای در حال اجرا (و ارسال‌هایشان) تا مهلت مشخص تمام شوند
+    current = asyncio.current_task()
+    inflight = [
+        t for t in asyncio.all_tasks()
+        if t is not current and not t.done()
+        and getattr(t.get_coro(), "__qualname__", "").endswith("_process_polling_updates")
+    ]
+    if inflight:
+        done, pending = await asyncio.wait(inflight, timeout=SHUTDOWN_GRACE)
+        if pending:
+            logging.warning("%d هندلر تا پایان مهلت تمام نشد.", len(pending))
+
+    # ۴) ذخیرهٔ وضعیت بازی و تنظیمات
+    state = snapshot_game()
+    if state:
+        save_snapshot(state)
+    await deleter.stop()
+    await night_engine.stop()
+    await monitor.stop()
+    # تنظیمات + همهٔ نوشتن‌های در صف storage (از جمله snapshot) روی دیسک بروند
+    # (addons.flush تنظیمات را در صف می‌گذارد و بعد storage.flush را صدا می‌زند)
+    if not await asyncio.to_thread(addons.flush, SHUTDOWN_GRACE):
+        logging.warning("همهٔ فایل‌ها تا پایان مهلت روی دیسک نوشته نشدند.")
+
+    # ۵) بستن session (executor بعد از این session را هم می‌بندد؛ بستن دوباره بی‌ضرر است)
+    session = await bot.get_session()
+    if session and not session.closed:
+        await session.close()
+    logging.info("Shutdown complete.")
 
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    # on_startup خودش وبهوک را با drop_pending_updates حذف می‌کند؛ skip_updates و reset_webhook
+    # همان کار را با سه رفت‌وبرگشت اضافه (getWebhookInfo + دو deleteWebhook) تکرار می‌کردند
+    executor.start_polling(dp, reset_webhook=False, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -1,143 +1,246 @@
 import os
+import time
 import logging
+import threading
 from sqlalchemy import create_engine, Column, BigInteger, String
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-logging.basicConfig(level=logging.INFO) 
+# نکته: ایمپورت این ماژول هیچ اتصال/فایلی نمی‌سازد؛
+# engine در اولین استفاده (یا با connect() در استارتاپ) ساخته می‌شود.
+
+# تنظیمات pool (قابل تغییر با متغیر محیطی)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # ثانیه — قبل از قطع شدن توسط سرور
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# circuit breaker: بعد از خطا تا این مدت سراغ دیتابیس نمی‌رویم (با هر خطا دو برابر می‌شود)
+RETRY_MIN = 5      # ثانیه
+RETRY_MAX = 300    # ثانیه
 
 # ------------------------------------------------
-# ۱. کلاس جایگزین (Dummy) - در صورت شکست دیتابیس
+# ۱. کلاس جایگزین (Dummy) - وقتی اصلاً دیتابیسی تنظیم نشده
 # ------------------------------------------------
 class DummyNicknameManager:
-    """کلاس جایگزین در صورت شکست اتصال به دیتابیس"""
+    """کلاس جایگزین وقتی DATABASE_URL تنظیم نشده؛ اسم‌ها فقط در حافظه نگه داشته می‌شوند"""
     def __init__(self):
-        logging.critical("❌ استفاده از حالت Dummy: نام مستعار ذخیره نخواهد شد.")
-        
+        logging.critical("❌ استفاده از حالت Dummy: نام مستعار فقط تا ری‌استارت نگه داشته می‌شود.")
+        self._cache = {}
+
     def set(self, user_id, nickname):
-        pass
-        
+        self._cache[user_id] = nickname
+
     def set_nick(self, user_id, nickname): # اضافه شده برای سازگاری
-        pass
+        self.set(user_id, nickname)
+
+    def set_many(self, items):
+        self._cache.update(items)
 
     def get(self, user_id):
-        return None
-        
+        return self._cache.get(user_id)
+
     def get_nick(self, user_id): # اضافه شده برای سازگاری
-        return None
+        return self.get(user_id)
 
     def delete(self, user_id): # اضافه شده
-        logging.warning("⚠️ دیتابیس فعال نیست. حذف نام مستعار انجام نشد.")
-        return False
-        
+        return self._cache.pop(user_id, None) is not None
+
     def all(self):
-        return {}
+        return dict(self._cache)
+
+    def connect(self):
+        return False
+
+    def close(self):
+        pass
 
 # ------------------------------------------------
 # ۲. کلاس اصلی (واقعی) - برای کار با دیتابیس
 # ------------------------------------------------
 # تعریف کلاس واقعی (NicknameManager) قبل از استفاده
 class NicknameManager:
+    """
+    - اتصال با pool تنظیم شده (pre-ping + recycle)
+    - ذخیره با یک دستور INSERT ... ON CONFLICT DO UPDATE
+    - کش محلی: خواندن‌ها از کش، نوشتن‌ها write-through
+    - circuit breaker: اگر دیتابیس در دسترس نباشد، تغییرات در کش و صف pending
+      می‌مانند و بعد از وصل شدن دوباره یکجا (set_many) ذخیره می‌شوند.
+    """
     def __init__(self):
-        global db_initialization_success
-        self.db_ready = False
+        self._connected = False
+        self._retry_at = 0.0
+        self._retry_delay = RETRY_MIN
+        self._lock = threading.Lock()
+        self._cache = {}          # user_id -> nickname (None = می‌دانیم ندارد)
+        self._pending = {}        # user_id -> nickname یا None (حذف) که هنوز به دیتابیس نرسیده
+        self._cache_complete = False
 
-        if db_initialization_success:
+    # -------------------------
+    # اتصال و circuit breaker
+    # -------------------------
+    @property
+    def db_ready(self):
+        return self._available()
+
+    def connect(self):
+        """ساخت engine و جدول‌ها. در استارتاپ async با asyncio.to_thread صدا زده شود."""
+        with self._lock:
+            if self._connected:
+                return True
+            if not init_engine():
+                self._trip()
+                return False
             try:
                 Base.metadata.create_all(bind=engine)
-                self.db_ready = True
-                logging.info("✅ اتصال به PostgreSQL و ایجاد جدول Nicknames موفقیت‌آمیز بود.")
             except Exception as e:
-                logging.critical(f"❌ خطای حیاتی در اتصال دیتابیس (Create Tables): {e}")
-                logging.critical("ربات بدون قابلیت ذخیره نام مستعار اجرا خواهد شد.")
-        else:
-            logging.warning("⚠️ دیتابیس فعال نیست. ذخیره نام مستعار غیرفعال است.")
+                logging.error(f"❌ اتصال به دیتابیس ناموفق (تلاش دوباره تا {self._retry_delay} ثانیه دیگر): {e}")
+                self._trip()
+                return False
+            self._connected = True
+            self._retry_delay = RETRY_MIN
+            logging.info("✅ اتصال به دیتابیس و ایجاد جدول Nicknames موفقیت‌آمیز بود.")
+        self._flush_pending()
+        return True
+
+    def _trip(self):
+        """باز کردن مدار: تا مدتی درخواست به دیتابیس نفرست"""
+        self._connected = False
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, RETRY_MAX)
+
+    def _available(self):
+        if self._connected:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        return self.connect()
+
+    def _failed(self, action, e):
+        logging.error(f"❌ خطای دیتابیس در {action}: {e}")
+        self._trip()
 
+    def close(self):
+        if engine is not None:
+            engine.dispose()
 
     def _get_session(self):
         """تلاش برای ایجاد یک سشن دیتابیس"""
-        if not self.db_ready:
+        if not self._available():
             return None
         try:
             return SessionLocal()
         except Exception as e:
-            logging.error(f"❌ خطای ایجاد سشن دیتابیس: {e}")
+            self._failed("ایجاد سشن", e)
             return None
 
-    def set(self, user_id, nickname):
-        return self.set_nick(user_id, nickname)
+    # -------------------------
+    # نوشتن
+    # -------------------------
+    def _upsert_stmt(self, rows):
+        insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(Nickname).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[Nickname.user_id],
+            set_={"nickname": stmt.excluded.nickname},
+        )
 
-    def set_nick(self, user_id, nickname): # متد اصلی ذخیره
-        if not self.db_ready: return
+    def _write(self, items):
+        """upsert/حذف گروهی در یک تراکنش؛ True اگر موفق بود"""
         session = self._get_session()
-        if not session: return
-
+        if not session:
+            return False
+        upserts = [{"user_id": uid, "nickname": nick} for uid, nick in items.items() if nick is not None]
+        deletes = [uid for uid, nick in items.items() if nick is None]
         try:
-            record = session.query(Nickname).filter(Nickname.user_id == user_id).first()
-            
-            if record:
-                record.nickname = nickname
-            else:
-                new_record = Nickname(user_id=user_id, nickname=nickname)
-                session.add(new_record)
-                
+            if upserts:
+                session.execute(self._upsert_stmt(upserts))
+            if deletes:
+                session.query(Nickname).filter(Nickname.user_id.in_(deletes)).delete(synchronize_session=False)
             session.commit()
-            logging.info(f"✅ نام مستعار کاربر {user_id} ذخیره/به‌روزرسانی شد.")
-            
+            return True
         except Exception as e:
             session.rollback()
-            logging.error(f"❌ خطای ذخیره‌سازی نام مستعار: {e}")
+            self._failed("ذخیره‌سازی نام مستعار", e)
+            return False
         finally:
             session.close()
 
+    def _flush_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        if self._write(pending):
+            logging.info(f"✅ {len(pending)} تغییر معلق نام مستعار در دیتابیس ذخیره شد.")
+        else:
+            # تغییرات جدیدتر (در این فاصله) اولویت دارند
+            pending.update(self._pending)
+            self._pending = pending
+
+    def set(self, user_id, nickname):
+        return self.set_nick(user_id, nickname)
+
+    def set_nick(self, user_id, nickname): # متد اصلی ذخیره
+        return self.set_many({user_id: nickname})
+
+    def set_many(self, items):
+        """ذخیرهٔ گروهی {user_id: nickname} با یک دستور upsert"""
+        items = dict(items)
+        if not items:
+            return True
+        self._cache.update(items)
+        if self._write(items):
+            logging.info(f"✅ نام مستعار {len(items)} کاربر ذخیره/به‌روزرسانی شد.")
+            return True
+        self._pending.update(items)
+        return False
+
+    # -------------------------
+    # خواندن
+    # -------------------------
     def get(self, user_id):
         return self.get_nick(user_id)
 
     def get_nick(self, user_id): # متد اصلی دریافت
-        if not self.db_ready: return None
+        if user_id in self._cache or self._cache_complete:
+            return self._cache.get(user_id)
         session = self._get_session()
-        if not session: return None
-        
+        if not session:
+            return None
         try:
-            record = session.query(Nickname).filter(Nickname.user_id == user_id).first()
-            return record.nickname if record else None
-        except Exception:
+            record = session.get(Nickname, user_id)
+            nick = record.nickname if record else None
+            self._cache[user_id] = nick
+            return nick
+        except Exception as e:
+            self._failed("خواندن نام مستعار", e)
             return None
         finally:
             session.close()
 
     def delete(self, user_id): # متد جدید حذف
-        if not self.db_ready: return False
-        session = self._get_session()
-        if not session: return False
-
-        try:
-            # حذف رکورد بر اساس user_id
-            deleted_rows = session.query(Nickname).filter(Nickname.user_id == user_id).delete()
-            session.commit()
-            
-            if deleted_rows > 0:
-                logging.info(f"✅ نام مستعار کاربر {user_id} حذف شد.")
-                return True
-            return False
+        existed = self.get_nick(user_id) is not None
+        self._cache[user_id] = None
+        if not self._write({user_id: None}):
+            self._pending[user_id] = None
+        if existed:
+            logging.info(f"✅ نام مستعار کاربر {user_id} حذف شد.")
+        return existed
 
-        except Exception as e:
-            session.rollback()
-            logging.error(f"❌ خطای حذف نام مستعار: {e}")
-            return False
-        finally:
-            session.close()
-            
     def all(self):
-        if not self.db_ready: return {}
         session = self._get_session()
-        if not session: return {}
-        
+        if not session:
+            return {uid: nick for uid, nick in self._cache.items() if nick is not None}
         try:
             records = session.query(Nickname).all()
+            self._cache.update({r.user_id: r.nickname for r in records})
+            self._cache_complete = True
             return {r.user_id: r.nickname for r in records}
-        except Exception:
-            return {}
+        except Exception as e:
+            self._failed("خواندن لیست نام‌های مستعار", e)
+            return {uid: nick for uid, nick in self._cache.items() if nick is not None}
         finally:
             session.close()
 
@@ -145,35 +248,34 @@ class NicknameManager:
 # ۳. تنظیمات دیتابیس (پس از تعریف کلاس‌ها)
 # ------------------------------------------------
 DATABASE_URL = os.getenv("DATABASE_URL")
-db_initialization_success = False
-
-class DummyBase:
-    metadata = None
-class DummyEngine:
-    pass
-class DummySessionLocal:
-    def __init__(self, *args, **kwargs):
-        pass
-    def __call__(self, *args, **kwargs):
-        return None
+if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+psycopg2://", 1)
 
-Base = DummyBase
-engine = DummyEngine()
-SessionLocal = DummySessionLocal()
+db_initialization_success = bool(DATABASE_URL)
 
-if DATABASE_URL: 
-    try:
-        if DATABASE_URL.startswith("postgres://"):
-            DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+psycopg2://", 1)
+Base = declarative_base()
+engine = None
+SessionLocal = None
 
-        engine = create_engine(DATABASE_URL)
-        Base = declarative_base()
+def init_engine():
+    """ساخت lazy engine و sessionmaker؛ True اگر آماده باشد"""
+    global engine, SessionLocal
+    if engine is not None:
+        return True
+    if not DATABASE_URL:
+        logging.error("❌ متغیر محیطی DATABASE_URL تنظیم نشده است!")
+        return False
+    try:
+        options = {"pool_pre_ping": True, "pool_recycle": DB_POOL_RECYCLE}
+        if not DATABASE_URL.startswith("sqlite"):
+            # SQLite (برای تست) pool سایز ندارد
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        engine = create_engine(DATABASE_URL, **options)
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        db_initialization_success = True
+        return True
     except Exception as e:
         logging.critical(f"❌ خطای حیاتی در پیکربندی دیتابیس (Environment/URL): {e}")
-else:
-    logging.error("❌ متغیر محیطی DATABASE_URL تنظیم نشده است!")
+        return False
 
 
 # ------------------------------------------------
@@ -0,0 +1,302 @@
+# night_actions.py
+# --------------------------------------------------------
+# جمع‌آوری اقدام‌های شب از پیوی
+# - open(): برای هر نقشی که شب اقدام دارد (NightRole سناریو) کیبورد انتخاب هدف
+#   همزمان به پیوی فرستاده می‌شود
+# - مهلت همهٔ بازیکنان همهٔ بازی‌ها در یک min-heap مشترک است و فقط یک تسک
+#   سررسیدها را پردازش می‌کند (هیچ تسک/polling جدا برای هر بازیکن نیست)
+# - وقتی همه جواب دادند یا مهلتشان تمام شد، on_complete(night) یک بار صدا زده می‌شود؛
+#   night.summary() اقدام‌ها را به ترتیب اجرا (order متادیتای نقش) برمی‌گرداند
+# استفاده:
+#   engine = NightEngine(send=lambda uid, text, kb: deliveries.send(bot, uid, text, reply_markup=kb),
+#                        keyboard=night_keyboard, on_complete=send_night_summary)
+#   await engine.start()                                    # در on_startup
+#   await engine.open(game_id, [NightActor(seat, uid, role, night_role), ...])
+#   engine.answer(game_id, seat, target_seat)               # از هندلر دکمهٔ پیوی
+#   await engine.close(game_id)                             # پایان زودتر شب (خلاصه با جواب‌های موجود)
+#   engine.cancel(game_id); await engine.stop()
+# --------------------------------------------------------
+
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import NamedTuple
+
+from api_calls import gather_calls
+
+LOG_TAG = "NightEngine"
+
+MAX_IDLE = 60   # ثانیه — حداکثر خواب تسک وقتی مهلتی در صف نیست
+
+KIND_LABELS = {"block": "بستن", "shot": "شلیک", "save": "نجات", "inquiry": "استعلام"}
+
+# وضعیت هر بازیگر
+WAITING = "waiting"
+ANSWERED = "answered"
+SKIPPED = "skipped"         # بازیکن «بدون اقدام» را زد
+TIMED_OUT = "timed_out"
+UNREACHABLE = "unreachable"  # پیوی نرسید
+
+
+class NightActor(NamedTuple):
+    seat: int
+    uid: int
+    role: str
+    action: object          # NightRole: kind / order / timeout
+
+
+class NightRound:
+    """اقدام‌های شب یک بازی"""
+
+    def __init__(self, game_id, actors, token):
+        self.game_id = game_id
+        self.token = token
+        self.actors = {a.seat: a for a in actors}
+        self.status = {a.seat: WAITING for a in actors}
+        self.targets = {}               # seat → صندلی هدف
+        self.waiting = len(self.actors)
+        self.completed = False
+        self.started = time.time()
+
+    def settle(self, seat, status, target=None):
+        """ثبت نتیجهٔ یک بازیگر؛ True اگر وضعیتش عوض شد"""
+        if self.status.get(seat) != WAITING:
+            return False
+        self.status[seat] = status
+        if target is not None:
+            self.targets[seat] = target
+        self.waiting -= 1
+        return True
+
+    def summary(self):
+        """
+        [(actor, status, target, note)] به ترتیب اجرا.
+        note: «بسته شد» اگر یک block روی این بازیگر زده شده، «نجات یافت» برای شلیکی که هدفش save شده
+        """
+        ordered = sorted(self.actors.values(), key=lambda a: (a.action.order, a.seat))
+        blocked, saved = set(), set()
+        rows = []
+        for actor in ordered:
+            status, target, note = self.status[actor.seat], self.targets.get(actor.seat), None
+            if status == ANSWERED:
+                if actor.seat in blocked:
+                    note = "blocked"
+                elif actor.action.kind == "block":
+                    blocked.add(target)
+                elif actor.action.kind == "save":
+                    saved.add(target)
+            rows.append([actor, status, target, note])
+        # نجات بعد از شلیک اجرا می‌شود ولی روی همان شب اثر دارد
+        for row in rows:
+            actor, status, target, note = row
+            if status == ANSWERED and note is None and actor.action.kind == "shot" and target in saved:
+                row[3] = "saved"
+        return [tuple(r) for r in rows]
+
+
+class NightEngine:
+
+    def __init__(self, send, keyboard, on_complete):
+        self.send = send                  # coroutine (uid, text, kb) → True اگر رسید
+        self.keyboard = keyboard          # (game_id, actor) → کیبورد انتخاب هدف
+        self.on_complete = on_complete    # coroutine (NightRound)
+        self._rounds = {}                 # game_id → NightRound
+        self._heap = []                   # (deadline, seq, game_id, token, seat)
+        self._seq = itertools.count()
+        self._tokens = itertools.count(1)
+        self._finished = deque()          # شب‌هایی که با answer کامل شدند (خلاصه در تسک اصلی)
+        self._wake = None
+        self._task = None
+        self._running = False
+
+    # -------------------------
+    # شروع / توقف
+    # -------------------------
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._running = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=5):
+        self._running = False
+        if self._wake is not None:
+            self._wake.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            self._task = None
+
+    # -------------------------
+    # شب یک بازی
+    # -------------------------
+    async def open(self, game_id, actors):
+        """شروع شب: ارسال همزمان کیبوردها؛ خروجی NightRound"""
+        self.cancel(game_id)
+        night = self._rounds[game_id] = NightRound(game_id, actors, next(self._tokens))
+        now = time.time()
+        for actor in actors:
+            self._push(now + actor.action.timeout, game_id, night.token, actor.seat)
+
+        results = await gather_calls(
+            *(self.send(a.uid, self.prompt(a), self.keyboard(game_id, a)) for a in actors),
+            label="night_open",
+        )
+        for actor, ok in zip(actors, results):
+            if ok is not True:
+                night.settle(actor.seat, UNREACHABLE)
+        await self._maybe_complete(night)
+        return night
+
+    def answer(self, game_id, seat, target):
+        """
+        جواب بازیکن (target=None یعنی بدون اقدام).
+        Returns: True ثبت شد / False شبی باز نیست یا قبلاً جواب داده یا مهلت گذشته
+        """
+        night = self._rounds.get(game_id)
+        if night is None or seat not in night.actors:
+            return False
+        if not night.settle(seat, ANSWERED if target is not None else SKIPPED, target):
+            return False
+        if night.waiting == 0:
+            self._finished.append(night)
+            if self._wake is not None:
+                self._wake.set()
+        return True
+
+    async def close(self, game_id):
+        """پایان زودتر شب (مثلاً گرداننده روز را شروع کرد): بقیه timed_out و خلاصه همین حالا"""
+        night = self._rounds.get(game_id)
+        if night is None:
+            return None
+        for seat in list(night.actors):
+            night.settle(seat, TIMED_OUT)
+        await self._maybe_complete(night)
+        return night
+
+    def cancel(self, game_id):
+        """شب بازی بدون خلاصه بسته می‌شود؛ مهلت‌هایش در heap بی‌اثر می‌مانند"""
+        return self._rounds.pop(game_id, None)
+
+    def current(self, game_id):
+        return self._rounds.get(game_id)
+
+    def __len__(self):
+        return len(self._rounds)
+
+    @staticmethod
+    def prompt(actor):
+        label = KIND_LABELS.get(actor.action.kind, actor.action.kind)
+        if getattr(actor.action, "shared", False):
+            label = f"{label} تیم"   # فقط همین بازیکن برای کل تیم انتخاب می‌کند
+        return (f"🌙 نقش شما: {actor.role}\n"
+                f"هدف {label} امشب را انتخاب کنید ({actor.action.timeout} ثانیه):")
+
+    # -------------------------
+    # داخلی
+    # -------------------------
+    def _push(self, deadline, game_id, token, seat):
+        item = (deadline, next(self._seq), game_id, token, seat)
+        heapq.heappush(self._heap, item)
+        if self._wake is not None and self._heap[0] is item:
+            self._wake.set()
+
+    async def _maybe_complete(self, night):
+        if night.waiting or night.completed or self._rounds.get(night.game_id) is not night:
+            return
+        night.completed = True
+        del self._rounds[night.game_id]
+        try:
+            await self.on_complete(night)
+        except Exception as e:
+            logging.exception("%s: ارسال خلاصهٔ شب بازی %s شکست خورد: %s", LOG_TAG, night.game_id, e)
+
+    def _expire_due(self, now):
+        """مهلت‌های سررسید شده؛ خروجی: شب‌هایی که با این کار کامل شدند"""
+        finished = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, game_id, token, seat = heapq.heappop(self._heap)
+            night = self._rounds.get(game_id)
+            if night is None or night.token != token:
+                continue   # شب لغو/تمام شده یا شب جدیدتری باز است
+            if night.settle(seat, TIMED_OUT) and night.waiting == 0:
+                finished.append(night)
+        return finished
+
+    async def _run(self):
+        while self._running:
+            # clear قبل از پردازش: answer/_push که وسط await on_complete بیاید از دست نمی‌رود
+            self._wake.clear()
+            now = time.time()
+            finished = self._expire_due(now)
+            while self._finished:
+                finished.append(self._finished.popleft())
+            for night in finished:
+                await self._maybe_complete(night)
+            timeout = min(self._heap[0][0] - time.time(), MAX_IDLE) if self._heap else MAX_IDLE
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+
+# --------------------------------------------------------
+# بنچمارک: شب ۲۰ بازی همزمان، هر بازی ۶ بازیگر، ارسال با ۱۵۰ms تأخیر
+#   python night_actions.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import random
+    from types import SimpleNamespace
+
+    LATENCY = 0.15
+    GAMES = 20
+    ACTORS = 6
+
+    async def main():
+        rnd = random.Random(5)
+        done = {}
+
+        async def send(uid, text, kb):
+            await asyncio.sleep(LATENCY)
+            return uid % 17 != 0          # چند نفر پیوی را بسته‌اند
+
+        async def on_complete(night):
+            done[night.game_id] = (time.perf_counter(), night.summary())
+
+        engine = NightEngine(send, keyboard=lambda g, a: None, on_complete=on_complete)
+        await engine.start()
+
+        kinds = ["block", "shot", "shot", "save", "inquiry", "shot"]
+        t = time.perf_counter()
+        nights = await asyncio.gather(*(
+            engine.open(g, [NightActor(s, g * 100 + s, f"role{s}",
+                                       SimpleNamespace(kind=kinds[s - 1], order=s * 10, timeout=rnd.choice((1, 2))))
+                            for s in range(1, ACTORS + 1)])
+            for g in range(GAMES)
+        ))
+        open_s = time.perf_counter() - t
+        tasks = len(asyncio.all_tasks())
+
+        # نصف بازیکنان جواب می‌دهند؛ بقیه با مهلت بسته می‌شوند
+        for night in nights:
+            for seat in list(night.actors):
+                if rnd.random() < 0.5:
+                    engine.answer(night.game_id, seat, rnd.randint(1, ACTORS))
+        while len(done) < GAMES:
+            await asyncio.sleep(0.05)
+        total_s = time.perf_counter() - t
+
+        statuses = [row[1] for _, rows in done.values() for row in rows]
+        print(f"open {GAMES} games x {ACTORS} actors: {open_s * 1000:.0f}ms "
+              f"(serial would be ~{GAMES * ACTORS * LATENCY * 1000:.0f}ms)")
+        print(f"all nights complete after {total_s:.2f}s; tasks alive during night: {tasks}")
+        print({s: statuses.count(s) for s in set(statuses)})
+        assert len(engine) == 0
+        await engine.stop()
+
+    asyncio.run(main())
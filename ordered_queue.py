@@ -0,0 +1,88 @@
+# ordered_queue.py
+# --------------------------------------------------------
+# صف مرتب بدون تکرار برای لیست رزرو و جایگزین‌ها
+# deque برای حفظ ترتیب + دیکشنری عضویت برای بررسی O(1)
+# خروج از صف با علامت‌گذاری (tombstone) انجام می‌شود، نه بازسازی لیست؛
+# وقتی تعداد tombstoneها زیاد شد صف یک بار فشرده می‌شود.
+# --------------------------------------------------------
+
+from collections import deque
+
+
+class OrderedQueue:
+    """
+    استفاده:
+      waiting = OrderedQueue(maxlen=20)
+      waiting.join(uid, name)      -> True/False (تکراری یا پر)
+      waiting.leave(uid)           -> True/False
+      waiting.pop_next()           -> (uid, name) یا None
+      uid in waiting, len(waiting), for uid, name in waiting: ...
+    """
+
+    __slots__ = ("maxlen", "_queue", "_index")
+
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen
+        self._queue = deque()   # entry = [uid, name]
+        self._index = {}        # uid -> entry (فقط اعضای زنده)
+
+    def __contains__(self, uid):
+        return uid in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return bool(self._index)
+
+    def __iter__(self):
+        index = self._index
+        for entry in self._queue:
+            if index.get(entry[0]) is entry:
+                yield entry[0], entry[1]
+
+    def name(self, uid, default=None):
+        entry = self._index.get(uid)
+        return entry[1] if entry else default
+
+    def join(self, uid, name):
+        if uid in self._index:
+            return False
+        if self.maxlen is not None and len(self._index) >= self.maxlen:
+            return False
+        entry = [uid, name]
+        self._index[uid] = entry
+        self._queue.append(entry)
+        return True
+
+    def leave(self, uid):
+        entry = self._index.pop(uid, None)
+        if entry is None:
+            return False
+        if not self._index:
+            self._queue.clear()
+        elif len(self._queue) > 2 * len(self._index) + 8:
+            self._compact()
+        return True
+
+    def pop(self, uid):
+        """خروج یک عضو مشخص و برگرداندن اسم او (یا None)"""
+        name = self.name(uid)
+        return name if self.leave(uid) else None
+
+    def pop_next(self):
+        index = self._index
+        while self._queue:
+            entry = self._queue.popleft()
+            if index.get(entry[0]) is entry:
+                del index[entry[0]]
+                return entry[0], entry[1]
+        return None
+
+    def clear(self):
+        self._queue.clear()
+        self._index.clear()
+
+    def _compact(self):
+        index = self._index
+        self._queue = deque(e for e in self._queue if index.get(e[0]) is e)
@@ -0,0 +1,170 @@
+# player_record.py
+# --------------------------------------------------------
+# رکورد فشردهٔ هر بازیکن (با __slots__) که متعلق به بازی جاری است:
+# آیدی، اسم نمایشی، منشن HTML آماده (یک بار escape می‌شود)، صندلی،
+# نقش (و متن escape شدهٔ آن که موقع تقسیم نقش یک بار ساخته می‌شود)، زنده/حذف شده و آمار صحبت.
+# players {uid: name} و player_slots {seat: uid} فقط نقش ایندکس را دارند؛
+# رندرها فیلدها را مستقیم از رکورد می‌خوانند.
+# --------------------------------------------------------
+
+import html
+
+
+def mention_html(uid, name, bold=False):
+    text = html.escape(str(name))
+    if bold:
+        text = f"<b>{text}</b>"
+    return f"<a href='tg://user?id={uid}'>{text}</a>"
+
+
+class PlayerRecord:
+    __slots__ = ("uid", "name", "mention", "seat", "role", "role_text", "alive", "talk_turns", "talk_seconds")
+
+    def __init__(self, uid, name, seat=None, role=None):
+        self.uid = uid
+        self.seat = seat
+        self.set_role(role)
+        self.alive = True
+        self.talk_turns = 0
+        self.talk_seconds = 0.0
+        self.rename(name)
+
+    def rename(self, name):
+        self.name = name
+        self.mention = mention_html(self.uid, name)
+
+    def set_role(self, role):
+        self.role = role
+        self.role_text = html.escape(str(role)) if role else "❓"
+
+    @property
+    def bold_mention(self):
+        return f"<b>{self.mention}</b>"
+
+    def __repr__(self):
+        return f"PlayerRecord(uid={self.uid}, seat={self.seat}, name={self.name!r}, role={self.role!r})"
+
+
+class Roster:
+    """
+    نگه‌داری رکوردها به صورت {uid: PlayerRecord}.
+    استفاده:
+      roster = Roster()
+      rec = roster.seated(seat, uid, name)   # ساخت/به‌روزرسانی
+      rec.mention, rec.role, rec.alive
+      roster.assign_roles({uid: role}); roster.transfer(old_uid, new_uid, name, seat)
+    """
+
+    __slots__ = ("_by_uid",)
+
+    def __init__(self):
+        self._by_uid = {}
+
+    def get(self, uid):
+        return self._by_uid.get(uid)
+
+    def __contains__(self, uid):
+        return uid in self._by_uid
+
+    def __len__(self):
+        return len(self._by_uid)
+
+    def __iter__(self):
+        """همهٔ رکوردها، از جمله بازیکنان حذف‌شده (alive=False)"""
+        return iter(list(self._by_uid.values()))
+
+    def seated(self, seat, uid, name):
+        """رکورد بازیکن روی صندلی؛ اسم عوض شده باشد فقط منشن دوباره ساخته می‌شود"""
+        rec = self._by_uid.get(uid)
+        if rec is None:
+            rec = self._by_uid[uid] = PlayerRecord(uid, name, seat)
+        else:
+            if rec.name != name:
+                rec.rename(name)
+            rec.seat = seat
+        return rec
+
+    def assign_roles(self, mapping):
+        for rec in self._by_uid.values():
+            rec.set_role(None)
+        for uid, role in mapping.items():
+            rec = self._by_uid.get(uid)
+            if rec is None:
+                rec = self._by_uid[uid] = PlayerRecord(uid, str(uid))
+            rec.set_role(role)
+
+    def has_roles(self):
+        return any(rec.role for rec in self._by_uid.values())
+
+    def role_of(self, uid, default=None):
+        rec = self._by_uid.get(uid)
+        return rec.role if rec and rec.role else default
+
+    def transfer(self, old_uid, new_uid, name, seat):
+        """جایگزینی بازیکن: نقش و وضعیت صندلی به بازیکن جدید منتقل می‌شود"""
+        old = self._by_uid.pop(old_uid, None)
+        rec = self.seated(seat, new_uid, name)
+        if old is not None:
+            rec.role, rec.role_text = old.role, old.role_text
+            rec.alive = old.alive
+        return rec
+
+    def discard(self, uid):
+        return self._by_uid.pop(uid, None)
+
+    def clear(self):
+        self._by_uid.clear()
+
+
+# --------------------------------------------------------
+# بنچمارک حافظه/رندر: ۱۰ هزار بازی شبیه‌سازی شده
+#   python player_record.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import timeit
+    import tracemalloc
+
+    GAMES, SEATS = 10_000, 12
+
+    def build_dicts():
+        games = []
+        for g in range(GAMES):
+            players = {g * 100 + s: f"بازیکن <{s}>" for s in range(1, SEATS + 1)}
+            slots = {s: g * 100 + s for s in range(1, SEATS + 1)}
+            in_game = {s: {"id": uid, "name": players[uid], "role": "شهروند"} for s, uid in slots.items()}
+            games.append((players, slots, in_game))
+        return games
+
+    def build_records():
+        games = []
+        for g in range(GAMES):
+            roster = Roster()
+            for s in range(1, SEATS + 1):
+                roster.seated(s, g * 100 + s, f"بازیکن <{s}>").set_role("شهروند")
+            games.append(roster)
+        return games
+
+    for label, build in (("dicts", build_dicts), ("records", build_records)):
+        tracemalloc.start()
+        data = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:8s} {size / GAMES / 1024:6.1f} KiB/game")
+        del data
+
+    players, slots, in_game = build_dicts()[0]
+    roster = build_records()[0]
+    recs = sorted(roster._by_uid.values(), key=lambda r: r.seat)
+
+    def render_dicts():
+        return "".join(f"{s:02d}. <a href='tg://user?id={uid}'>{html.escape(players.get(uid, '❓'))}</a> — "
+                       f"{html.escape(in_game.get(s, {}).get('role', '❓'))}\n" for s, uid in sorted(slots.items()))
+
+    def render_records():
+        return "".join(f"{r.seat:02d}. {r.mention} — {r.role_text}\n" for r in recs)
+
+    assert render_dicts() == render_records()
+    n = 20_000
+    for label, fn in (("dicts", render_dicts), ("records", render_records)):
+        t = timeit.timeit(fn, number=n)
+        print(f"render {label:8s} {t / n * 1e6:6.2f} µs/call")
@@ -0,0 +1,133 @@
+# profiler.py
+# --------------------------------------------------------
+# پروفایل روی درخواست برای ربات در حال اجرا (بدون ری‌دیپلوی)
+# - cpu: cProfile زمان‌دار روی همان thread event loop
+# - mem: دو snapshot از tracemalloc و مقایسهٔ بزرگ‌ترین تخصیص‌دهنده‌ها
+# - tasks: stack همهٔ تسک‌های asyncio
+# گزارش کامل در پوشهٔ profiles/ نوشته می‌شود و خلاصه برگردانده می‌شود.
+# تا وقتی پروفایلی اجرا نشود هیچ هزینه‌ای ندارد (چیزی فعال نیست).
+# --------------------------------------------------------
+
+import io
+import os
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+import tracemalloc
+from collections import Counter
+
+LOG_TAG = "Profiler"
+
+REPORTS_DIR = "profiles"
+MAX_SECONDS = 120
+TOP_N = 15
+
+_lock = asyncio.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """یک پروفایل دیگر در حال اجراست"""
+
+
+def _report_path(kind):
+    return os.path.join(REPORTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+async def _save(path, text):
+    await asyncio.to_thread(_write, path, text)
+    logging.info("%s: گزارش در %s نوشته شد", LOG_TAG, path)
+    return path
+
+
+def clamp(seconds):
+    return max(1, min(int(seconds), MAX_SECONDS))
+
+
+async def _exclusive(coro_fn, *args):
+    if _lock.locked():
+        raise ProfilerBusy("profiling already running")
+    async with _lock:
+        return await coro_fn(*args)
+
+
+# -------------------------
+# CPU
+# -------------------------
+async def _cpu(seconds):
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out).sort_stats("cumulative")
+    stats.print_stats(60)
+    path = await _save(_report_path("cpu"), out.getvalue())
+    await asyncio.to_thread(prof.dump_stats, path[:-4] + ".prof")
+
+    top = io.StringIO()
+    pstats.Stats(prof, stream=top).sort_stats("tottime").print_stats(TOP_N)
+    lines = [l for l in top.getvalue().splitlines() if l.strip()]
+    # فقط جدول (از سطر عنوان ncalls به بعد)
+    start = next((i for i, l in enumerate(lines) if l.lstrip().startswith("ncalls")), 0)
+    return path, "\n".join(lines[start:start + TOP_N + 1])
+
+
+async def profile_cpu(seconds=10):
+    return await _exclusive(_cpu, clamp(seconds))
+
+
+# -------------------------
+# حافظه
+# -------------------------
+async def _mem(seconds):
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    diff = after.compare_to(before, "lineno")
+    path = await _save(_report_path("mem"), "\n".join(str(d) for d in diff[:200]))
+    current = sum(s.size for s in after.statistics("filename"))
+    summary = [f"traced: {current / 1024:.0f} KiB"]
+    summary += [str(d) for d in diff[:TOP_N // 2]]
+    return path, "\n".join(summary)
+
+
+async def profile_memory(seconds=30):
+    return await _exclusive(_mem, clamp(seconds))
+
+
+# -------------------------
+# تسک‌ها
+# -------------------------
+async def dump_tasks():
+    tasks = asyncio.all_tasks()
+    out = io.StringIO()
+    names = Counter()
+    for t in tasks:
+        coro = t.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        names[name] += 1
+        out.write(f"--- {t.get_name()} ({name})\n")
+        t.print_stack(limit=15, file=out)
+        out.write("\n")
+    path = await _save(_report_path("tasks"), out.getvalue())
+    summary = [f"tasks: {len(tasks)}"] + [f"{c:4d}  {n}" for n, c in names.most_common(TOP_N)]
+    return path, "\n".join(summary)
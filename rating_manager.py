@@ -1,28 +1,22 @@
 # ratings_manager.py
-import json
-import os
 import statistics
 import datetime
+import storage
 
 RATINGS_FILE = "ratings.json"
 COUNTER_FILE = "event_counter.json"
 
-def _ensure_file(path, default):
-    if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(default, f, ensure_ascii=False, indent=2)
+DEFAULT_COUNTER = {"last_event": 421}   # شما گفتی قبلا 421 انجام شده
 
-# ساخت فایل‌ها اگر نبودند
-_ensure_file(RATINGS_FILE, {})
-_ensure_file(COUNTER_FILE, {"last_event": 421})   # شما گفتی قبلا 421 انجام شده
-
-def _load(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+# ایمپورت این ماژول فایلی نمی‌سازد؛ فایل‌ها در اولین ذخیره ساخته می‌شوند
+def _load(path, default):
+    data = storage.load_json(path)
+    return dict(default) if data is None else data
 
 def _save(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # سریالایز همین‌جا، نوشتن روی دیسک در thread نویسندهٔ storage
+    # (بدون indent تا encoder سریع C استفاده شود؛ این فایل‌ها دستی ویرایش نمی‌شوند)
+    storage.save_json(path, data, indent=None)
 
 class RatingManager:
     """
@@ -33,8 +27,8 @@ class RatingManager:
     - محاسبه میانگین برای event، ماه، کلی
     """
     def __init__(self):
-        self._ratings = _load(RATINGS_FILE)    # ساختار: { "event_422": { "targets": { "<uid>": { "voters": { "<voter>": {"score":int,"changes":int} } } }, "created": "YYYY-MM-DD" } }
-        self._counter = _load(COUNTER_FILE)
+        self._ratings = _load(RATINGS_FILE, {})    # ساختار: { "event_422": { "targets": { "<uid>": { "voters": { "<voter>": {"score":int,"changes":int} } } }, "created": "YYYY-MM-DD" } }
+        self._counter = _load(COUNTER_FILE, DEFAULT_COUNTER)
 
     # ---------- event helper ----------
     def next_event_id(self):
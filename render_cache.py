@@ -0,0 +1,108 @@
+# render_cache.py
+# --------------------------------------------------------
+# کش قالب پیام‌ها و کیبوردها
+# بخش‌های ثابت (دکمه‌ها/ردیف‌های ثابت، منشن بازیکنان) یک بار
+# سریالایز می‌شوند و فقط بخش‌های متغیر (تایمر، اسم‌ها، صندلی‌ها) پر می‌شوند.
+# خروجی کیبوردها رشتهٔ JSON آماده است که مستقیم به reply_markup داده می‌شود.
+# --------------------------------------------------------
+
+import json
+import html
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 1024
+
+
+def button_json(text, callback_data):
+    """یک دکمهٔ inline به صورت JSON (فقط یک بار برای هر متن/داده ساخته شود)"""
+    return json.dumps({"text": text, "callback_data": callback_data}, ensure_ascii=False)
+
+
+def keyboard_json(rows):
+    """rows: لیست ردیف‌ها، هر ردیف لیستی از دکمه‌های سریالایز شده"""
+    return '{"inline_keyboard":[' + ",".join("[" + ",".join(row) + "]" for row in rows) + "]}"
+
+
+def chunk(items, width):
+    return [items[i:i + width] for i in range(0, len(items), width)]
+
+
+class TemplateCache:
+    """
+    کش LRU محدود برای قطعه‌های رندر شده.
+    کلیدها باید همه‌ی ورودی‌های موثر را داشته باشند (سناریو، نسخهٔ تنظیمات، ...).
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        try:
+            value = self._items[key]
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+        self.misses += 1
+        value = self._items[key] = build()
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._items.clear()
+
+    # -------------------------
+    # کمک‌های رایج
+    # -------------------------
+    def mention(self, uid, name, bold=False):
+        """منشن HTML با اسم escape شده"""
+        return self.get(
+            ("mention", uid, name, bold),
+            lambda: (f"<a href='tg://user?id={uid}'><b>{html.escape(str(name))}</b></a>" if bold
+                     else f"<a href='tg://user?id={uid}'>{html.escape(str(name))}</a>")
+        )
+
+    def button(self, text, callback_data):
+        return self.get(("btn", text, callback_data), lambda: button_json(text, callback_data))
+
+
+# --------------------------------------------------------
+# بنچمارک: ساخت InlineKeyboardMarkup + سریالایز در مقابل قالب کش شده
+#   python render_cache.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import timeit
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from aiogram.utils.payload import prepare_arg
+
+    cache = TemplateCache()
+    names = {i: f"بازیکن <{i}>" for i in range(1, 13)}
+
+    def fresh():
+        kb = InlineKeyboardMarkup(row_width=5)
+        for i in range(1, 13):
+            kb.insert(InlineKeyboardButton(f"{i} ({names[i]})", callback_data=f"slot_{i}"))
+        kb.row(InlineKeyboardButton("✅ ورود به بازی", callback_data="join_game"),
+               InlineKeyboardButton("❌ خروج از بازی", callback_data="leave_game"))
+        kb.add(InlineKeyboardButton("⏭ نکست", callback_data="next_3"))
+        text = "".join(f"- <a href='tg://user?id={i}'>{html.escape(n)}</a>\n" for i, n in names.items())
+        return prepare_arg(kb), text
+
+    static_row = [button_json("✅ ورود به بازی", "join_game"), button_json("❌ خروج از بازی", "leave_game")]
+    next_row = [button_json("⏭ نکست", "next_3")]
+
+    def cached():
+        seats = [cache.button(f"{i} ({names[i]})", f"slot_{i}") for i in range(1, 13)]
+        text = "".join(f"- {cache.mention(i, n)}\n" for i, n in names.items())
+        return keyboard_json(chunk(seats, 5) + [static_row, next_row]), text
+
+    assert json.loads(fresh()[0]) == json.loads(cached()[0])
+    n = 20_000
+    for name, fn in (("fresh build+serialize", fresh), ("template cache", cached)):
+        t = timeit.timeit(fn, number=n)
+        print(f"{name:22s} {t / n * 1e6:7.2f} µs/call")
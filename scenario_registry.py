@@ -0,0 +1,357 @@
+# scenario_registry.py
+# --------------------------------------------------------
+# رجیستری سناریوها (scenarios.json)
+# - هر سناریو یک شیء فقط‌خواندنی Scenario با متادیتای از پیش محاسبه شده است
+#   (تعداد صندلی، شمارش نقش‌ها، توازن تیم‌ها، حداقل بازیکن معتبر، اقدام شب نقش‌ها)
+# - اگر فایل عوض شود (مثلاً دستی ویرایش شود) بدون ری‌استارت دوباره خوانده می‌شود؛
+#   stat/خواندن فایل در thread جدا انجام می‌شود تا event loop بلاک نشود
+# - سناریوهای ردشده (نامعتبر) خام نگه داشته می‌شوند و در save() دوباره نوشته می‌شوند
+# - ذخیره‌سازی اتمیک و بیرون از event loop است (storage)
+# --------------------------------------------------------
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import storage
+
+LOG_TAG = "ScenarioRegistry"
+
+SCENARIOS_FILE = "scenarios.json"
+RELOAD_CHECK_INTERVAL = 2.0   # ثانیه — فاصلهٔ بررسی تغییر فایل
+
+# اگر فایل نبود، این سناریوها استفاده می‌شوند
+DEFAULT_SCENARIOS = {
+    "سناریو کلاسیک": {"min_players": 5, "roles": ["مافیا", "مافیا", "شهروند", "شهروند", "شهروند"]},
+    "سناریو ویژه": {"min_players": 6, "roles": ["مافیا", "مافیا", "شهروند", "شهروند", "شهروند", "کارآگاه"]},
+}
+
+MAFIA = "mafia"
+CITIZEN = "citizen"
+INDEPENDENT = "independent"
+FACTIONS = (MAFIA, CITIZEN, INDEPENDENT)
+
+# نقش‌های شناخته شدهٔ تیم مافیا و مستقل؛ بقیه شهروند حساب می‌شوند.
+# هر سناریو می‌تواند با کلید "factions" ({نقش: تیم}) این را بازنویسی کند.
+MAFIA_ROLES = frozenset({
+    "مافیا", "پدرخوانده", "پابلو اسکوبار(پدرخوانده)", "ماتادور", "خوان(ماتادور)",
+    "گودمن", "بلانکو(گودمن)", "دن مافیا", "رئیس مافیا", "نوفیس", "ناتاشا",
+    "جادوگر", "جلاد", "آل کاپون", "بمب گذار", "شعبده باز", "جاسوس", "تروریست",
+    "شیاد", "ناتو",
+})
+INDEPENDENT_ROLES = frozenset({"زودیاک", "جک گنجیشکه", "قمار باز"})
+
+
+# اقدام شب: نوع + ترتیب اجرا (کوچک‌تر زودتر) + مهلت جواب (ثانیه)
+# shared: اقدام تیمی — هر شب فقط یک نفر از تیم (رهبر) آن را انجام می‌دهد (team_leader)
+NIGHT_KINDS = ("block", "shot", "save", "inquiry")
+NIGHT_TIMEOUT = 60
+
+
+class NightRole(NamedTuple):
+    kind: str
+    order: int
+    timeout: int = NIGHT_TIMEOUT
+    shared: bool = False
+
+
+# نقش‌های شناخته شده که شب اقدام دارند؛ هر سناریو می‌تواند با کلید "night_actions"
+# ({نقش: {"kind": ..., "order": ..., "timeout": ..., "shared": ...}} یا {نقش: null} برای حذف) بازنویسی کند.
+# شلیک مافیا یک شلیک تیمی است: پدرخوانده (یا رئیس) اگر زنده باشد، وگرنه یکی از مافیاهای ساده.
+TEAM_SHOT = NightRole("shot", 20, shared=True)
+DEFAULT_NIGHT_ACTIONS = {
+    "ماتادور": NightRole("block", 10), "خوان(ماتادور)": NightRole("block", 10),
+    "جادوگر": NightRole("block", 10),
+    "پدرخوانده": TEAM_SHOT, "پابلو اسکوبار(پدرخوانده)": TEAM_SHOT,
+    "دن مافیا": TEAM_SHOT, "رئیس مافیا": TEAM_SHOT,
+    "آل کاپون": TEAM_SHOT, "مافیا": TEAM_SHOT,
+    "لئون": NightRole("shot", 25), "زودیاک": NightRole("shot", 25),
+    "دکتر": NightRole("save", 30), "دکتر واتسون": NightRole("save", 30), "محافظ": NightRole("save", 30),
+    "کاراگاه": NightRole("inquiry", 40), "کارآگاه": NightRole("inquiry", 40),
+}
+
+
+def default_faction(role):
+    if role in MAFIA_ROLES:
+        return MAFIA
+    if role in INDEPENDENT_ROLES:
+        return INDEPENDENT
+    return CITIZEN
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Scenario:
+    name: str
+    roles: tuple                # ترتیب اصلی نقش‌ها
+    min_players: int
+    seat_count: int             # = len(roles) = حداکثر بازیکن
+    role_counts: tuple          # ((نقش, تعداد), ...) به ترتیب اولین حضور
+    factions: tuple             # ((نقش, تیم), ...)
+    faction_balance: tuple      # ((تیم, تعداد), ...) برای mafia / citizen / independent
+    night_actions: tuple = ()   # ((نقش, NightRole), ...) فقط نقش‌هایی که شب اقدام دارند
+
+    @property
+    def max_players(self):
+        return self.seat_count
+
+    def faction_of(self, role):
+        for r, f in self.factions:
+            if r == role:
+                return f
+        return default_faction(role)
+
+    def night_action(self, role):
+        """NightRole نقش یا None اگر شب کاری ندارد"""
+        for r, action in self.night_actions:
+            if r == role:
+                return action
+        return None
+
+    def team_leader(self, candidates):
+        """
+        candidates: [(seat, role)] زنده‌هایی که اقدام تیمی یکسان (تیم و نوع) دارند.
+        رهبر: نقشی که در سناریو یکتاست (پدرخوانده) بر نقش تکراری (مافیا) مقدم است؛ بعد صندلی کمتر.
+        """
+        counts = dict(self.role_counts)
+        return min(candidates, key=lambda c: (counts.get(c[1], 0), c[0]), default=None)
+
+    def accepts(self, player_count):
+        return self.min_players <= player_count <= self.seat_count
+
+    def to_json(self):
+        data = {"roles": list(self.roles), "min_players": self.min_players}
+        overrides = {r: f for r, f in self.factions if f != default_faction(r)}
+        if overrides:
+            data["factions"] = overrides
+        night = dict(self.night_actions)
+        night_overrides = {}
+        for r, _ in self.role_counts:
+            action, default = night.get(r), DEFAULT_NIGHT_ACTIONS.get(r)
+            if action != default:
+                night_overrides[r] = action._asdict() if action else None
+        if night_overrides:
+            data["night_actions"] = night_overrides
+        return data
+
+    @classmethod
+    def build(cls, name, raw):
+        """ساخت و اعتبارسنجی سناریو از دیکشنری خام JSON"""
+        if not isinstance(raw, dict):
+            raise ScenarioError(f"{name}: ساختار سناریو نامعتبر است")
+        roles = raw.get("roles")
+        if not isinstance(roles, (list, tuple)) or not roles:
+            raise ScenarioError(f"{name}: لیست نقش‌ها خالی یا نامعتبر است")
+        roles = tuple(str(r).strip() for r in roles)
+        if any(not r for r in roles):
+            raise ScenarioError(f"{name}: نقش خالی در لیست وجود دارد")
+
+        seat_count = len(roles)
+        try:
+            min_players = int(raw.get("min_players", seat_count))
+        except (TypeError, ValueError):
+            raise ScenarioError(f"{name}: min_players باید عدد باشد")
+        if not 1 <= min_players <= seat_count:
+            raise ScenarioError(f"{name}: min_players باید بین 1 و {seat_count} باشد")
+
+        overrides = raw.get("factions") or {}
+        if not isinstance(overrides, dict):
+            raise ScenarioError(f"{name}: factions باید دیکشنری باشد")
+        bad = [f for f in overrides.values() if f not in FACTIONS]
+        if bad:
+            raise ScenarioError(f"{name}: تیم نامعتبر {bad}")
+
+        counts = Counter(roles)
+        factions = tuple((r, overrides.get(r, default_faction(r))) for r in counts)
+        faction_of = dict(factions)
+        balance = Counter(faction_of[r] for r in roles)
+
+        night_raw = raw.get("night_actions") or {}
+        if not isinstance(night_raw, dict):
+            raise ScenarioError(f"{name}: night_actions باید دیکشنری باشد")
+        night_actions = []
+        for r in counts:
+            if r not in night_raw:
+                action = DEFAULT_NIGHT_ACTIONS.get(r)
+            elif night_raw[r] is None:
+                action = None
+            else:
+                spec = night_raw[r]
+                try:
+                    action = NightRole(str(spec["kind"]), int(spec.get("order", 50)),
+                                       int(spec.get("timeout", NIGHT_TIMEOUT)), bool(spec.get("shared", False)))
+                except (TypeError, KeyError, ValueError):
+                    raise ScenarioError(f"{name}: اقدام شب نامعتبر برای {r}")
+                if action.kind not in NIGHT_KINDS or action.timeout <= 0:
+                    raise ScenarioError(f"{name}: اقدام شب نامعتبر برای {r}")
+            if action is not None:
+                night_actions.append((r, action))
+
+        return cls(
+            name=name,
+            roles=roles,
+            min_players=min_players,
+            seat_count=seat_count,
+            role_counts=tuple(counts.items()),
+            factions=factions,
+            faction_balance=tuple((f, balance.get(f, 0)) for f in FACTIONS),
+            night_actions=tuple(night_actions),
+        )
+
+
+class ScenarioRegistry:
+    """
+    نگه‌داری سناریوها به صورت {نام: Scenario}
+    استفاده:
+      scenarios = ScenarioRegistry()
+      scen = scenarios.get("کاپو")      # یا None
+      scen.seat_count, scen.min_players
+      scenarios.add(name, roles, min_players); scenarios.remove(name)
+      await scenarios.refresh()         # بررسی تغییر فایل بیرون از event loop
+    """
+
+    def __init__(self, path=SCENARIOS_FILE, autoload=True):
+        self.path = path
+        self._items = {}
+        self._rejected = {}          # نام → دادهٔ خام سناریوی نامعتبر (در save حفظ می‌شود)
+        self._mtime = None
+        self._refreshing = None      # تسک refresh در حال اجرا
+        self._next_check = 0.0
+        self._loaded = False
+        if autoload:
+            self.load()
+
+    # -------------------------
+    # بارگذاری / hot reload
+    # -------------------------
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        """(mtime, دادهٔ خام) — بلاک‌کننده؛ دادهٔ None یعنی فایل خراب است"""
+        mtime = self._stat_mtime()
+        if mtime is None:
+            return None, DEFAULT_SCENARIOS
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return mtime, json.load(f)
+        except Exception as e:
+            logging.exception("%s: خطا در خواندن %s: %s", LOG_TAG, self.path, e)
+            return mtime, None
+
+    def _apply(self, mtime, raw):
+        if raw is not None:
+            items, rejected = {}, {}
+            for name, data in raw.items():
+                try:
+                    items[name] = Scenario.build(name, data)
+                except ScenarioError as e:
+                    rejected[name] = data
+                    logging.warning("%s: سناریو رد شد: %s", LOG_TAG, e)
+            self._items, self._rejected = items, rejected
+        self._mtime = mtime
+        self._loaded = True
+        self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+
+    def load(self):
+        """بارگذاری همگام (در on_startup داخل asyncio.to_thread صدا زده می‌شود)"""
+        self._apply(*self._read())
+
+    async def refresh(self):
+        """اگر فایل بعد از آخرین بارگذاری تغییر کرده باشد، دوباره بخوان (حداکثر هر چند ثانیه یک بار)"""
+        if self._loaded:
+            now = time.monotonic()
+            if now < self._next_check:
+                return
+            self._next_check = now + RELOAD_CHECK_INTERVAL
+            if await asyncio.to_thread(self._stat_mtime) == self._mtime:
+                return
+            logging.info("%s: %s تغییر کرد؛ بارگذاری مجدد.", LOG_TAG, self.path)
+        self._apply(*await asyncio.to_thread(self._read))
+
+    def _poll(self):
+        """
+        دسترسی‌های همگام منتظر دیسک نمی‌مانند: بررسی فایل در پس‌زمینه شروع می‌شود
+        و نتیجه از دسترسی بعدی دیده می‌شود. بیرون از event loop (اسکریپت‌ها) همگام است.
+        """
+        if self._loaded and time.monotonic() < self._next_check:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if not self._loaded or self._stat_mtime() != self._mtime:
+                self.load()
+            else:
+                self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+            return
+        if not self._loaded:
+            self.load()   # فقط اگر on_startup هنوز بارگذاری نکرده
+        elif self._refreshing is None or self._refreshing.done():
+            self._refreshing = loop.create_task(self.refresh())
+
+    # -------------------------
+    # دسترسی
+    # -------------------------
+    def get(self, name):
+        self._poll()
+        return self._items.get(name) if name else None
+
+    def __getitem__(self, name):
+        self._poll()
+        return self._items[name]
+
+    def __contains__(self, name):
+        self._poll()
+        return name in self._items
+
+    def __iter__(self):
+        self._poll()
+        return iter(list(self._items))
+
+    def __len__(self):
+        self._poll()
+        return len(self._items)
+
+    # -------------------------
+    # تغییر و ذخیره
+    # -------------------------
+    def add(self, name, roles, min_players):
+        if not self._loaded:
+            self.load()
+        scen = Scenario.build(name, {"roles": roles, "min_players": min_players})
+        self._items[name] = scen
+        self._rejected.pop(name, None)
+        self.save()
+        return scen
+
+    def remove(self, name):
+        if not self._loaded:
+            self.load()
+        scen = self._items.pop(name, None)
+        if scen is not None or self._rejected.pop(name, None) is not None:
+            self.save()
+        return scen
+
+    def to_json(self):
+        data = {name: scen.to_json() for name, scen in self._items.items()}
+        for name, raw in self._rejected.items():
+            data.setdefault(name, raw)   # سناریوی نامعتبر دست‌نخورده برمی‌گردد تا گرداننده اصلاحش کند
+        return data
+
+    def save(self):
+        """نوشتن اتمیک در thread نویسندهٔ storage؛ بعد از نوشتن mtime به‌روز می‌شود تا hot reload بی‌جهت اجرا نشود"""
+        storage.save_json(self.path, self.to_json(), callback=self._written)
+
+    def _written(self, path):
+        self._mtime = self._stat_mtime()
@@ -0,0 +1,198 @@
+# storage.py
+# --------------------------------------------------------
+# لایهٔ مشترک نوشتن فایل‌های JSON بیرون از event loop
+# - سریالایز (json.dumps) همان لحظه در thread صدا زننده انجام می‌شود (ارزان + snapshot سازگار)
+# - نوشتن، fsync و rename اتمیک در یک thread نویسندهٔ اختصاصی
+# - ترتیب نوشتن هر فایل حفظ می‌شود و نوشتن‌های پشت سر هم یک فایل
+#   یکی می‌شوند (فقط آخرین نسخه نوشته می‌شود)
+# استفاده:
+#   import storage
+#   storage.save_json("ratings.json", data)
+#   data = storage.load_json("ratings.json", {})
+#   storage.flush()        # هنگام خاموش شدن
+# --------------------------------------------------------
+
+import os
+import json
+import atexit
+import logging
+import tempfile
+import threading
+from collections import deque
+
+LOG_TAG = "Storage"
+
+_REMOVE = object()   # payload ویژه: حذف فایل
+
+
+class StorageWriter:
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._pending = {}        # path -> (payload bytes | _REMOVE, callback)
+        self._order = deque()     # ترتیب فایل‌ها برای نوشتن
+        self._busy = False
+        self._closed = False
+        self._thread = None
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    # -------------------------
+    # API
+    # -------------------------
+    def write(self, path, payload, callback=None):
+        """payload: bytes آماده؛ callback(path) بعد از نوشتن در thread نویسنده صدا زده می‌شود"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._closed:
+                # بعد از close (مثلاً در atexit) مستقیم بنویس
+                self._write_file(path, payload, callback)
+                return
+            if path in self._pending:
+                self.coalesced += 1
+            else:
+                self._order.append(path)
+            self._pending[path] = (payload, callback)
+            self._ensure_thread()
+            self._lock.notify_all()
+
+    def remove(self, path, callback=None):
+        self.write(path, _REMOVE, callback)
+
+    def flush(self, timeout=None):
+        """صبر تا همهٔ نوشتن‌های در صف روی دیسک بروند؛ False اگر timeout شد"""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+
+    # -------------------------
+    # thread نویسنده
+    # -------------------------
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._order or self._closed)
+                if not self._order:
+                    return
+                path = self._order.popleft()
+                payload, callback = self._pending.pop(path)
+                self._busy = True
+            try:
+                self._write_file(path, payload, callback)
+            finally:
+                with self._lock:
+                    self._busy = False
+                    self._lock.notify_all()
+
+    def _write_file(self, path, payload, callback):
+        try:
+            if payload is _REMOVE:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                directory = os.path.dirname(path)
+                fd, tmp = tempfile.mkstemp(prefix=".tmp.", suffix=".json", dir=directory)
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(payload)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, path)
+                except Exception:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+                    raise
+            self.writes += 1
+            if callback is not None:
+                callback(path)
+        except Exception as e:
+            self.errors += 1
+            logging.exception("%s: نوشتن %s ناموفق: %s", LOG_TAG, path, e)
+
+
+writer = StorageWriter()
+
+
+def dumps(data, indent=2):
+    return json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+def save_json(path, data, indent=2, callback=None):
+    """سریالایز همین الان، نوشتن در thread نویسنده"""
+    writer.write(path, dumps(data, indent), callback)
+
+
+def remove(path, callback=None):
+    writer.remove(path, callback)
+
+
+def load_json(path, default=None):
+    """خواندن همزمان (فقط در استارتاپ یا داخل asyncio.to_thread)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def flush(timeout=None):
+    return writer.flush(timeout)
+
+
+# --------------------------------------------------------
+# بنچمارک: زمان «هندلر» زیر بار نوشتن سنگین
+#   python storage.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import time
+    import asyncio
+    import shutil
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "ratings.json")
+    data = {f"event_{i}": {"targets": {str(t): {"voters": {str(v): {"score": 4, "changes": 0}
+                                                           for v in range(12)}} for t in range(12)}}
+            for i in range(40)}
+
+    def sync_save(p, d):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(d, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def handler(save):
+        data["event_0"]["targets"]["0"]["voters"]["0"]["changes"] += 1
+        save(path, data)
+        await asyncio.sleep(0)
+
+    async def run(label, save, n=300):
+        lat = []
+        for _ in range(n):
+            t = time.perf_counter()
+            await handler(save)
+            lat.append(time.perf_counter() - t)
+        flush()
+        lat.sort()
+        print(f"{label:15s} p50={lat[n // 2] * 1000:6.2f}ms p99={lat[int(n * .99)] * 1000:6.2f}ms")
+
+    asyncio.run(run("sync write", sync_save))
+    asyncio.run(run("storage writer", save_json))
+    # indent=None از encoder سریع C استفاده می‌کند (با indent نسخهٔ پایتونی اجرا می‌شود)
+    asyncio.run(run("writer compact", lambda p, d: save_json(p, d, indent=None)))
+    print(f"writes={writer.writes} coalesced={writer.coalesced}")
+    shutil.rmtree(tmpdir)
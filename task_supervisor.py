@@ -0,0 +1,119 @@
+# task_supervisor.py
+# --------------------------------------------------------
+# ناظر تسک‌های پس‌زمینه به تفکیک بازی
+# - هر تسک با spawn ساخته و زیر (بازی, اسم) ثبت می‌شود
+# - تسک‌های «تکی» (مثل تایمر نوبت) با spawn دوباره جایگزین می‌شوند؛ قبلی لغو می‌شود
+#   و دیگر تسک یتیم نمی‌ماند
+# - خطای مدیریت نشدهٔ هر تسک لاگ می‌شود
+# - stats() تعداد تسک‌های زندهٔ هر بازی را برمی‌گرداند (برای پیدا کردن نشت تسک)
+# --------------------------------------------------------
+
+import asyncio
+import logging
+from collections import Counter
+
+LOG_TAG = "TaskSupervisor"
+
+LEAK_WARN_THRESHOLD = 50   # اگر یک بازی بیشتر از این تسک زنده داشت هشدار بده
+
+
+class TaskSupervisor:
+    """
+    استفاده:
+      supervisor = TaskSupervisor()
+      supervisor.spawn(game_id, countdown(...), name="turn_timer", replace=True)
+      await supervisor.cancel_game(game_id)     # پایان بازی
+      supervisor.stats()   # {game_id: {"turn_timer": 1, ...}}
+    """
+
+    def __init__(self, leak_threshold=LEAK_WARN_THRESHOLD):
+        self.leak_threshold = leak_threshold
+        self._tasks = {}          # game_id -> {task: name}
+        self._singletons = {}     # (game_id, name) -> task
+        self.spawned = 0
+        self.finished = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    # -------------------------
+    # ساخت تسک
+    # -------------------------
+    def spawn(self, game_id, coro, name="task", replace=False):
+        if replace:
+            old = self._singletons.get((game_id, name))
+            if old is not None and not old.done():
+                old.cancel()
+
+        task = asyncio.create_task(coro, name=f"{name}:{game_id}")
+        tasks = self._tasks.setdefault(game_id, {})
+        tasks[task] = name
+        if replace:
+            self._singletons[(game_id, name)] = task
+        self.spawned += 1
+        task.add_done_callback(lambda t, g=game_id: self._done(g, t))
+
+        if len(tasks) > self.leak_threshold:
+            logging.warning("%s: بازی %s %d تسک زنده دارد (احتمال نشت): %s",
+                            LOG_TAG, game_id, len(tasks), dict(Counter(tasks.values())))
+        return task
+
+    def _done(self, game_id, task):
+        tasks = self._tasks.get(game_id)
+        name = "task"
+        if tasks is not None:
+            name = tasks.pop(task, name)
+            if not tasks:
+                self._tasks.pop(game_id, None)
+        if self._singletons.get((game_id, name)) is task:
+            del self._singletons[(game_id, name)]
+
+        self.finished += 1
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        exc = task.exception()
+        if exc is not None:
+            self.failed += 1
+            logging.error("%s: تسک %s (بازی %s) با خطا تمام شد", LOG_TAG, name, game_id,
+                          exc_info=(type(exc), exc, exc.__traceback__))
+
+    # -------------------------
+    # لغو
+    # -------------------------
+    def get(self, game_id, name):
+        """تسک تکی زندهٔ (بازی, اسم) یا None"""
+        task = self._singletons.get((game_id, name))
+        return task if task is not None and not task.done() else None
+
+    async def cancel_game(self, game_id, timeout=5):
+        """لغو همهٔ تسک‌های یک بازی و صبر تا تمام شدنشان"""
+        current = asyncio.current_task()
+        tasks = [t for t in self._tasks.get(game_id, {}) if t is not current and not t.done()]
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        return len(tasks)
+
+    async def cancel_all(self, timeout=5):
+        total = 0
+        for game_id in list(self._tasks):
+            total += await self.cancel_game(game_id, timeout)
+        return total
+
+    # -------------------------
+    # آمار
+    # -------------------------
+    def live(self, game_id=None):
+        if game_id is None:
+            return sum(len(t) for t in self._tasks.values())
+        return len(self._tasks.get(game_id, {}))
+
+    def stats(self):
+        """{game_id: {name: count}} + شمارنده‌های کلی زیر کلید None"""
+        out = {gid: dict(Counter(tasks.values())) for gid, tasks in self._tasks.items()}
+        out[None] = {
+            "spawned": self.spawned, "finished": self.finished,
+            "failed": self.failed, "cancelled": self.cancelled, "live": self.live(),
+        }
+        return out
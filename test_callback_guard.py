@@ -0,0 +1,184 @@
+# test_callback_guard.py
+# --------------------------------------------------------
+# تست CallbackGuard.once
+#   python -m pytest -q test_callback_guard.py
+# --------------------------------------------------------
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from callback_guard import CallbackGuard, UNCHANGED
+
+GAME = -100
+
+
+def make_callback(data="next", user_id=1, message_id=10):
+    async def answer(*args, **kwargs):
+        pass
+    return SimpleNamespace(
+        message=SimpleNamespace(chat=SimpleNamespace(id=GAME), message_id=message_id),
+        inline_message_id=None,
+        data=data,
+        from_user=SimpleNamespace(id=user_id),
+        answer=answer,
+    )
+
+
+def guarded(guard, result=None, delay=0):
+    calls = []
+
+    @guard.once(lambda c: GAME)
+    async def handler(callback):
+        calls.append(callback.data)
+        await asyncio.sleep(delay)
+        return result
+
+    return handler, calls
+
+
+def test_sequential_taps_both_run():
+    guard = CallbackGuard()
+    handler, calls = guarded(guard)
+
+    async def run():
+        await handler(make_callback())
+        await handler(make_callback())
+
+    asyncio.run(run())
+    assert calls == ["next", "next"]
+    assert guard.version(GAME) == 2
+    assert guard.dropped == 0
+
+
+def test_concurrent_duplicate_is_dropped():
+    guard = CallbackGuard()
+    handler, calls = guarded(guard, delay=0.01)
+
+    async def run():
+        await asyncio.gather(handler(make_callback()), handler(make_callback()))
+
+    asyncio.run(run())
+    assert calls == ["next"]
+    assert guard.version(GAME) == 1
+    assert guard.dropped == 1
+
+
+def test_concurrent_taps_from_different_users_both_run():
+    guard = CallbackGuard()
+    handler, calls = guarded(guard, delay=0.01)
+
+    async def run():
+        await asyncio.gather(handler(make_callback(user_id=1)), handler(make_callback(user_id=2)))
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_unchanged_tap_can_be_retried():
+    guard = CallbackGuard()
+    handler, calls = guarded(guard, result=UNCHANGED, delay=0.01)
+
+    async def run():
+        results = await asyncio.gather(handler(make_callback()), handler(make_callback()))
+        await handler(make_callback())
+        return results
+
+    assert asyncio.run(run()) == [None, None]
+    assert calls == ["next"] * 3
+    assert guard.version(GAME) == 0
+    assert guard.dropped == 0
+
+
+def test_failed_tap_is_not_remembered():
+    guard = CallbackGuard()
+    attempts = []
+
+    @guard.once(lambda c: GAME)
+    async def handler(callback):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("telegram down")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await handler(make_callback())
+        await handler(make_callback())
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+    assert guard.version(GAME) == 1
+
+
+# --------------------------------------------------------
+# دابل‌کلیک پشت سر هم روی هندلر واقعی main.py (Bot API محلی)
+# --------------------------------------------------------
+STUB_PORT = 8771
+
+
+def registered_handler(dp, name):
+    """اولین هندلر ثبت‌شده با این اسم (تعریف‌های تکراری بعدی در main.py اجرا نمی‌شوند)"""
+    for obj in dp.callback_query_handlers.handlers:
+        if getattr(obj.handler, "__name__", None) == name:
+            return obj.handler
+    raise LookupError(name)
+
+
+def test_sequential_double_tap_does_not_reshuffle_roles(monkeypatch):
+    import os
+    os.environ.setdefault("API_TOKEN", "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+    import main
+    from aiogram import Bot, types
+    from api_calls import start_stub_api
+    from scenario_registry import Scenario
+
+    handler = registered_handler(main.dp, "distribute_roles_callback")
+    calls = []
+    original = main.distribute_roles
+
+    async def counted():
+        calls.append(1)
+        return await original()
+
+    monkeypatch.setattr(main, "distribute_roles", counted)
+
+    def tap():
+        return types.CallbackQuery(**{
+            "id": "1", "chat_instance": "x", "data": "distribute_roles",
+            "from": {"id": 99, "is_bot": False, "first_name": "god"},
+            "message": {"message_id": 7, "date": 0, "chat": {"id": GAME, "type": "supergroup"}},
+        })
+
+    async def run():
+        runner, server = await start_stub_api(port=STUB_PORT, latency=0)
+        monkeypatch.setattr(main.bot, "server", server)
+        Bot.set_current(main.bot)
+        try:
+            main.reap_game()
+            main.group_chat_id = GAME
+            main.moderator_id = 99
+            main.lobby_message_id = 7
+            main.scenarios._loaded = True
+            main.scenarios._next_check = float("inf")
+            main.scenarios._items["تست"] = Scenario.build("تست", {"roles": ["مافیا", "دکتر", "شهروند", "کارآگاه"]})
+            main.selected_scenario = "تست"
+            for seat in range(1, 5):
+                main.players[seat * 10] = f"بازیکن {seat}"
+                main.player_slots[seat] = seat * 10
+            main.lifecycle.advance("lobby")
+
+            await handler(tap())
+            roles = {rec.uid: rec.role for rec in main.roster}
+            await asyncio.sleep(0.3)
+            await handler(tap())
+            return roles, {rec.uid: rec.role for rec in main.roster}
+        finally:
+            main.reap_game()
+            main.scenarios._items.pop("تست", None)
+            await (await main.bot.get_session()).close()
+            await runner.cleanup()
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert first == second and all(first.values())
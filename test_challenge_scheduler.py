@@ -0,0 +1,119 @@
+# test_challenge_scheduler.py
+# --------------------------------------------------------
+# تست ChallengeScheduler
+# - ترتیب: همهٔ «قبل»ها به ترتیب قبول، بعد «بعد»ها؛ درخواست رد شده هیچ‌وقت اجرا نمی‌شود
+# - peek همیشه همان چیزی است که pop بعدی برمی‌گرداند (با skip هم)
+# - drop هم چالش‌های روی صندلی و هم چالش‌های خود صندلی را پاک می‌کند
+#   python -m pytest -q test_challenge_scheduler.py
+# --------------------------------------------------------
+
+import random
+
+from challenge_scheduler import ChallengeScheduler, ChallengeState, BEFORE, AFTER
+
+
+def consistent(s):
+    """شمارش pending با رکوردها و صف‌ها با رکوردهای accepted جور باشد"""
+    pending = [ch for ch in s._open.values() if ch.state is ChallengeState.PENDING]
+    assert sum(s._pending_from.values()) == len(pending)
+    queued = {(t, c) for t, heap in s._queues.items() for _, _, c in heap}
+    accepted = {k for k, ch in s._open.items() if ch.state is ChallengeState.ACCEPTED}
+    assert queued == accepted
+    assert all(s._queues.values())
+
+
+def test_order_and_round_trip():
+    rnd = random.Random(7)
+    for _ in range(2000):
+        s = ChallengeScheduler()
+        accepted = []
+        for c in rnd.sample(range(1, 30), rnd.randint(0, 12)):
+            s.request(1, c)
+            assert s.request(1, c) is None
+            r = rnd.random()
+            if r < 0.4:
+                t = rnd.choice((BEFORE, AFTER))
+                s.accept(1, c, t)
+                accepted.append((t, c))
+                assert s.accept(1, c, t) is None
+            elif r < 0.7:
+                s.reject(1, c)
+                assert s.reject(1, c) is None
+        expected = [x for x in accepted if x[0] == BEFORE] + [x for x in accepted if x[0] == AFTER]
+        clone = ChallengeScheduler()
+        clone.load(s.to_dict())
+        assert s.queued(1) == expected
+        got = []
+        while True:
+            assert s.peek(1) == clone.peek(1)
+            nxt = s.pop(1)
+            assert nxt == clone.pop(1)
+            if nxt is None:
+                break
+            got.append(nxt)
+        assert got == expected, (got, expected)
+        assert all(ch.state is ChallengeState.PENDING for ch in s._open.values())
+        assert sum(s._pending_from.values()) == len(s)
+
+
+def test_peek_matches_pop_with_skip():
+    rnd = random.Random(11)
+    for _ in range(2000):
+        s = ChallengeScheduler()
+        for c in rnd.sample(range(1, 20), rnd.randint(0, 10)):
+            s.push(1, c, rnd.choice((BEFORE, AFTER)))
+        skip = set(rnd.sample(range(1, 20), rnd.randint(0, 8)))
+        while True:
+            timing = rnd.choice((None, BEFORE, AFTER))
+            peeked = s.peek(1, timing, skip=skip)
+            assert peeked == s.peek(1, timing, skip=skip)
+            popped = s.pop(1, timing, skip=skip)
+            assert peeked == popped
+            consistent(s)
+            if popped is None and s.peek(1, skip=skip) is None:
+                break
+            assert popped is None or popped[1] not in skip
+
+
+def test_drop_purges_target_and_challenger():
+    s = ChallengeScheduler()
+    s.request(1, 2)                 # 2 → 1 pending
+    s.push(3, 2, AFTER)             # 2 → 3 accepted
+    s.push(3, 4, BEFORE)            # 4 → 3 accepted
+    s.request(2, 4)                 # 4 → 2 pending
+    s.push(2, 5, AFTER)             # 5 → 2 accepted
+
+    s.drop(2)
+
+    assert all(2 not in key for key in s._open)
+    assert not s.has_pending_from(2)
+    assert s.queued(3) == [(BEFORE, 4)]
+    assert s.queued(2) == []
+    assert not s.has_pending_from(4)
+    consistent(s)
+    assert s.pop(3) == (BEFORE, 4)
+    assert s.pop(3) is None
+    assert len(s) == 0
+
+
+def test_drop_random_keeps_structures_consistent():
+    rnd = random.Random(3)
+    for _ in range(1000):
+        s = ChallengeScheduler()
+        for _ in range(rnd.randint(0, 30)):
+            t, c = rnd.sample(range(1, 8), 2)
+            r = rnd.random()
+            if r < 0.4:
+                s.request(t, c)
+            elif r < 0.7:
+                s.accept(t, c, rnd.choice((BEFORE, AFTER)))
+            elif r < 0.85:
+                s.push(t, c, rnd.choice((BEFORE, AFTER)))
+            else:
+                s.reject(t, c)
+        seat = rnd.randint(1, 7)
+        s.drop(seat)
+        consistent(s)
+        assert all(seat not in key for key in s._open)
+        assert seat not in s._queues
+        assert all(c != seat for heap in s._queues.values() for _, _, c in heap)
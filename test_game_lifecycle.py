@@ -0,0 +1,116 @@
+# test_game_lifecycle.py
+# --------------------------------------------------------
+# تست soak چرخهٔ عمر بازی در main.py: ۱۰ هزار بازی پشت سر هم ساخته و
+# با end_game جمع می‌شوند؛ RSS پروسه و اندازهٔ ساختارهای هر بازی نباید رشد کند
+#   python -m pytest -q test_game_lifecycle.py
+# --------------------------------------------------------
+
+import os
+import sys
+import asyncio
+import logging
+import resource
+
+os.environ.setdefault("API_TOKEN", "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+
+import main  # noqa: E402
+from challenge_scheduler import AFTER  # noqa: E402
+from game_lifecycle import GamePhase  # noqa: E402
+
+GAMES = 10_000
+WARMUP = 1_000
+SEATS = 10
+RSS_SLACK = 3 * 1024 * 1024   # بایت — نوسان allocator، نه رشد به ازای هر بازی
+
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def structures():
+    """ساختارهایی که با هر بازی پر می‌شوند (و ساختارهای ماندگار ماژول‌ها برای بازی‌ها)"""
+    return {
+        "players": main.players,
+        "player_slots": main.player_slots,
+        "roster": main.roster._by_uid,
+        "removed_players": main.removed_players,
+        "waiting_list": main.waiting_list,
+        "substitute_list": main.substitute_list,
+        "challenges_open": main.challenge_queue._open,
+        "challenges_queues": main.challenge_queue._queues,
+        "challenges_pending": main.challenge_queue._pending_from,
+        "deliveries": main.deliveries._entries,
+        "templates": main.templates._items,
+        "guard_versions": main.guard._versions,
+        "guard_locks": main.guard._locks,
+        "supervisor_tasks": main.supervisor._tasks,
+        "supervisor_singletons": main.supervisor._singletons,
+        "night_rounds": main.night_engine._rounds,
+    }
+
+
+def sizes():
+    return {name: (len(obj), sys.getsizeof(obj)) for name, obj in structures().items()}
+
+
+async def play(game):
+    """یک بازی کوتاه: لابی، پخش نقش، یک دور با چالش، حذف یک بازیکن، بعد end_game"""
+    gid = -1_000_000 - game
+    main.group_chat_id = gid
+    main.lifecycle.advance(GamePhase.LOBBY)
+    base = game * 100
+    for seat in range(1, SEATS + 1):
+        uid = base + seat
+        main.players[uid] = f"بازیکن {seat}"
+        main.player_slots[seat] = uid
+        main.templates.mention(uid, main.players[uid])
+    main.waiting_list.join(base + 50, "رزرو")
+    main.substitute_list.join(base + 51, "جایگزین")
+    main.seated_records()
+    main.roster.assign_roles({base + s: ("مافیا" if s <= 3 else "شهروند") for s in range(1, SEATS + 1)})
+    for seat in range(1, SEATS + 1):
+        main.deliveries.record(base + seat, "delivered")
+    main.lifecycle.advance(GamePhase.RUNNING)
+    main.game_running = True
+
+    main.turns.start(sorted(main.player_slots))
+    main.challenge_queue.request(1, 2)
+    main.challenge_queue.accept(1, 2, AFTER)
+    main.challenge_queue.request(3, 4)
+    main.turns.advance()
+    main.supervisor.spawn(gid, asyncio.sleep(3600), name="turn_timer", replace=True)
+
+    async with main.guard.lock(gid):
+        main.guard.bump(gid)
+
+    main.removed_players.setdefault(gid, {})[5] = {"id": base + 5, "name": "حذف"}
+    main.turns.remove(5)
+
+    await main.end_game()
+
+
+def test_soak_create_and_reap_games():
+    logging.disable(logging.WARNING)
+    try:
+        async def run():
+            for game in range(WARMUP):
+                await play(game)
+            await asyncio.sleep(0)
+            before_rss, before = rss(), sizes()
+            for game in range(WARMUP, GAMES):
+                await play(game)
+            await asyncio.sleep(0)
+            return before_rss, before, rss(), sizes()
+
+        before_rss, before, after_rss, after = asyncio.run(run())
+    finally:
+        logging.disable(logging.NOTSET)
+
+    assert main.lifecycle.reaped_count >= GAMES
+    assert all(length == 0 for length, _ in after.values()), after
+    assert after == before
+    assert after_rss - before_rss < RSS_SLACK, (before_rss, after_rss)
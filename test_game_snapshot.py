@@ -0,0 +1,159 @@
+# test_game_snapshot.py
+# --------------------------------------------------------
+# تست snapshot_game/restore_game در main.py: بازی وسط دور ذخیره و بعد از
+# پاک شدن کامل state (مثل ری‌استارت) برگردانده می‌شود
+# + تست پروسهٔ واقعی: main.py روی Bot API محلی (api_calls.start_stub_api) اجرا،
+#   وسط نوبت SIGTERM، دوباره اجرا و ادامهٔ بازی از snapshot
+#   python -m pytest -q test_game_snapshot.py
+# --------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+
+os.environ.setdefault("API_TOKEN", "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA")
+
+import main  # noqa: E402
+from api_calls import start_stub_api  # noqa: E402
+from challenge_scheduler import AFTER  # noqa: E402
+from game_snapshot import GAME_STATE_FILE, SNAPSHOT_VERSION  # noqa: E402
+
+GROUP = -1001
+
+
+def setup_game():
+    main.reap_game()
+    main.group_chat_id = GROUP
+    main.moderator_id = 99
+    main.game_running = True
+    main.selected_scenario = "سناریو کلاسیک"
+    for seat in range(1, 6):
+        main.players[seat * 10] = f"بازیکن {seat}"
+        main.player_slots[seat] = seat * 10
+    main.seated_records()
+    main.roster.assign_roles({10: "مافیا", 20: "پدرخوانده", 30: "دکتر", 40: "شهروند", 50: "کارآگاه"})
+
+    main.turns.start(sorted(main.player_slots))
+    main.turns.advance()                                  # نوبت صندلی ۲
+    main.challenge_queue.request(2, 4)
+    main.challenge_queue.accept(2, 4, AFTER)
+    main.challenge_queue.request(3, 5)                    # هنوز pending
+    main.current_turn_seat = main.turns.current.seat
+
+    # حذف صندلی ۱ مثل remove_player_confirm
+    main.removed_players.setdefault(GROUP, {})[1] = {"id": 10, "name": main.players[10]}
+    main.roster.get(10).alive = False
+    del main.players[10]
+    del main.player_slots[1]
+    main.turns.remove(1)
+
+
+def test_snapshot_restores_game_in_progress():
+    setup_game()
+    before = {
+        "slots": dict(main.player_slots),
+        "roles": {rec.uid: rec.role for rec in main.roster},
+        "alive": {rec.uid: rec.alive for rec in main.roster},
+        "turns": main.turns.to_dict(),
+        "queued": main.challenge_queue.queued(2),
+        "pending": main.challenge_queue.has_pending_from(5),
+    }
+    state = json.loads(json.dumps(main.snapshot_game(), ensure_ascii=False))
+
+    main.reap_game()
+    assert not main.player_slots and len(main.roster) == 0 and not main.turns
+
+    seat, _, is_challenge = main.restore_game(state)
+    assert seat == 2 and not is_challenge
+    assert main.group_chat_id == GROUP
+    assert main.player_slots == before["slots"]
+    assert {rec.uid: rec.role for rec in main.roster} == before["roles"]
+    assert {rec.uid: rec.alive for rec in main.roster} == before["alive"]
+    assert main.roster.role_of(10) == "مافیا"               # نقش بازیکن حذف‌شده
+    assert main.removed_players[GROUP][1]["id"] == 10
+    assert main.turns.to_dict() == before["turns"]
+    assert main.challenge_queue.queued(2) == before["queued"]
+    assert main.challenge_queue.has_pending_from(5) == before["pending"]
+
+    # ادامهٔ دور بعد از بازیابی: چالش «بعد» صندلی ۴، بعد نوبت صندلی ۳
+    assert main.turns.advance() == (4, True, main.CHALLENGE_TURN_DURATION)
+    assert main.turns.advance().seat == 3
+    main.reap_game()
+
+
+# --------------------------------------------------------
+# kill وسط بازی و ادامه بعد از ری‌استارت (پروسهٔ جدا)
+# --------------------------------------------------------
+STUB_PORT = 8772
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+async def wait_until(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        await asyncio.sleep(0.05)
+
+
+def resumed(calls, start):
+    """پیام «ربات دوباره راه‌اندازی شد» به گروه رفته و polling بعد از آن شروع شده؟"""
+    sent = [i for i, (m, p) in enumerate(calls[start:], start)
+            if m == "sendmessage" and p.get("chat_id") == str(GROUP) and "♻️" in p.get("text", "")]
+    return bool(sent) and any(m == "getupdates" for m, _ in calls[sent[0]:])
+
+
+async def run_bot(workdir, calls):
+    """main.py را اجرا کن، صبر تا بازی ادامه پیدا کند، SIGTERM و صبر تا on_shutdown"""
+    start = len(calls)
+    env = dict(os.environ, API_TOKEN=os.environ["API_TOKEN"], PYTHONPATH=HERE,
+               TELEGRAM_API_SERVER=f"http://127.0.0.1:{STUB_PORT}")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(HERE, "main.py"), cwd=workdir, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await wait_until(lambda: resumed(calls, start))
+        assert not os.path.exists(os.path.join(workdir, GAME_STATE_FILE))   # snapshot مصرف شد
+        await asyncio.sleep(1.2)          # تایمر نوبت جلو برود
+        proc.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(proc.wait(), 30)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    with open(os.path.join(workdir, GAME_STATE_FILE), encoding="utf-8") as f:
+        return json.load(f)["state"]
+
+
+def test_sigterm_mid_turn_and_resume(tmp_path):
+    setup_game()
+    main.turn_deadline = time.time() + 100
+    seeded = json.loads(json.dumps(main.snapshot_game(), ensure_ascii=False))
+    main.reap_game()
+    with open(tmp_path / GAME_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "saved_at": time.time(), "state": seeded}, f, ensure_ascii=False)
+
+    async def run():
+        calls = []
+        runner, _ = await start_stub_api(port=STUB_PORT, latency=0, calls=calls)
+        try:
+            first = await run_bot(str(tmp_path), calls)      # بازی وسط نوبت → SIGTERM
+            second = await run_bot(str(tmp_path), calls)     # ری‌استارت → ادامه → دوباره SIGTERM
+            return first, second
+        finally:
+            await runner.cleanup()
+
+    first, second = asyncio.run(run())
+    for state in (first, second):
+        assert state["group_chat_id"] == GROUP
+        assert state["current_turn_seat"] == seeded["current_turn_seat"] == 2
+        assert state["player_slots"] == seeded["player_slots"]
+        assert state["roles"] == seeded["roles"] and state["roles"]["10"] == "مافیا"
+        assert state["removed_players"] == seeded["removed_players"]
+        assert state["turns"]["challenges"] == seeded["turns"]["challenges"]
+        assert state["turns"]["pos"] == seeded["turns"]["pos"]
+    # زمان نوبت در هر اجرا کم شده (تایمر از زمان باقیمانده ادامه داده، نه از اول)
+    assert 0 < second["turn_remaining"] < first["turn_remaining"] < seeded["turn_remaining"]
@@ -0,0 +1,78 @@
+# test_nicknames_manager.py
+# --------------------------------------------------------
+# تست NicknameManager روی SQLite (sqlite:///tmp_path/...)
+# - upsert با on_conflict_do_update و set_many گروهی
+# - circuit breaker: قطع دیتابیس → صف pending → وصل دوباره → flush یکجا
+#   python -m pytest -q test_nicknames_manager.py
+# --------------------------------------------------------
+
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import nicknames_manager
+from nicknames_manager import NicknameManager, RETRY_MIN
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / "nicknames.db"
+    monkeypatch.setattr(nicknames_manager, "DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setattr(nicknames_manager, "engine", None)
+    monkeypatch.setattr(nicknames_manager, "SessionLocal", None)
+    yield path
+    if nicknames_manager.engine is not None:
+        nicknames_manager.engine.dispose()
+
+
+def rows(path):
+    """محتوای جدول مستقیم از فایل (بدون کش manager)"""
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT user_id, nickname FROM nicknames"))
+
+
+def test_upsert_updates_existing_row(db):
+    nm = NicknameManager()
+    assert nm.connect()
+    assert nm.set(1, "علی")
+    assert nm.set(1, "علی‌رضا")              # همان کلید → UPDATE نه خطای unique
+    assert rows(db) == {1: "علی‌رضا"}
+    assert NicknameManager().get(1) == "علی‌رضا"   # manager تازه از دیتابیس می‌خواند
+
+
+def test_set_many_upserts_and_deletes_in_one_call(db):
+    nm = NicknameManager()
+    assert nm.set_many({1: "a", 2: "b"})
+    assert nm.set_many({2: "B", 3: "c", 1: None})     # به‌روزرسانی + درج + حذف
+    assert rows(db) == {2: "B", 3: "c"}
+    assert NicknameManager().all() == {2: "B", 3: "c"}
+    assert nm.delete(3) and not nm.delete(3)
+    assert rows(db) == {2: "B"}
+
+
+def test_breaker_queues_while_open_and_flushes_on_recovery(db, monkeypatch):
+    nm = NicknameManager()
+    assert nm.set(1, "a")
+    working = nicknames_manager.SessionLocal
+
+    def down():
+        raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+    # دیتابیس قطع: مدار باز، تغییرات در کش و pending
+    monkeypatch.setattr(nicknames_manager, "SessionLocal", down)
+    assert not nm.set(2, "b")
+    assert not nm.db_ready
+    assert nm._retry_delay == RETRY_MIN * 2
+    assert not nm.set_many({3: "c", 1: None})
+    assert nm.get(2) == "b" and nm.get(1) is None
+    assert nm._pending == {2: "b", 3: "c", 1: None}
+    assert rows(db) == {1: "a"}
+
+    # وصل دوباره بعد از مهلت: همهٔ pendingها با یک set_many ذخیره می‌شوند
+    monkeypatch.setattr(nicknames_manager, "SessionLocal", working)
+    nm._retry_at = 0
+    assert nm.db_ready
+    assert nm._pending == {}
+    assert nm._retry_delay == RETRY_MIN
+    assert rows(db) == {2: "b", 3: "c"}
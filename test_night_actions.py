@@ -0,0 +1,145 @@
+# test_night_actions.py
+# --------------------------------------------------------
+# تست NightEngine: کامل شدن با جواب، مهلت، لغو، خلاصهٔ block/save
+# و جوابی که وسط ارسال خلاصهٔ شب بازی دیگر می‌رسد
+#   python -m pytest -q test_night_actions.py
+# --------------------------------------------------------
+
+import time
+import asyncio
+from types import SimpleNamespace
+
+from night_actions import NightEngine, NightActor, ANSWERED, SKIPPED, TIMED_OUT, UNREACHABLE
+
+
+def action(kind, order, timeout=5):
+    return SimpleNamespace(kind=kind, order=order, timeout=timeout)
+
+
+def actors(game_id, *kinds, timeout=5):
+    return [NightActor(seat, game_id * 100 + seat, kind, action(kind, seat * 10, timeout))
+            for seat, kind in enumerate(kinds, 1)]
+
+
+def make_engine(done, unreachable=(), on_complete=None):
+    async def send(uid, text, kb):
+        return uid not in unreachable
+
+    async def record(night):
+        done.append((night.game_id, time.monotonic(), night.summary()))
+
+    return NightEngine(send, keyboard=lambda g, a: None, on_complete=on_complete or record)
+
+
+async def wait_for_done(done, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while len(done) < count and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_completes_when_everyone_answers():
+    done = []
+
+    async def run():
+        engine = make_engine(done, unreachable={103})
+        await engine.start()
+        night = await engine.open(1, actors(1, "shot", "save", "inquiry"))
+        assert night.status[3] == UNREACHABLE
+        assert engine.answer(1, 1, 2)
+        assert not engine.answer(1, 1, 3)            # جواب دوم ثبت نمی‌شود
+        assert engine.answer(1, 2, None)
+        await wait_for_done(done, 1)
+        await engine.stop()
+        return engine
+
+    engine = asyncio.run(run())
+    assert len(done) == 1 and len(engine) == 0
+    rows = done[0][2]
+    assert [(a.seat, status, target) for a, status, target, _ in rows] == [
+        (1, ANSWERED, 2), (2, SKIPPED, None), (3, UNREACHABLE, None)]
+
+
+def test_timeout_settles_the_rest():
+    done = []
+
+    async def run():
+        engine = make_engine(done)
+        await engine.start()
+        await engine.open(1, actors(1, "shot", "save", timeout=0.1))
+        engine.answer(1, 1, 2)
+        start = time.monotonic()
+        await wait_for_done(done, 1)
+        late = engine.answer(1, 2, 1)                # بعد از خلاصه جواب پذیرفته نمی‌شود
+        await engine.stop()
+        return time.monotonic() - start, late
+
+    elapsed, late = asyncio.run(run())
+    assert elapsed < 1 and not late
+    assert [status for _, status, _, _ in done[0][2]] == [ANSWERED, TIMED_OUT]
+
+
+def test_cancel_drops_night_without_summary():
+    done = []
+
+    async def run():
+        engine = make_engine(done)
+        await engine.start()
+        await engine.open(1, actors(1, "shot", timeout=0.05))
+        assert engine.cancel(1) is not None
+        assert not engine.answer(1, 1, 2)
+        await asyncio.sleep(0.2)                     # مهلت در heap بی‌اثر سررسید می‌شود
+        await engine.stop()
+        return engine
+
+    engine = asyncio.run(run())
+    assert done == [] and len(engine) == 0
+
+
+def test_summary_applies_block_and_save():
+    done = []
+
+    async def run():
+        engine = make_engine(done)
+        await engine.start()
+        # ترتیب اجرا: block(10) → shot(20) → shot(30) → save(40)
+        await engine.open(1, actors(1, "block", "shot", "shot", "save"))
+        engine.answer(1, 1, 2)                       # شلیک صندلی ۲ بسته شد
+        engine.answer(1, 2, 4)
+        engine.answer(1, 3, 1)                       # شلیک به صندلی ۱ که نجات داده می‌شود
+        engine.answer(1, 4, 1)
+        await wait_for_done(done, 1)
+        await engine.stop()
+
+    asyncio.run(run())
+    notes = {actor.seat: note for actor, _, _, note in done[0][2]}
+    assert notes == {1: None, 2: "blocked", 3: "saved", 4: None}
+
+
+def test_answer_during_summary_is_not_lost():
+    """جواب آخر بازی B وقتی تسک مشغول on_complete بازی A است؛ خلاصهٔ B نباید تا مهلتش عقب بیفتد"""
+    done = []
+
+    async def run():
+        in_summary = asyncio.Event()
+
+        async def slow_summary(night):
+            if night.game_id == 1:
+                in_summary.set()
+                await asyncio.sleep(0.1)
+            done.append((night.game_id, time.monotonic(), night.summary()))
+
+        engine = make_engine(done, on_complete=slow_summary)
+        await engine.start()
+        await engine.open(1, actors(1, "shot", timeout=10))
+        await engine.open(2, actors(2, "shot", timeout=10))
+        engine.answer(1, 1, 1)
+        await in_summary.wait()
+        answered = time.monotonic()
+        engine.answer(2, 1, 1)                       # وسط await on_complete بازی ۱
+        await wait_for_done(done, 2)
+        await engine.stop()
+        return answered
+
+    answered = asyncio.run(run())
+    assert [g for g, _, _ in done] == [1, 2]
+    assert done[1][1] - answered < 1
@@ -0,0 +1,83 @@
+# test_scenario_registry.py
+# --------------------------------------------------------
+# تست ScenarioRegistry: حفظ سناریوهای ردشده، hot reload و اقدام تیمی شب
+#   python -m pytest -q test_scenario_registry.py
+# --------------------------------------------------------
+
+import os
+import json
+import time
+import asyncio
+
+import storage
+from scenario_registry import ScenarioRegistry, Scenario, NightRole
+
+VALID = {"roles": ["مافیا", "شهروند", "شهروند"], "min_players": 3}
+BROKEN = {"roles": [], "note": "نیمه‌کاره"}
+
+
+def write(path, data, bump=0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    if bump:
+        ts = time.time_ns() + bump
+        os.utime(path, ns=(ts, ts))
+
+
+def test_save_keeps_rejected_entries(tmp_path):
+    path = str(tmp_path / "scenarios.json")
+    write(path, {"کلاسیک": VALID, "خراب": BROKEN})
+    registry = ScenarioRegistry(path)
+    assert list(registry) == ["کلاسیک"]
+
+    registry.add("جدید", ["مافیا", "شهروند"], 2)
+    storage.flush()
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["خراب"] == BROKEN
+    assert set(saved) == {"کلاسیک", "جدید", "خراب"}
+
+
+def test_refresh_reloads_changed_file(tmp_path):
+    path = str(tmp_path / "scenarios.json")
+    write(path, {"کلاسیک": VALID})
+    registry = ScenarioRegistry(path)
+
+    async def run():
+        write(path, {"ویژه": VALID}, bump=10 ** 9)
+        registry._next_check = 0
+        await registry.refresh()
+
+    asyncio.run(run())
+    assert list(registry) == ["ویژه"]
+
+
+def test_mafia_shot_is_a_single_team_shot():
+    scen = Scenario.build("تیمی", {"roles": ["مافیا", "پدرخوانده", "مافیا", "دکتر", "لئون"]})
+    assert scen.night_action("مافیا").shared
+    assert scen.night_action("پدرخوانده").shared
+    assert not scen.night_action("لئون").shared      # شلیک مستقل شهروند
+    # پدرخوانده (نقش یکتا) رهبر است؛ بدون او مافیای ساده با صندلی کمتر
+    assert scen.team_leader([(1, "مافیا"), (2, "پدرخوانده"), (3, "مافیا")]) == (2, "پدرخوانده")
+    assert scen.team_leader([(3, "مافیا"), (1, "مافیا")]) == (1, "مافیا")
+    assert scen.team_leader([]) is None
+
+
+def test_shared_night_action_round_trips():
+    raw = {"roles": ["مافیا", "شهروند"], "night_actions": {"مافیا": {"kind": "shot", "order": 5, "shared": False}}}
+    scen = Scenario.build("x", raw)
+    assert scen.night_action("مافیا") == NightRole("shot", 5)
+    assert Scenario.build("x", scen.to_json()) == scen
+
+
+def test_malformed_factions_rejects_only_that_entry(tmp_path):
+    path = str(tmp_path / "scenarios.json")
+    write(path, {
+        "کلاسیک": VALID,
+        "لیستی": dict(VALID, factions=["x"]),
+        "رشته": dict(VALID, factions="mafia"),
+        "تودرتو": dict(VALID, factions={"مافیا": ["mafia"]}),
+    })
+    registry = ScenarioRegistry(path)
+    assert list(registry) == ["کلاسیک"]
+    assert set(registry.to_json()) == {"کلاسیک", "لیستی", "رشته", "تودرتو"}
@@ -0,0 +1,163 @@
+# test_turn_sequence.py
+# --------------------------------------------------------
+# تست خاصیت‌های TurnSequence: مقایسهٔ کامل با یک مدل ساده (لیست + شبیه‌سازی قدم به قدم)
+# - همهٔ دنباله‌های کوتاه عملیات روی ۴ صندلی (تا EXHAUSTIVE_LENGTH عملیات)
+# - دنباله‌های تصادفی بلندتر
+# در هر قدم: نوبت جاری برابر مدل، peek() برابر advance() بعدی، و to_dict/load بدون تغییر
+#   python -m pytest -q test_turn_sequence.py
+#   TURN_SEQUENCE_EXHAUSTIVE=4 python -m pytest -q test_turn_sequence.py   # کامل (~۱ دقیقه)
+# --------------------------------------------------------
+
+import os
+import random
+import itertools
+
+import pytest
+
+from turn_sequence import TurnSequence, Turn
+
+EXHAUSTIVE_LENGTH = int(os.environ.get("TURN_SEQUENCE_EXHAUSTIVE", 3))
+SEATS = [1, 2, 3, 4]
+ALPHABET = [("advance", None)] + [(op, s) for op in ("after", "pause", "remove", "extra") for s in SEATS]
+
+
+class Model:
+    """پیاده‌سازی سادهٔ مرجع: همه چیز با لیست و کپی"""
+
+    def __init__(self, seats, head):
+        seats = list(dict.fromkeys(seats))
+        i = seats.index(head) if head in seats else 0
+        self.order = seats[i:] + seats[:i]
+        self.idx = 0
+        self.dead = set()
+        self.before = {}    # هدف → لیست چالش‌دهنده‌ها به ترتیب
+        self.after = {}
+        self.extra = []
+        self.resume = False
+        self.main = None
+        self.current = None
+        self._enter()
+
+    def _take(self, queues, seat):
+        q = queues.get(seat, [])
+        while q:
+            c = q.pop(0)
+            if c not in self.dead:
+                return c
+        return None
+
+    def _before(self):
+        c = self._take(self.before, self.main)
+        if c is None:
+            return None
+        self.resume = True
+        self.current = (c, True)
+        return self.current
+
+    def _enter(self):
+        while self.idx < len(self.order) and self.order[self.idx] in self.dead:
+            self.idx += 1
+        if self.idx < len(self.order):
+            self.main = self.order[self.idx]
+        else:
+            self.main = None
+            while self.extra:
+                s = self.extra.pop(0)
+                if s not in self.dead:
+                    self.main = s
+                    break
+        if self.main is None:
+            self.current = None
+            return
+        self.current = (self.main, False)
+        self._before()
+
+    def pause(self, c):
+        self.before.setdefault(self.main, []).append(c)
+        if not self.current[1]:
+            self._before()
+
+    def advance(self):
+        if self.current is None:
+            return None
+        if self.resume:
+            if self._before():
+                return self.current
+            self.resume = False
+            if self.main not in self.dead:
+                self.current = (self.main, False)
+                return self.current
+        c = self._take(self.before, self.main)
+        if c is None:
+            c = self._take(self.after, self.main)
+        if c is not None:
+            self.current = (c, True)
+            return self.current
+        if self.idx < len(self.order):
+            self.idx += 1
+        self._enter()
+        return self.current
+
+
+def check(seats, head, ops):
+    seq, model = TurnSequence(), Model(seats, head)
+    t = seq.start(seats, head)
+    assert (t and (t.seat, t.is_challenge)) == model.current
+    for op, arg in ops:
+        if op == "advance":
+            expected = seq.peek()
+            t = seq.advance()
+            m = model.advance()
+            assert (t and (t.seat, t.is_challenge)) == m, (ops, t, m)
+            assert expected == t, (ops, expected, t)
+        elif op == "after" and seq.main_seat is not None:
+            seq.queue_after(seq.main_seat, arg)
+            model.after.setdefault(model.main, []).append(arg)
+        elif op == "pause" and seq.main_seat is not None:
+            seq.pause_for(arg)
+            model.pause(arg)
+        elif op == "remove":
+            seq.remove(arg)
+            model.dead.add(arg)
+            model.before.pop(arg, None)
+            model.after.pop(arg, None)
+        elif op == "extra":
+            seq.add_extra(arg)
+            model.extra.append(arg)
+        assert (seq.current and (seq.current.seat, seq.current.is_challenge)) == model.current
+        assert len(seq) == len(set(seq._ring) - model.dead)
+        clone = TurnSequence()
+        clone.load(seq.to_dict())
+        assert clone.peek() == seq.peek() and clone.current == seq.current
+
+
+@pytest.mark.parametrize("head", [None, 3])
+def test_matches_model_for_all_short_sequences(head):
+    for length in range(1, EXHAUSTIVE_LENGTH + 1):
+        for ops in itertools.product(ALPHABET, repeat=length):
+            check(SEATS, head, list(ops) + [("advance", None)] * 10)
+
+
+def test_matches_model_for_random_sequences():
+    rnd = random.Random(1)
+    for _ in range(3000):
+        n = rnd.randint(0, 8)
+        seats = rnd.sample(range(1, 13), n)
+        ops = [rnd.choice([("advance", None)] * 4 + [(op, rnd.randint(1, 12))
+                                                    for op in ("after", "pause", "remove", "extra")])
+               for _ in range(rnd.randint(0, 40))]
+        check(seats, rnd.choice(seats) if seats else None, ops + [("advance", None)] * 30)
+
+
+def test_removed_seat_is_skipped_and_revived():
+    seq = TurnSequence(turn_duration=120, challenge_duration=60)
+    assert seq.start([1, 2, 3]) == Turn(1, False, 120)
+    seq.queue_after(1, 3)
+    seq.remove(2)
+    assert seq.order() == [1, 3]
+    assert seq.advance() == Turn(3, True, 60)
+    assert seq.advance() == Turn(3, False, 120)
+    seq.revive(2)
+    seq.add_extra(2)
+    assert seq.advance() == Turn(2, False, 120)
+    assert seq.advance() is None
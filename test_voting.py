@@ -0,0 +1,131 @@
+# test_voting.py
+# --------------------------------------------------------
+# تست Ballot و CoalescedEdit
+#   python -m pytest -q test_voting.py
+# --------------------------------------------------------
+
+import random
+import asyncio
+
+from voting import Ballot, CoalescedEdit, MAX_CHANGES
+
+DELAY = 0.05
+
+
+def test_ballot_properties():
+    # جمع شمارش = تعداد رأی‌دهنده‌ها، سقف تغییر رعایت می‌شود
+    rnd = random.Random(3)
+    for _ in range(2000):
+        b = Ballot(range(1, 11))
+        for _ in range(60):
+            b.cast(rnd.randint(0, 11), rnd.randint(0, 11))
+        assert sum(b.tally) == b.voted
+        assert all(0 <= b.changes_left(v) <= MAX_CHANGES for v in b.seats)
+        assert all(votes == sum(1 for v in b.seats if b.choice(v) == s) for s, votes in b.counts())
+
+
+def test_changes_exhausted():
+    b = Ballot([1, 2, 3, 4])
+    assert b.cast(1, 2) == (True, "recorded")
+    assert b.cast(1, 2) == (False, "unchanged")
+    targets = [3, 4, 2]
+    for target in targets[:MAX_CHANGES]:
+        assert b.cast(1, target) == (True, "updated")
+    assert b.changes_left(1) == 0
+    assert b.cast(1, 3) == (False, "changes_exhausted")
+    assert b.choice(1) == targets[MAX_CHANGES - 1]
+    assert sum(b.tally) == 1
+    assert b.cast(1, 1) == (False, "cannot_vote_self")
+    assert b.cast(9, 1) == (False, "not_a_voter")
+    assert b.cast(2, 9) == (False, "invalid_target")
+
+
+def test_close_returns_results_once():
+    b = Ballot([1, 2, 3])
+    b.cast(1, 3)
+    b.cast(2, 3)
+    assert b.close() == [(1, 0), (2, 0), (3, 2)]
+    assert b.close() is None
+    assert b.cast(3, 1) == (False, "closed")
+    assert b.leaders() == [3]
+
+
+def test_concurrent_touches_coalesce():
+    flushed = []
+
+    async def run():
+        async def flush():
+            await asyncio.sleep(DELAY / 2)
+            flushed.append(edit.touches)
+
+        edit = CoalescedEdit(flush, delay=DELAY)
+
+        async def click(i):
+            await asyncio.sleep(i * 0.001)
+            edit.touch()
+
+        await asyncio.gather(*(click(i) for i in range(20)))
+        await asyncio.sleep(DELAY * 4)
+        return edit
+
+    edit = asyncio.run(run())
+    assert edit.touches == 20
+    assert edit.flushes == len(flushed) == 1
+    assert flushed == [20]     # یک edit با آخرین وضعیت
+
+
+def test_touch_during_flush_schedules_one_more():
+    async def run():
+        async def flush():
+            if edit.flushes == 1:
+                edit.touch()
+                edit.touch()
+            await asyncio.sleep(0)
+
+        edit = CoalescedEdit(flush, delay=DELAY)
+        edit.touch()
+        await asyncio.sleep(DELAY * 5)
+        return edit
+
+    edit = asyncio.run(run())
+    assert edit.touches == 3
+    assert edit.flushes == 2
+
+
+def test_cancel_prevents_flush_after_close():
+    flushed = []
+
+    async def run():
+        async def flush():
+            flushed.append(ballot.counts())
+
+        ballot = Ballot([1, 2])
+        edit = CoalescedEdit(flush, delay=DELAY)
+        ok, _ = ballot.cast(1, 2)
+        assert ok
+        edit.touch()
+        # مثل close_vote: اول cancel، بعد close
+        await edit.cancel()
+        results = ballot.close()
+        await asyncio.sleep(DELAY * 3)
+        return results, edit
+
+    results, edit = asyncio.run(run())
+    assert results == [(1, 0), (2, 1)]
+    assert flushed == []
+    assert edit.flushes == 0
+
+
+def test_flush_error_is_logged_not_raised():
+    async def run():
+        async def flush():
+            raise RuntimeError("message to edit not found")
+
+        edit = CoalescedEdit(flush, delay=0)
+        edit.touch()
+        await asyncio.sleep(0.01)
+        return edit
+
+    edit = asyncio.run(run())
+    assert edit.flushes == 1
+    assert edit._task.done() and edit._task.exception() is None
@@ -0,0 +1,127 @@
+# text_commands.py
+# --------------------------------------------------------
+# نرمال‌سازی متن فارسی + جدول دستورات متنی
+# - یک جدول str.translate از قبل ساخته می‌شود:
+#   ي/ى → ی ، ك → ک ، ة → ه ، أ/إ → ا ، ارقام عربی/فارسی → لاتین،
+#   نیم‌فاصله → فاصله، کاراکترهای صفرعرض/اعراب/کشیده حذف
+# - بعد lower و جمع کردن فاصله‌ها؛ در دستورات "/" پسوند @botname حذف می‌شود
+# - CommandTable: یک dict از «دستور نرمال‌شده → هندلر» به‌جای دهها فیلتر lambda
+# استفاده:
+#   table = CommandTable()
+#   @table.command("صندلی من")
+#   async def my_seat_handler(message): ...
+#   @dp.message_handler(table.filter)
+#   async def dispatch(message, command_handler): await command_handler(message)
+# --------------------------------------------------------
+
+import logging
+
+LOG_TAG = "TextCommands"
+
+_TRANSLATE = {
+    "ي": "ی", "ى": "ی",
+    "ك": "ک",
+    "ة": "ه", "ۀ": "ه",
+    "أ": "ا", "إ": "ا", "ٱ": "ا",
+    "‌": " ",           # نیم‌فاصله (ZWNJ)
+}
+for _i in range(10):
+    _TRANSLATE[chr(0x0660 + _i)] = str(_i)   # ارقام عربی
+    _TRANSLATE[chr(0x06F0 + _i)] = str(_i)   # ارقام فارسی
+for _ch in ("​", "‍", "‎", "‏", "﻿", "ـ"):
+    _TRANSLATE[_ch] = None   # صفرعرض، جهت‌نما، کشیده
+for _code in range(0x064B, 0x0653):
+    _TRANSLATE[chr(_code)] = None            # اعراب (فتحه، کسره، تشدید، ...)
+
+TRANSLATE_TABLE = str.maketrans(_TRANSLATE)
+
+
+def normalize(text):
+    """متن کاربر → شکل استاندارد برای مقایسه با دستورات"""
+    if not text:
+        return ""
+    text = " ".join(text.translate(TRANSLATE_TABLE).lower().split())
+    if text.startswith("/"):
+        # /help@MafiaBot → /help
+        head, sep, rest = text.partition(" ")
+        text = head.split("@", 1)[0] + sep + rest
+    return text
+
+
+class CommandTable:
+    """دستور نرمال‌شده → هندلر"""
+
+    def __init__(self):
+        self._handlers = {}
+        self._chat_types = {}
+        self._reserved = set()    # دستوراتی که جای دیگری هندل می‌شوند (فقط برای شناسایی)
+
+    def command(self, *aliases, chat_types=None):
+        """ثبت هندلر برای یک یا چند شکل دستور؛ chat_types مثلاً ("group", "supergroup")"""
+        def decorator(handler):
+            for alias in aliases:
+                key = normalize(alias)
+                if key in self._handlers:
+                    logging.warning("%s: دستور %r دوباره ثبت شد", LOG_TAG, key)
+                self._handlers[key] = handler
+                if chat_types:
+                    self._chat_types[key] = frozenset(chat_types)
+            return handler
+        return decorator
+
+    def reserve(self, *aliases):
+        self._reserved.update(normalize(a) for a in aliases)
+
+    def __contains__(self, normalized):
+        return normalized in self._handlers or normalized in self._reserved
+
+    def match(self, message):
+        key = normalize(message.text)
+        handler = self._handlers.get(key)
+        if handler is None:
+            return None
+        allowed = self._chat_types.get(key)
+        if allowed is not None and message.chat.type not in allowed:
+            return None
+        return handler
+
+    def filter(self, message):
+        """فیلتر aiogram: dict برگردانده شده به kwargs هندلر اضافه می‌شود"""
+        handler = self.match(message) if message.text else None
+        return {"command_handler": handler} if handler else False
+
+
+# --------------------------------------------------------
+# بنچمارک: نرمال‌سازی + پیدا کردن هندلر برای هر پیام
+#   python text_commands.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import time
+    from types import SimpleNamespace
+
+    names = ["جایگزین", "صندلی من", "لیست صندلی", "نقش من", "لیست بازیکنان",
+             "وضعیت بازی", "خروج", "راهنما", "/help", "/sub"]
+
+    # زنجیرهٔ فعلی: یک lambda برای هر هندلر، به ترتیب ثبت
+    chain = [lambda m, n=n: m.text and m.text.strip() == n for n in names]
+
+    table = CommandTable()
+    for n in names:
+        table.command(n)(lambda m: None)
+
+    chat = SimpleNamespace(type="supergroup")
+    messages = [SimpleNamespace(text=t, chat=chat) for t in (
+        "سلام بچه‌ها امشب کی بازی میکنه؟", "خروج", "صندلي من", "نقش‌ من", "ok", "/help@MafiaBot",
+    )] * 20000
+
+    t = time.perf_counter()
+    hits = sum(1 for m in messages if any(f(m) for f in chain))
+    chain_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    table_hits = sum(1 for m in messages if table.filter(m))
+    table_s = time.perf_counter() - t
+
+    n = len(messages)
+    print(f"lambda chain : {chain_s / n * 1e6:.2f}us/msg  hits={hits}")
+    print(f"command table: {table_s / n * 1e6:.2f}us/msg  hits={table_hits}")
@@ -0,0 +1,231 @@
+# turn_sequence.py
+# --------------------------------------------------------
+# ترتیب نوبت‌های صحبت یک دور
+# - حلقهٔ صندلی‌ها با offset سر صحبت (چرخاندن O(1)، بدون برش لیست)
+# - حذف بازیکن = tombstone (بدون جابه‌جایی لیست؛ در advance رد می‌شود)
+# - چالش‌ها در ChallengeScheduler (heap برای هر صندلی هدف):
+#   «قبل»ها پیش از نوبت اصلی هدف (اگر هدف همین الان صحبت می‌کند: وقفه و بعد نوبت از اول)،
+#   «بعد»ها بعد از نوبت اصلی هدف، هر کدام به ترتیب قبول
+# - نوبت اضافه: بعد از تمام شدن حلقه به ترتیب ثبت
+# advance() در O(1) (سرشکن) نوبت بعدی را برمی‌گرداند یا None یعنی دور تمام شد
+# استفاده:
+#   turns = TurnSequence()
+#   turn = turns.start(sorted(player_slots), head=3)    # Turn(seat=3, ...)
+#   turns.queue_after(5, challenger_seat)                # چالش بعد از صحبت صندلی ۵
+#   turn = turns.pause_for(challenger_seat)              # چالش قبل از صحبت نوبت فعلی
+#   turn = turns.advance()                               # نکست
+# --------------------------------------------------------
+
+from collections import deque
+from typing import NamedTuple
+
+from challenge_scheduler import ChallengeScheduler, BEFORE, AFTER
+
+TURN_DURATION = 120        # ثانیه — نوبت اصلی
+CHALLENGE_DURATION = 60    # ثانیه — نوبت چالش
+
+
+class Turn(NamedTuple):
+    seat: int
+    is_challenge: bool = False
+    duration: int = TURN_DURATION
+
+
+class TurnSequence:
+
+    def __init__(self, turn_duration=TURN_DURATION, challenge_duration=CHALLENGE_DURATION, challenges=None):
+        self.turn_duration = turn_duration
+        self.challenge_duration = challenge_duration
+        self.challenges = challenges if challenges is not None else ChallengeScheduler()
+        self.clear()
+
+    def clear(self):
+        self._ring = []            # صندلی‌ها به ترتیب (بدون چرخش)
+        self._head = 0             # offset سر صحبت در حلقه
+        self._pos = 0              # چندمین خانهٔ حلقه از سر صحبت (== len یعنی حلقه تمام شده)
+        self._dead = set()         # tombstone صندلی‌های حذف شده
+        self._extra = deque()      # نوبت‌های اضافه بعد از پایان حلقه
+        self._main = None          # صندلی‌ای که نوبت اصلی‌اش در جریان است
+        self._resume = False       # نوبت اصلی _main بعد از چالش‌های «قبل» (دوباره) شروع شود
+        self.current = None        # Turn جاری
+        self.challenges.clear()
+
+    # -------------------------
+    # شروع دور
+    # -------------------------
+    def start(self, seats, head=None):
+        """حلقهٔ جدید؛ head (اگر در seats باشد) اولین نفر است. خروجی: Turn اول یا None"""
+        self.clear()
+        self._ring = list(dict.fromkeys(seats))
+        if head in self._ring:
+            self._head = self._ring.index(head)
+        return self.restart()
+
+    def restart(self):
+        """از سر صحبت همان حلقه دوباره شروع کن (tombstoneها می‌مانند)"""
+        self._pos = 0
+        self.challenges.clear()
+        self._extra.clear()
+        self._resume = False
+        self._skip_dead()
+        return self._enter_main()
+
+    # -------------------------
+    # تغییرات وسط دور
+    # -------------------------
+    def queue_after(self, seat, challenger):
+        """چالش «بعد از صحبت»: challenger بعد از نوبت اصلی seat صحبت می‌کند"""
+        self.challenges.push(seat, challenger, AFTER)
+
+    def pause_for(self, challenger):
+        """چالش «قبل از صحبت» برای نوبت اصلی جاری؛ Turn چالش اگر همین حالا شروع می‌شود،
+        None اگر چالش دیگری در جریان است (در صف می‌ماند)"""
+        if self._main is None:
+            return None
+        self.challenges.push(self._main, challenger, BEFORE)
+        return self.interrupt()
+
+    def interrupt(self):
+        """اگر نوبت اصلی در جریان است و چالش «قبل» در صف دارد: وقفه و شروع چالش"""
+        if self.current is None or self.current.is_challenge:
+            return None
+        return self._next_before()
+
+    def add_extra(self, seat):
+        self._extra.append(seat)
+
+    def remove(self, seat):
+        self._dead.add(seat)
+        self.challenges.drop(seat)
+
+    def revive(self, seat):
+        self._dead.discard(seat)
+
+    # -------------------------
+    # نکست
+    # -------------------------
+    def advance(self):
+        if self.current is None:
+            return None
+        if self._resume:
+            turn = self._next_before()
+            if turn is not None:
+                return turn
+            self._resume = False
+            if self._main not in self._dead:
+                self.current = Turn(self._main, False, self.turn_duration)
+                return self.current
+        nxt = self.challenges.pop(self._main, skip=self._dead)
+        if nxt is not None:
+            self.current = Turn(nxt[1], True, self.challenge_duration)
+            return self.current
+        if self._pos < len(self._ring):
+            self._pos += 1
+            self._skip_dead()
+        return self._enter_main()
+
+    def peek(self):
+        """Turn بعدی بدون تغییر state (برای آماده کردن پیام از قبل)"""
+        if self.current is None:
+            return None
+        if self._resume:
+            nxt = self.challenges.peek(self._main, BEFORE, skip=self._dead)
+            if nxt is not None:
+                return Turn(nxt[1], True, self.challenge_duration)
+            if self._main not in self._dead:
+                return Turn(self._main, False, self.turn_duration)
+        nxt = self.challenges.peek(self._main, skip=self._dead)
+        if nxt is not None:
+            return Turn(nxt[1], True, self.challenge_duration)
+        n = len(self._ring)
+        pos = self._pos + 1 if self._pos < n else n
+        while pos < n and self._seat_at(pos) in self._dead:
+            pos += 1
+        if pos < n:
+            seat = self._seat_at(pos)
+        else:
+            seat = next((s for s in self._extra if s not in self._dead), None)
+            if seat is None:
+                return None
+        nxt = self.challenges.peek(seat, BEFORE, skip=self._dead)
+        if nxt is not None:
+            return Turn(nxt[1], True, self.challenge_duration)
+        return Turn(seat, False, self.turn_duration)
+
+    # -------------------------
+    # نمایش / آمار
+    # -------------------------
+    def order(self):
+        """صندلی‌های زنده به ترتیب صحبت (از سر صحبت) + نوبت‌های اضافه"""
+        n = len(self._ring)
+        seats = [self._seat_at(i) for i in range(n) if self._seat_at(i) not in self._dead]
+        return seats + [s for s in self._extra if s not in self._dead]
+
+    @property
+    def main_seat(self):
+        return self._main
+
+    def __len__(self):
+        return len(self._ring) - len(self._dead.intersection(self._ring))
+
+    def __bool__(self):
+        return bool(self._ring)
+
+    def to_dict(self):
+        return {
+            "ring": self._ring, "head": self._head, "pos": self._pos,
+            "dead": sorted(self._dead),
+            "challenges": self.challenges.to_dict(),
+            "extra": list(self._extra), "main": self._main, "resume": self._resume,
+            "current": list(self.current) if self.current else None,
+        }
+
+    def load(self, data):
+        self.clear()
+        if not data:
+            return
+        self._ring = list(data.get("ring") or [])
+        self._head = data.get("head", 0)
+        self._pos = data.get("pos", 0)
+        self._dead = set(data.get("dead") or [])
+        self.challenges.load(data.get("challenges"))
+        self._extra = deque(data.get("extra") or [])
+        self._main = data.get("main")
+        self._resume = bool(data.get("resume"))
+        self.current = Turn(*data["current"]) if data.get("current") else None
+
+    # -------------------------
+    # داخلی
+    # -------------------------
+    def _seat_at(self, pos):
+        return self._ring[(self._head + pos) % len(self._ring)]
+
+    def _skip_dead(self):
+        n = len(self._ring)
+        while self._pos < n and self._seat_at(self._pos) in self._dead:
+            self._pos += 1
+
+    def _next_before(self):
+        """چالش «قبل» بعدی نوبت اصلی؛ نوبت اصلی بعد از آن از اول شروع می‌شود"""
+        nxt = self.challenges.pop(self._main, BEFORE, skip=self._dead)
+        if nxt is None:
+            return None
+        self._resume = True
+        self.current = Turn(nxt[1], True, self.challenge_duration)
+        return self.current
+
+    def _enter_main(self):
+        if self._pos < len(self._ring):
+            self._main = self._seat_at(self._pos)
+        else:
+            self._main = None
+            while self._extra:
+                seat = self._extra.popleft()
+                if seat not in self._dead:
+                    self._main = seat
+                    break
+        if self._main is None:
+            self.current = None
+            return None
+        self.current = Turn(self._main, False, self.turn_duration)
+        return self._next_before() or self.current
@@ -0,0 +1,98 @@
+# update_filter.py
+# --------------------------------------------------------
+# فیلتر ارزان قبل از dispatch
+# هر آپدیت قبل از اجرای فیلترهای هندلرها با چند چک O(1) دسته‌بندی می‌شود:
+#   - پیوی                                   → پردازش
+#   - گروهی که بازی در آن نیست (گروه غریبه)   → دور ریخته می‌شود
+#   - گروه بازی وقتی بازی/لابی فعال است       → پردازش (کنترل نوبت همه پیام‌ها را لازم دارد)
+#   - گروه بازی بدون بازی: فقط دستورات شناخته‌شده (متن دقیق یا /...) یا کاربری که در FSM است
+#   - callback: پیوی یا گروه بازی
+# بقیه (گپ معمولی گروه) قبل از رسیدن به هندلرها دور ریخته می‌شود
+# --------------------------------------------------------
+
+import logging
+from collections import Counter
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from text_commands import normalize
+
+LOG_TAG = "UpdateFilter"
+
+REPORT_EVERY = 1000   # هر چند آپدیت دور ریخته یک خط لاگ
+
+
+class UpdateFilter(BaseMiddleware):
+    """
+    استفاده:
+      dp.middleware.setup(UpdateFilter(
+          known_chat=lambda chat_id: chat_id in (ALLOWED_GROUP_ID, group_chat_id),
+          game_active=lambda: lifecycle.phase is not GamePhase.IDLE,
+          commands=text_table,     # CommandTable یا هر set از متن نرمال‌شده
+      ))
+      update_filter.stats()   # {"handled": ..., "dropped": {...}}
+    """
+
+    def __init__(self, known_chat, game_active, commands=()):
+        super().__init__()
+        self.known_chat = known_chat
+        self.game_active = game_active
+        self.commands = commands   # هر container از متن نرمال‌شده (مثلاً CommandTable)
+        self.handled = 0
+        self.dropped = Counter()
+
+    # -------------------------
+    # دسته‌بندی
+    # -------------------------
+    async def classify_message(self, message: types.Message):
+        """None یعنی پردازش شود؛ در غیر این صورت دلیل دور ریختن"""
+        if message.chat.type == "private":
+            return None
+        if not self.known_chat(message.chat.id):
+            return "foreign_chat"
+        if self.game_active():
+            return None
+        text = message.text
+        if text:
+            text = normalize(text)
+            if text.startswith("/") or text in self.commands:
+                return None
+        # کاربری که وسط یک گفتگوی FSM است (مثلاً افزودن سناریو)
+        state = await self.manager.dispatcher.storage.get_state(chat=message.chat.id,
+                                                                user=message.from_user.id)
+        if state is not None:
+            return None
+        return "chatter"
+
+    def classify_callback(self, callback: types.CallbackQuery):
+        message = callback.message
+        if message is None or message.chat.type == "private":
+            return None
+        if not self.known_chat(message.chat.id):
+            return "foreign_chat"
+        return None
+
+    # -------------------------
+    # middleware
+    # -------------------------
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if update.message is not None:
+            reason = await self.classify_message(update.message)
+        elif update.callback_query is not None:
+            reason = self.classify_callback(update.callback_query)
+        else:
+            reason = None
+
+        if reason is None:
+            self.handled += 1
+            return
+        self.dropped[reason] += 1
+        total = sum(self.dropped.values())
+        if total % REPORT_EVERY == 0:
+            logging.info("%s: %s", LOG_TAG, self.stats())
+        raise CancelHandler()
+
+    def stats(self):
+        return {"handled": self.handled, "dropped": dict(self.dropped)}
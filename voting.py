@@ -0,0 +1,189 @@
+# voting.py
+# --------------------------------------------------------
+# رأی‌گیری روز
+# - Ballot: شمارش رأی هر صندلی در یک لیست (اندیس ثابت برای هر صندلی) → ثبت/تغییر رأی O(1)
+#   محدودیت تغییر رأی مثل RatingManager: حداکثر MAX_CHANGES بار بعد از رأی اول
+# - CoalescedEdit: به‌جای یک edit برای هر کلیک، پیام شمارش حداکثر هر DELAY ثانیه
+#   یک بار با آخرین وضعیت ویرایش می‌شود (کلیک‌های همزمان در یک edit جمع می‌شوند)
+# استفاده:
+#   ballot = Ballot(sorted(player_slots))
+#   ok, reason = ballot.cast(voter_seat, target_seat)     # ("recorded" / "updated" / ...)
+#   tally_edit = CoalescedEdit(flush=edit_vote_message)
+#   tally_edit.touch()                                    # بعد از هر رأی موفق
+#   await tally_edit.cancel(); results = ballot.close()   # پایان رأی‌گیری (فقط یک بار)
+# --------------------------------------------------------
+
+import asyncio
+import logging
+
+LOG_TAG = "Voting"
+
+MAX_CHANGES = 3      # تعداد دفعات مجاز تغییر رأی
+EDIT_DELAY = 1.5     # ثانیه — فاصلهٔ ویرایش پیام شمارش
+
+
+class Ballot:
+
+    def __init__(self, seats, max_changes=MAX_CHANGES):
+        self.seats = list(seats)
+        self._index = {seat: i for i, seat in enumerate(self.seats)}
+        self.tally = [0] * len(self.seats)   # تعداد رأی هر صندلی به ترتیب seats
+        self._choice = {}                     # صندلی رأی‌دهنده → صندلی هدف
+        self._changes = {}                    # صندلی رأی‌دهنده → تعداد تغییر
+        self.max_changes = max_changes
+        self.closed = False
+
+    def cast(self, voter, target):
+        """
+        ثبت رأی voter برای target. Returns: (ok:bool, reason:str)
+        reason: recorded / updated / unchanged / changes_exhausted / cannot_vote_self /
+                not_a_voter / invalid_target / closed
+        """
+        if self.closed:
+            return False, "closed"
+        if voter not in self._index:
+            return False, "not_a_voter"
+        idx = self._index.get(target)
+        if idx is None:
+            return False, "invalid_target"
+        if voter == target:
+            return False, "cannot_vote_self"
+
+        previous = self._choice.get(voter)
+        if previous is None:
+            self._choice[voter] = target
+            self.tally[idx] += 1
+            return True, "recorded"
+        if previous == target:
+            return False, "unchanged"
+        if self._changes.get(voter, 0) >= self.max_changes:
+            return False, "changes_exhausted"
+        self._changes[voter] = self._changes.get(voter, 0) + 1
+        self.tally[self._index[previous]] -= 1
+        self.tally[idx] += 1
+        self._choice[voter] = target
+        return True, "updated"
+
+    def choice(self, voter):
+        return self._choice.get(voter)
+
+    def changes_left(self, voter):
+        return self.max_changes - self._changes.get(voter, 0)
+
+    @property
+    def voted(self):
+        return len(self._choice)
+
+    def counts(self):
+        """[(seat, votes)] به ترتیب صندلی"""
+        return list(zip(self.seats, self.tally))
+
+    def leaders(self):
+        """صندلی(های) با بیشترین رأی (خالی اگر هیچ رأیی ثبت نشده)"""
+        top = max(self.tally, default=0)
+        if top == 0:
+            return []
+        return [seat for seat, votes in zip(self.seats, self.tally) if votes == top]
+
+    def close(self):
+        """بستن رأی‌گیری؛ فقط بار اول نتیجه را برمی‌گرداند (بعد None)"""
+        if self.closed:
+            return None
+        self.closed = True
+        return self.counts()
+
+
+class CoalescedEdit:
+    """
+    flush: coroutine function بدون آرگومان که پیام را با آخرین وضعیت ویرایش می‌کند
+    spawn: سازندهٔ تسک (مثلاً lambda coro: supervisor.spawn(game_id, coro, name="vote_tally"))
+    """
+
+    def __init__(self, flush, delay=EDIT_DELAY, spawn=asyncio.ensure_future):
+        self.flush = flush
+        self.delay = delay
+        self.spawn = spawn
+        self._dirty = False
+        self._task = None
+        self.touches = 0
+        self.flushes = 0
+
+    def touch(self):
+        self.touches += 1
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = self.spawn(self._run())
+
+    async def _run(self):
+        # تا وقتی وسط sleep/edit تغییر تازه آمده، یک edit دیگر (نه یکی برای هر کلیک)
+        while self._dirty:
+            await asyncio.sleep(self.delay)
+            self._dirty = False
+            self.flushes += 1
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warning("%s: ویرایش شمارش شکست خورد: %s", LOG_TAG, e)
+
+    async def cancel(self):
+        self._dirty = False
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+# --------------------------------------------------------
+# بنچمارک: ۲۰ رأی‌دهنده همزمان کلیک می‌کنند (edit با ۱۵۰ms تأخیر شبکه)
+# (تست‌ها: test_voting.py)
+#   python voting.py
+# --------------------------------------------------------
+if __name__ == "__main__":
+    import random
+    import time
+
+    LATENCY = 0.15
+    VOTERS = 20
+
+    rnd = random.Random(3)
+
+    async def main():
+        edits = []
+
+        async def edit():
+            await asyncio.sleep(LATENCY)
+            edits.append(time.perf_counter())
+
+        async def click(ballot, voter, on_change):
+            await asyncio.sleep(rnd.random() * 0.05)   # کلیک‌ها در ۵۰ms
+            ok, _ = ballot.cast(voter, rnd.choice([s for s in ballot.seats if s != voter]))
+            if ok:
+                await on_change()
+
+        # یک edit برای هر کلیک
+        ballot = Ballot(range(1, VOTERS + 1))
+        t = time.perf_counter()
+        await asyncio.gather(*(click(ballot, v, edit) for v in ballot.seats))
+        per_click = len(edits), time.perf_counter() - t
+
+        # edit تجمیعی
+        edits.clear()
+        ballot = Ballot(range(1, VOTERS + 1))
+        coalesced = CoalescedEdit(edit, delay=0.3)
+
+        async def touch():
+            coalesced.touch()
+
+        t = time.perf_counter()
+        await asyncio.gather(*(click(ballot, v, touch) for v in ballot.seats))
+        await coalesced._task
+        merged = len(edits), time.perf_counter() - t
+
+        print(f"per-click edits: {per_click[0]:2d} edits, last at {per_click[1] * 1000:.0f}ms")
+        print(f"coalesced      : {merged[0]:2d} edits, last at {merged[1] * 1000:.0f}ms "
+              f"({coalesced.touches} clicks)")
+
+    asyncio.run(main())